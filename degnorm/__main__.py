@@ -4,13 +4,11 @@
 # DegNorm CLI entrypoint for use on a single node with hyperthreading.
 # ---------------------------------------------------------------------------- #
 
-from degnorm.reads import *
-from degnorm.reads_coverage_merge import *
-from degnorm.gene_processing import *
-from degnorm.data_access import *
-from degnorm.nmf import *
-from degnorm.warm_start import *
-from degnorm.report import render_report
+# pipeline stages (and their plotting, reporting and annotation dependencies) are imported
+# when their stage runs, so that --help, --version and warm-start runs start quickly.
+from degnorm.utils import *
+from concurrent.futures import ThreadPoolExecutor
+import shutil
 
 
 def main():
@@ -21,20 +19,32 @@ def main():
     args = parse_args()
     n_jobs = args.proc_per_node
     unique_alignments = not args.non_unique_alignments
+
+    # a dry run only predicts pipeline costs: nothing is written, so no output directory is created.
+    if args.dry_run:
+        from degnorm.dry_run import dry_run
+        configure_logger()
+        dry_run(args)
+        sys.exit(0)
+
     output_dir = create_output_dir(args.output_dir)
     configure_logger(output_dir)
     welcome()
     logging.info('DegNorm output directory -- {0}'.format(output_dir))
 
     # ---------------------------------------------------------------------------- #
-    # If any Bam index (.bai) files need to be created, do that now.
+    # If any Bam index (.bai) files need to be created, start creating them now in worker processes.
+    # Indexing runs in the background while .bam headers and genome annotation data are processed.
     # ---------------------------------------------------------------------------- #
+    index_job = None
     if args.create_bai_files:
-        for file_idx in range(len(args.create_bai_files)):
-            bam_file = args.create_bai_files[file_idx]
-            logging.info('creating index file for {0} -- {1} / {2}'
-                         .format(bam_file, file_idx + 1, len(args.create_bai_files)))
-            out = create_index_file(bam_file)
+        logging.info('creating index files for {0} .bam files:\n\t{1}'
+                     .format(len(args.create_bai_files), '\n\t'.join(args.create_bai_files)))
+        index_pool = ThreadPoolExecutor(max_workers=1)
+        index_job = index_pool.submit(create_index_files
+                                      , args.create_bai_files
+                                      , n_jobs=n_jobs)
+        index_pool.shutdown(wait=False)
 
     # ---------------------------------------------------------------------------- #
     # Path 1: warm-start path.
@@ -42,6 +52,8 @@ def main():
     # genome annotation data, read counts into new output dir.
     # ---------------------------------------------------------------------------- #
     if args.warm_start_dir:
+        from degnorm.warm_start import load_from_previous
+
         logging.info('WARM-START: loading data from previous DegNorm run contained in {0}'
                      .format(args.warm_start_dir))
 
@@ -51,20 +63,24 @@ def main():
         read_count_df = load_dat['read_count_df']
         genes_df = load_dat['genes_df']
         sample_ids = load_dat['sample_ids']
+        cov_stats_df = load_dat['cov_stats_df']
 
     # ---------------------------------------------------------------------------- #
     # Path 2: .bam file preprocessing path.
     # Determine intersection of chromosomes across samples from .bam files
     # ---------------------------------------------------------------------------- #
     else:
+        from degnorm.reads import BamReadsProcessor, bam_header
+        from degnorm.gene_processing import process_annotation, build_exon_index
+        from degnorm.reads_coverage_merge import merge_read_counts, merge_coverage
+
         sample_ids = list()
         chroms = list()
         n_samples = len(args.bam_files)
 
         # load each .bam file's header, find joint intersection of read chromosomes.
         for idx in range(n_samples):
-            header_dat = BamReadsProcessor(args.bam_files[idx]
-                                            , index_file=args.bai_files[idx]).header
+            header_dat = bam_header(args.bam_files[idx])
             new_chroms = header_dat.chr.values.tolist()
 
             if not chroms:
@@ -74,35 +90,21 @@ def main():
                 chroms = np.intersect1d(chroms, new_chroms).tolist()
 
         # ---------------------------------------------------------------------------- #
-        # Load .gtf or .gff files and run processing pipeline.
-        # Run in parallel over chromosomes.
+        # Load .gtf or .gff files and run processing pipeline, or load the results of
+        # processing the same annotation file for the same chromosomes from the annotation cache.
         # ---------------------------------------------------------------------------- #
-        logging.info('Begin genome annotation file processing...')
-        gap = GeneAnnotationProcessor(args.genome_annotation
-                                      , verbose=True
-                                      , chroms=chroms)
-        exon_df = gap.run()
-
-        # take intersection of chromosomes available in genome annotation file and those in the reads data,
-        # if for some reason annotation file only contains subset.
-        chroms = np.intersect1d(chroms, exon_df.chr.unique()).tolist()
-
-        # subset exon (and therefore gene) data based on chromosome set.
-        exon_df = exon_df[exon_df.chr.isin(chroms)]
-        genes_df = exon_df[['chr', 'gene', 'gene_start', 'gene_end']].drop_duplicates().reset_index(drop=True)
-
-        logging.info('Found {0} chromosomes in intersection of all experiments and gene annotation data:\n'
-                     '\t{1}'.format(len(chroms), ', '.join(chroms)))
-
-        # break down gene overlap structures by chromosome, will need to feed it to coverage_read_counts method.
-        logging.info('Determining gene overlap structure across chromosomes.')
-        gene_overlap_dict = dict()
+        annotation_dat = process_annotation(args.genome_annotation
+                                            , chroms=chroms
+                                            , cache_dir=args.annotation_cache_dir)
+        chroms = annotation_dat['chroms']
+        exon_df = annotation_dat['exon_df']
+        genes_df = annotation_dat['genes_df']
+        gene_overlap_dict = annotation_dat['gene_overlap_dict']
+
+        # compute fraction of overlap genes to total genes.
         n_overlap = 0
         n_isolated = 0
         for chrom in chroms:
-            gene_overlap_dict[chrom] = get_gene_overlap_structure(subset_to_chrom(genes_df
-                                                                                  , chrom=chrom))
-            # compute fraction of overlap genes to total genes.
             if gene_overlap_dict[chrom].get('overlap_genes') is not None:
                 n_overlap += np.sum([len(x) for x in gene_overlap_dict[chrom]['overlap_genes']])
 
@@ -111,10 +113,18 @@ def main():
 
         logging.info('Rate of gene overlap: {0} / {1}'.format(n_overlap, n_isolated + n_overlap))
 
+        # index genes' exon positioning once, for use in coverage and read count computations and coverage merge.
+        exon_index = build_exon_index(exon_df)
+
         # ---------------------------------------------------------------------------- #
         # Load .bam files and parse them into coverage arrays, read counts.
         # ---------------------------------------------------------------------------- #
 
+        # wait for any .bam index files still being created.
+        if index_job is not None:
+            index_job.result()
+            logging.info('Successfully created .bam index files.')
+
         # iterate over .bam files; compute each sample's chromosomes' coverage arrays
         # and save them to .npz files.
         for idx in range(n_samples):
@@ -134,7 +144,8 @@ def main():
             # run simultaneous coverage, read counting procedure on alignment file.
             reader.coverage_read_counts(gene_overlap_dict
                                         , gene_df=genes_df
-                                        , exon_df=exon_df)
+                                        , exon_df=exon_df
+                                        , exon_index=exon_index)
 
         logging.info('Successfully processed chromosome read coverage and gene read counts for all {0} experiments'
                      .format(len(sample_ids)))
@@ -146,21 +157,24 @@ def main():
         # Merge, load per-sample files:
         # 1. obtain read count DataFrame containing X, an n (genes) x p (samples) matrix.
         # 2. per-sample gene coverage matrices,
-        #    and save them back to disk in .pkl files on per-chromosome basis.
+        #    and save them back to disk in indexed .npy files on per-chromosome basis.
         # ---------------------------------------------------------------------------- #
         logging.info('Merging read counts across samples.')
         read_count_df = merge_read_counts(output_dir
                                           , sample_ids=sample_ids
-                                          , chroms=chroms)
+                                          , chroms=chroms
+                                          , gene_df=genes_df)
         logging.info('Read counts merge successful. Read count data shape: {0}'.format(read_count_df.shape))
 
         logging.info('Merging gene coverage arrays across samples and saving results to chromosome directories.')
-        gene_cov_dict = merge_coverage(output_dir
-                                       , sample_ids=sample_ids
-                                       , exon_df=exon_df
-                                       , n_jobs=n_jobs
-                                       , output_dir=output_dir
-                                       , verbose=True)
+        gene_cov_dict, cov_stats_df = merge_coverage(output_dir
+                                                     , sample_ids=sample_ids
+                                                     , exon_df=exon_df
+                                                     , n_jobs=n_jobs
+                                                     , output_dir=output_dir
+                                                     , compact=args.compact_coverage
+                                                     , exon_index=exon_index
+                                                     , verbose=True)
 
         logging.info('Complete coverage merge successful. Number of loaded coverage arrays: {0}'
                      .format(len(gene_cov_dict)))
@@ -216,26 +230,23 @@ def main():
     # Determine for which genes to run DegNorm, and for genes where we will run DegNorm,
     # which transcript regions to filter out prior to running DegNorm.
     logging.info('Determining genes to include in DegNorm coverage curve approximation.')
-    delete_idx = list()
 
-    for i in range(genes_df.shape[0]):
-        gene = genes_df.gene.iloc[i]
+    # align per-gene coverage summary statistics with genes.
+    cov_stats_df = cov_stats_df.set_index('gene').loc[genes_df.gene.values].reset_index()
+    gene_max_cov = cov_stats_df[['max_' + x for x in sample_ids]].values.max(axis=1)
 
-        # extract gene's p x Li coverage matrix.
-        cov_mat = gene_cov_dict[gene]
+    # do not run gene if maximum coverage is < minimum maximum coverage threshold.
+    # do not run gene if downsample rate low enough s.t. take-every > length of gene.
+    keep_gene = (gene_max_cov >= args.minimax_coverage) & (cov_stats_df.length.values > args.downsample_rate)
 
-        # do not run gene if maximum coverage is < minimum maximum coverage threshold.
-        # do not run gene if downsample rate low enough s.t. take-every > length of gene.
-        if (cov_mat.max() < args.minimax_coverage) or (cov_mat.shape[1] <= args.downsample_rate):
-            delete_idx.append(i)
+    # drop genes from coverage, read counts, gene set if coverage was non conformant.
+    if not np.all(keep_gene):
+        for gene in genes_df.gene.values[~keep_gene]:
             del gene_cov_dict[gene]
 
-    # drop genes from read counts, gene set if coverage was non conformant.
-    if delete_idx:
-        read_count_df = read_count_df.drop(delete_idx
-                                           , axis=0).reset_index(drop=True)
-        genes_df = genes_df.drop(delete_idx
-                                 , axis=0).reset_index(drop=True)
+        read_count_df = read_count_df[keep_gene].reset_index(drop=True)
+        genes_df = genes_df[keep_gene].reset_index(drop=True)
+        cov_stats_df = cov_stats_df[keep_gene].reset_index(drop=True)
 
     # quality control.
     if (read_count_df.shape[0] == 0) or (genes_df.empty) or (len(gene_cov_dict) == 0):
@@ -260,14 +271,24 @@ def main():
     if not joblib_folder:
         os.environ['JOBLIB_TEMP_FOLDER'] = output_dir
 
+    from degnorm.nmf import GeneNMFOA
+
     logging.info('Executing NMF-OA over-approximation algorithm...')
     nmfoa = GeneNMFOA(degnorm_iter=args.iter
                       , nmf_iter=args.nmf_iter
                       , downsample_rate=args.downsample_rate
                       , n_jobs=n_jobs
-                      , skip_baseline_selection=args.skip_baseline_selection)
+                      , skip_baseline_selection=args.skip_baseline_selection
+                      , rank_one_solver=args.rank_one_solver
+                      , rank_one_tol=args.rank_one_tol
+                      , nmf_tol=args.nmf_tol
+                      , batch=not args.no_batch_nmf
+                      , backend=args.nmf_backend
+                      , nmf_warm_start=args.nmf_warm_start
+                      , carry_state=args.nmf_carry_state)
     estimates = nmfoa.run(gene_cov_dict
-                          , reads_dat=read_count_df[sample_ids].values.astype(np.float_))
+                          , reads_dat=read_count_df[sample_ids].values.astype(np.float_)
+                          , cov_stats_df=cov_stats_df)
 
     # restore original environment.
     if not joblib_folder:
@@ -292,6 +313,8 @@ def main():
         plot_genes = np.intersect1d(args.plot_genes, nmfoa.genes)
 
         if len(plot_genes) > 0:
+            from degnorm.data_access import get_coverage_plots
+
             logging.info('Generating coverage curve plots for specified genes.')
             out = get_coverage_plots(plot_genes
                                      , degnorm_dir=output_dir
@@ -301,6 +324,8 @@ def main():
     # ---------------------------------------------------------------------------- #
     # Run summary report and exit.
     # ---------------------------------------------------------------------------- #
+    from degnorm.report import render_report
+
     logging.info('Rendering DegNorm summary report.')
     degnorm_dat = {'degnorm_iter': args.iter
                    , 'nmf_iter': args.nmf_iter
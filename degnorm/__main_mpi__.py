@@ -9,14 +9,11 @@ try:
 except ImportError as e:
     raise e
 
-from degnorm.reads import *
-from degnorm.reads_coverage_merge import *
-from degnorm.gene_processing import *
-from degnorm.data_access import *
-from degnorm.nmf_mpi import *
-from degnorm.warm_start import *
-from degnorm.report import render_report
-import sys
+# pipeline stages (and their plotting, reporting and annotation dependencies) are imported
+# when their stage runs, so that --help, --version and warm-start runs start quickly.
+from degnorm.utils import *
+import pickle as pkl
+import shutil
 
 
 COMM = MPI.COMM_WORLD
@@ -58,6 +55,14 @@ def main():
     configure_logger(output_dir=None
                      , mpi=True)
 
+    # a dry run only predicts pipeline costs: master logs them, no output directory is created.
+    if args.dry_run:
+        if RANK == 0:
+            from degnorm.dry_run import dry_run
+            dry_run(args)
+
+        sys.exit(0)
+
     # master welcomes user, sets up output directory.
     if RANK == 0:
         welcome()
@@ -79,14 +84,12 @@ def main():
         bai_file_chunks = split_into_chunks(args.create_bai_files
                                             , n=SIZE)
 
-        # worker creates its .bai files.
+        # worker creates its .bai files, concurrently across its processes.
         if RANK < len(bai_file_chunks):
             my_bai_files = bai_file_chunks[RANK]
-
-            for file_idx in range(len(my_bai_files)):
-                bam_file = my_bai_files[file_idx]
-                mpi_logging_info('creating index file for {0}'.format(bam_file))
-                out = create_index_file(bam_file)
+            mpi_logging_info('creating index files for {0}'.format(', '.join(my_bai_files)))
+            out = create_index_files(my_bai_files
+                                     , n_jobs=n_jobs)
 
         # have everyone wait up until .bai files are created.
         COMM.Barrier()
@@ -97,6 +100,7 @@ def main():
     # genome annotation data, read counts into new output dir.
     # ---------------------------------------------------------------------------- #
     if args.warm_start_dir:
+        from degnorm.warm_start import load_from_previous
 
         # only master needs genes, reads, and coverage matrix dictionary.
         if RANK == 0:
@@ -108,6 +112,7 @@ def main():
             read_count_df = load_dat['read_count_df']
             genes_df = load_dat['genes_df']
             sample_ids = load_dat['sample_ids']
+            cov_stats_df = load_dat['cov_stats_df']
 
         else:
             sample_ids = None
@@ -120,6 +125,11 @@ def main():
     # Determine intersection of chromosomes across samples from .bam files
     # ---------------------------------------------------------------------------- #
     else:
+        from degnorm.reads import BamReadsProcessor, bam_header
+        from degnorm.gene_processing import GeneAnnotationProcessor, get_gene_overlap_structure, build_exon_index, \
+            annotation_cache_file, load_annotation_cache, save_annotation_cache
+        from degnorm.reads_coverage_merge import merge_read_counts, merge_coverage
+
         n_samples = len(args.bam_files)
 
         # Have master node assess chromosomes to be included in DegNorm pipeline run.
@@ -128,8 +138,7 @@ def main():
 
             # load each .bam file's header, find joint intersection of read chromosomes.
             for idx in range(n_samples):
-                header_dat = BamReadsProcessor(args.bam_files[idx]
-                                                , index_file=args.bai_files[idx]).header
+                header_dat = bam_header(args.bam_files[idx])
                 new_chroms = header_dat.chr.values.tolist()
 
                 if not chroms:
@@ -145,65 +154,94 @@ def main():
         chroms = COMM.bcast(chroms, root=0)
 
         # ---------------------------------------------------------------------------- #
-        # Load .gtf or .gff files and run processing pipeline.
-        # Run in parallel on the master node over chromosomes.
+        # Load .gtf or .gff files and run processing pipeline, or load the results of
+        # processing the same annotation file for the same chromosomes from the annotation cache.
         # (master does this)
         # ---------------------------------------------------------------------------- #
         if RANK == 0:
-            mpi_logging_info('Begin genome annotation file processing...')
-            gap = GeneAnnotationProcessor(args.genome_annotation
-                                          , verbose=True
-                                          , chroms=chroms)
-            exon_df = gap.run()
-
-            # take intersection of chromosomes available in genome annotation file and those in the reads data,
-            # if for some reason annotation file only contains subset.
-            chroms = np.intersect1d(chroms, exon_df.chr.unique()).tolist()
-            exon_df = exon_df[exon_df.chr.isin(chroms)]
-            genes_df = exon_df[['chr', 'gene', 'gene_start', 'gene_end']].drop_duplicates().reset_index(drop=True)
+            annotation_dat = None
+            if args.annotation_cache_dir:
+                cache_file = annotation_cache_file(args.genome_annotation
+                                                   , chroms=chroms
+                                                   , cache_dir=args.annotation_cache_dir)
+                annotation_dat = load_annotation_cache(cache_file)
+
+            if annotation_dat:
+                mpi_logging_info('Loaded processed genome annotation data and gene overlap structure from cache {0}'
+                                 .format(cache_file))
+                chroms = annotation_dat['chroms']
+                exon_df = annotation_dat['exon_df']
+                genes_df = annotation_dat['genes_df']
+
+            else:
+                mpi_logging_info('Begin genome annotation file processing...')
+                gap = GeneAnnotationProcessor(args.genome_annotation
+                                              , verbose=True
+                                              , chroms=chroms)
+                exon_df = gap.run()
+
+                # take intersection of chromosomes available in genome annotation file and those in the reads data,
+                # if for some reason annotation file only contains subset.
+                chroms = np.intersect1d(chroms, exon_df.chr.unique()).tolist()
+                exon_df = exon_df[exon_df.chr.isin(chroms)]
+                genes_df = exon_df[['chr', 'gene', 'gene_start', 'gene_end']].drop_duplicates().reset_index(drop=True)
 
             mpi_logging_info('Found {0} chromosomes in intersection of all experiments and gene annotation data:\n'
                              '\t{1}'.format(len(chroms), ', '.join(chroms)))
 
         else:
+            annotation_dat = None
             chroms = None
             exon_df = None
             genes_df = None
 
-        # Broadcast the potentially updated set of chromosomes of interest, exons, and genes.
+        # Broadcast the potentially updated set of chromosomes of interest, exons, and genes,
+        # and whether gene overlap structures were loaded from the annotation cache.
         chroms = COMM.bcast(chroms, root=0)
         exon_df = COMM.bcast(exon_df, root=0)
         genes_df = COMM.bcast(genes_df, root=0)
+        annotation_cached = COMM.bcast(bool(annotation_dat), root=0)
 
         # ---------------------------------------------------------------------------- #
         # For each chromosome, find groups of mutually overlapping genes and
         # groups of non-overlapping genes (isolates). Every worker will need
         # every chromosome's overlap structure to run BamReadsProcessor.coverage_read_counts method.
         # ---------------------------------------------------------------------------- #
-        if RANK == 0:
-            mpi_logging_info('Determining gene overlap structure for all {0} chromosomes'.format(len(chroms)))
+        if annotation_cached:
+            gene_overlap_dict = annotation_dat['gene_overlap_dict'] if RANK == 0 else None
 
-        # divvy up chromosomes across workers for gene overlap structure work.
-        my_chroms = split_into_chunks(chroms
-                                      , n=SIZE)
+        else:
+            if RANK == 0:
+                mpi_logging_info('Determining gene overlap structure for all {0} chromosomes'.format(len(chroms)))
 
-        # storage for each worker's chromosome/gene overlap structure data
-        gene_overlap_dict = dict()
+            # divvy up chromosomes across workers for gene overlap structure work.
+            my_chroms = split_into_chunks(chroms
+                                          , n=SIZE)
 
-        # distributed processing of alignment files
-        if RANK < len(my_chroms):
-            for chrom in my_chroms[RANK]:
-                gene_overlap_dict[chrom] = get_gene_overlap_structure(subset_to_chrom(genes_df
-                                                                                      , chrom=chrom))
+            # storage for each worker's chromosome/gene overlap structure data
+            gene_overlap_dict = dict()
 
-        # everyone sends their gene overlap structure data to master.
-        gene_overlap_dict = COMM.gather(gene_overlap_dict, root=0)
+            # distributed processing of alignment files
+            if RANK < len(my_chroms):
+                for chrom in my_chroms[RANK]:
+                    gene_overlap_dict[chrom] = get_gene_overlap_structure(subset_to_chrom(genes_df
+                                                                                          , chrom=chrom))
 
-        # master concatenates chromosome gene overlap structures, sends back out to workers.
-        if RANK == 0:
+            # everyone sends their gene overlap structure data to master.
+            gene_overlap_dict = COMM.gather(gene_overlap_dict, root=0)
+
+            # master collapses list of gene overlap structure dictionaries into one dictionary, caches it.
+            if RANK == 0:
+                gene_overlap_dict = {k: v for d in gene_overlap_dict for k, v in d.items()}
 
-            # collapse list of gene overlap structure dictionaries into one dictionary.
-            gene_overlap_dict = {k: v for d in gene_overlap_dict for k, v in d.items()}
+                if args.annotation_cache_dir:
+                    save_annotation_cache(cache_file
+                                          , annotation_dat={'chroms': chroms
+                                                            , 'exon_df': exon_df
+                                                            , 'genes_df': genes_df
+                                                            , 'gene_overlap_dict': gene_overlap_dict})
+
+        if RANK == 0:
 
             # display rate of gene overlap.
             n_overlap = 0
@@ -220,6 +258,10 @@ def main():
         # master broadcasts out gene overlap structure dictionary to all workers.
         gene_overlap_dict = COMM.bcast(gene_overlap_dict, root=0)
 
+        # everyone indexes genes' exon positioning once, for use in coverage and read count computations
+        # and coverage merge.
+        exon_index = build_exon_index(exon_df)
+
         # make sure everyone is caught up and has gene_overlap_dict.
         COMM.Barrier()
 
@@ -256,7 +298,8 @@ def main():
                 # run simultaneous coverage, read counting procedure on alignment file.
                 reader.coverage_read_counts(gene_overlap_dict
                                             , gene_df=genes_df
-                                            , exon_df=exon_df)
+                                            , exon_df=exon_df
+                                            , exon_index=exon_index)
 
                 del reader
                 gc.collect()
@@ -280,16 +323,19 @@ def main():
             mpi_logging_info('Merging read counts across samples.')
             read_count_df = merge_read_counts(output_dir
                                               , sample_ids=sample_ids
-                                              , chroms=chroms)
+                                              , chroms=chroms
+                                              , gene_df=genes_df)
             mpi_logging_info('Read counts merge successful. Read count data shape: {0}'.format(read_count_df.shape))
 
             mpi_logging_info('Merging gene coverage arrays across samples and saving results to chromosome directories.')
-            gene_cov_dict = merge_coverage(output_dir
-                                           , sample_ids=sample_ids
-                                           , exon_df=exon_df
-                                           , n_jobs=n_jobs
-                                           , output_dir=output_dir
-                                           , verbose=True)
+            gene_cov_dict, cov_stats_df = merge_coverage(output_dir
+                                                         , sample_ids=sample_ids
+                                                         , exon_df=exon_df
+                                                         , n_jobs=n_jobs
+                                                         , output_dir=output_dir
+                                                         , compact=args.compact_coverage
+                                                         , exon_index=exon_index
+                                                         , verbose=True)
 
             mpi_logging_info('Coverage merge successful. Number of loaded coverage matrices: {0}'
                              .format(len(gene_cov_dict)))
@@ -359,30 +405,26 @@ def main():
         # Determine for which genes to run DegNorm, and for genes where we will run DegNorm,
         # which transcript regions to filter out prior to running DegNorm.
         mpi_logging_info('Determining genes to include in DegNorm coverage curve approximation.')
-        delete_idx = list()
-
-        for i in range(genes_df.shape[0]):
-            gene = genes_df.gene.iloc[i]
 
-            # extract gene's p x Li coverage matrix. We got chrom_gene_cov_dict from prior gather.
-            cov_mat = gene_cov_dict[gene]
+        # align per-gene coverage summary statistics with genes.
+        cov_stats_df = cov_stats_df.set_index('gene').loc[genes_df.gene.values].reset_index()
+        gene_max_cov = cov_stats_df[['max_' + x for x in sample_ids]].values.max(axis=1)
+        gene_len = cov_stats_df.length.values
 
-            # do not add gene if maximum coverage is < minimum maximum coverage threshold.
-            # do not add gene if it's unreasonably long, i.e. > 9 megabases.
-            # do not add gene if downsample rate low enough s.t. take-every > length of gene.
-            # do not add gene if max coverage is unreasonable, i.e. > 2^31.
-            if (cov_mat.max() < args.minimax_coverage) or (cov_mat.shape[1] > 9e6) \
-                    or (cov_mat.shape[1] <= args.downsample_rate) \
-                    or (cov_mat.max() > 2147483647):
+        # do not add gene if maximum coverage is < minimum maximum coverage threshold.
+        # do not add gene if it's unreasonably long, i.e. > 9 megabases.
+        # do not add gene if downsample rate low enough s.t. take-every > length of gene.
+        # do not add gene if max coverage is unreasonable, i.e. > 2^31.
+        keep_gene = (gene_max_cov >= args.minimax_coverage) & (gene_len <= 9e6) \
+            & (gene_len > args.downsample_rate) & (gene_max_cov <= 2147483647)
 
-                delete_idx.append(i)
+        if not np.all(keep_gene):
+            for gene in genes_df.gene.values[~keep_gene]:
                 del gene_cov_dict[gene]
 
-        if delete_idx:
-            read_count_df = read_count_df.drop(delete_idx
-                                               , axis=0).reset_index(drop=True)
-            genes_df = genes_df.drop(delete_idx
-                                     , axis=0).reset_index(drop=True)
+            read_count_df = read_count_df[keep_gene].reset_index(drop=True)
+            genes_df = genes_df[keep_gene].reset_index(drop=True)
+            cov_stats_df = cov_stats_df[keep_gene].reset_index(drop=True)
 
         # quality control.
         if (read_count_df.shape[0] == 0) or (genes_df.empty) or (len(gene_cov_dict) == 0):
@@ -403,6 +445,7 @@ def main():
 
     else:
         read_count_df = None
+        cov_stats_df = None
 
     # master broadcasts read counts out to all workers.
     read_count_df = COMM.bcast(read_count_df, root=0)
@@ -421,6 +464,8 @@ def main():
     # ---------------------------------------------------------------------------- #
     # Run NMF-OA.
     # ---------------------------------------------------------------------------- #
+    from degnorm.nmf_mpi import run_gene_nmfoa_mpi, save_results
+
     if RANK == 0:
         # master deletes the saved coverage data that everyone has loaded by now.
         os.remove(os.path.join(output_dir, 'TMP_gene_cov_dict.pkl'))
@@ -433,7 +478,12 @@ def main():
                                       , nmf_iter=args.nmf_iter
                                       , downsample_rate=args.downsample_rate
                                       , n_jobs=n_jobs
-                                      , skip_baseline_selection=args.skip_baseline_selection)
+                                      , skip_baseline_selection=args.skip_baseline_selection
+                                      , cov_stats_df=cov_stats_df
+                                      , rank_one_solver=args.rank_one_solver
+                                      , rank_one_tol=args.rank_one_tol
+                                      , nmf_tol=args.nmf_tol
+                                      , nmf_warm_start=args.nmf_warm_start)
 
     # drop large data objects we don't need anymore.
     del gene_cov_dict, read_count_df
@@ -452,6 +502,7 @@ def main():
                      , rho=nmfoa_output['rho']
                      , x_adj=nmfoa_output['x_adj']
                      , ran_baseline_selection=nmfoa_output['ran_baseline_selection']
+                     , nmf_iterations=nmfoa_output['nmf_iterations']
                      , sample_ids=sample_ids
                      , output_dir=output_dir)
 
@@ -481,6 +532,8 @@ def main():
     # Generate coverage curve plots in parallel (only if --plot-genes specified)
     # ---------------------------------------------------------------------------- #
     if plot_genes[0] is not None:
+        from degnorm.data_access import get_coverage_plots
+
         mpi_logging_info('Generating visualizations for --plot-genes')
         out = get_coverage_plots(plot_genes
                                  , degnorm_dir=output_dir
@@ -491,6 +544,8 @@ def main():
     # Run summary report and exit.
     # ---------------------------------------------------------------------------- #
     if RANK == 0:
+        from degnorm.report import render_report
+
         mpi_logging_info('Rendering DegNorm summary report.')
         degnorm_dat = {'degnorm_iter': args.iter
                        , 'nmf_iter': args.nmf_iter
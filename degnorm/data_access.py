@@ -1,9 +1,10 @@
 from degnorm.visualizations import *
+from degnorm.utils import coverage_array_files, load_coverage_arrays
+from degnorm.gene_processing import build_exon_index
 import pickle as pkl
 import gc
 import tqdm
 from pandas import DataFrame
-plt.rcParams.update({'figure.max_open_warning': 0})
 
 
 class CoverageLoader(object):
@@ -17,6 +18,8 @@ class CoverageLoader(object):
         self.chroms = None
         self.sample_ids = None
         self.exon_df = None
+        self.exon_index = None
+        self.gene_chroms = None
         self.cov_dict = dict()
 
         # check that DegNorm dir exists.
@@ -75,15 +78,27 @@ class CoverageLoader(object):
             # subset exon data to requested genes.
             self.exon_df = self.exon_df[self.exon_df.gene.isin(self.genes)]
 
+        # index requested genes' exon positioning and chromosomes.
+        self.exon_index = build_exon_index(self.exon_df)
+        self.gene_chroms = dict(zip(self.exon_df.gene, self.exon_df.chr))
+
         # iterate over unique chromosomes corresponding to genes requested.
         for chrom in self.exon_df.chr.unique():
 
-            raw_file = os.path.join(self.data_dir, str(chrom), 'coverage_matrices_{0}.pkl'.format(chrom))
+            raw_stem = os.path.join(self.data_dir, str(chrom), 'coverage_matrices_{0}'.format(chrom))
             ests_file = os.path.join(self.data_dir, str(chrom), 'estimated_coverage_matrices_{0}.pkl'.format(chrom))
 
             # load the payload: gene dictionaries with coverage curve numpy arrays.
-            with open(raw_file, 'rb') as raw, open(ests_file, 'rb') as est:
-                raw_dat = pkl.load(raw)
+            # Raw coverage is memory-mapped, so only requested genes' coverage is read from disk.
+            # Fall back to the .pkl raw coverage format of older DegNorm runs.
+            if os.path.isfile(coverage_array_files(raw_stem)[1]):
+                raw_dat = load_coverage_arrays(raw_stem
+                                               , mmap_mode='r')
+            else:
+                with open(raw_stem + '.pkl', 'rb') as raw:
+                    raw_dat = pkl.load(raw)
+
+            with open(ests_file, 'rb') as est:
                 est_dat = pkl.load(est)
 
             # cast gene keys of dictionaries to uppercase.
@@ -91,7 +106,7 @@ class CoverageLoader(object):
             est_dat = {k.upper(): v for k, v in est_dat.items()}
 
             # determine genes in this chromosome.
-            chrom_genes = self.exon_df[self.exon_df.chr == chrom].gene.unique()
+            chrom_genes = self.exon_index[chrom].genes
 
             # if gene is available in both raw + estimated coverage, append those matrices.
             for gene in chrom_genes:
@@ -100,7 +115,7 @@ class CoverageLoader(object):
 
                 if (raw_cov is not None) and (est_cov is not None):
                     self.cov_dict[gene] = dict()
-                    self.cov_dict[gene]['raw'] = raw_cov
+                    self.cov_dict[gene]['raw'] = np.array(raw_cov)
                     self.cov_dict[gene]['estimate'] = est_cov
 
         # clean up (coverage dicts are large)
@@ -145,10 +160,9 @@ def get_coverage_plots(genes, degnorm_dir, figsize=[10, 6], save_dir=None):
         raw_cov = cov_ldr.cov_dict.get(gene)['raw']
         est_cov = cov_ldr.cov_dict.get(gene)['estimate']
 
-        # extract exon positioning, chromosome name.
-        gene_exon_df = cov_ldr.exon_df[cov_ldr.exon_df.gene == gene]
-        x_exon = gene_exon_df[['start', 'end']].values
-        chrom = gene_exon_df.chr.iloc[0]
+        # extract chromosome name, exon positioning: union of gene's exons as 1-indexed (start, end) pairs.
+        chrom = cov_ldr.gene_chroms[gene]
+        x_exon = cov_ldr.exon_index[chrom].gene_exon_unions(gene) + [1, 0]
 
         figs.append(plot_gene_coverage(est_cov
                                        , f=raw_cov
@@ -228,7 +242,7 @@ def get_coverage_data(genes, degnorm_dir, save_dir=None):
         if save_dir:
 
             # extract gene's chromosome name.
-            chrom = str(cov_ldr.exon_df[cov_ldr.exon_df.gene == this_gene].chr.iloc[0])
+            chrom = str(cov_ldr.gene_chroms[this_gene])
 
             # ensure writability of coverage data: create missing directories.
             if not os.path.isdir(os.path.join(save_dir, chrom)):
@@ -0,0 +1,251 @@
+import pysam
+from pandas import DataFrame
+from degnorm.utils import *
+from degnorm.reads import bam_header
+from degnorm.gene_processing import process_annotation, build_exon_index
+
+# coarse single-core unit costs of DegNorm's stages, for sizing allocations (order of magnitude, not exact).
+COST_MODEL = {'read_seconds': 6e-5  # per aligned read: loading, CIGAR parsing, exon containment checks.
+              , 'overlap_read_seconds': 2e-5  # per read per gene of an overlap gene group: ambiguous read checks.
+              , 'read_bytes': 500  # per aligned read held in memory while parsing a chromosome.
+              , 'merge_byte_seconds': 2e-9  # per byte of dense chromosome coverage loaded during coverage merge.
+              , 'nmf_fit_seconds': 3.3e-3  # per gene per NMF iteration, fixed overhead.
+              , 'nmf_element_seconds': 2e-9  # per coverage matrix element per NMF iteration.
+              , 'nmf_copies': 4  # number of coverage-sized float64 arrays held during NMF-OA.
+              , 'base_bytes': 3e8  # interpreter, libraries and genome annotation data.
+              , 'bam_bytes_per_read': 50}  # compressed .bam file bytes per read, used when a .bam file has no index.
+
+
+def format_bytes(n_bytes):
+    """
+    :param n_bytes: int or float number of bytes
+    :return: str human-readable size, e.g. '1.5 GB'
+    """
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(n_bytes) < 1024:
+            return '{0:.1f} {1}'.format(n_bytes, unit)
+        n_bytes /= 1024.
+
+    return '{0:.1f} TB'.format(n_bytes)
+
+
+def format_seconds(seconds):
+    """
+    :param seconds: int or float number of seconds
+    :return: str human-readable duration, e.g. '2h 05m'
+    """
+    seconds = int(np.ceil(seconds))
+    if seconds < 60:
+        return '{0}s'.format(seconds)
+    if seconds < 3600:
+        return '{0}m {1:02d}s'.format(seconds // 60, seconds % 60)
+
+    return '{0}h {1:02d}m'.format(seconds // 3600, (seconds % 3600) // 60)
+
+
+def bam_read_stats(bam_file, index_file=None):
+    """
+    Count a .bam file's aligned reads per chromosome from its index statistics, without reading any alignments.
+    If the .bam file has no index file yet, the file's read count is estimated from its size and spread over
+    chromosomes in proportion to chromosome length.
+
+    :param bam_file: str .bam filename
+    :param index_file: str (optional) corresponding .bai filename
+    :return: pandas.DataFrame with `chr`, `length` (chromosome length) and `reads` (aligned reads) columns
+    """
+    stats_df = bam_header(bam_file)
+
+    if index_file and os.path.isfile(index_file):
+        with pysam.AlignmentFile(bam_file, mode='rb', index_filename=index_file) as f:
+            mapped = {x.contig: x.mapped for x in f.get_index_statistics()}
+
+        stats_df['reads'] = stats_df.chr.map(mapped).fillna(0).astype(np.int64)
+
+    else:
+        n_reads = os.path.getsize(bam_file) / COST_MODEL['bam_bytes_per_read']
+        stats_df['reads'] = (n_reads * stats_df.length / stats_df.length.sum()).astype(np.int64)
+
+    return stats_df
+
+
+def estimate_resources(read_stats, exon_index, gene_overlap_dict, n_jobs=1, degnorm_iter=5, nmf_iter=100,
+                       downsample_rate=1, bins=20, skip_baseline_selection=False, compact=False):
+    """
+    Predict the runtime and peak memory of each DegNorm pipeline stage from cheap inputs: per-chromosome read
+    counts and chromosome lengths, transcript lengths and overlap gene group sizes, and DegNorm parameters.
+    Unit costs come from COST_MODEL.
+
+    :param read_stats: dict of {sample ID: pandas.DataFrame} pairs, see bam_read_stats, subset to the chromosomes
+    that DegNorm will process.
+    :param exon_index: dict of {chromosome: gene_processing.ExonIndex} pairs, see gene_processing.build_exon_index
+    :param gene_overlap_dict: dict of {chromosome: gene overlap structure} pairs,
+    see gene_processing.get_gene_overlap_structure
+    :param n_jobs: int number of processes (-p/--proc-per-node)
+    :param degnorm_iter: int number of DegNorm iterations (--iter)
+    :param nmf_iter: int number of NMF-OA iterations per DegNorm iteration (--nmf-iter)
+    :param downsample_rate: int coverage downsampling rate (--downsample-rate)
+    :param bins: int number of bins used in baseline selection
+    :param skip_baseline_selection: bool is baseline selection skipped (--skip-baseline-selection)?
+    :param compact: bool are coverage matrices stored compactly (--compact-coverage)?
+    :return: pandas.DataFrame with `stage`, `runtime_seconds` and `peak_memory_bytes` columns, one row per stage.
+    """
+    n_samples = len(read_stats)
+    chroms = list(exon_index.keys())
+    lengths = np.concatenate([exon_index[chrom].lengths for chrom in chroms]).astype(np.float_)
+    cov_itemsize = 2 if compact else 8
+
+    # per-chromosome cost of a read: overlap gene group reads are also checked against each gene in their group.
+    read_seconds = dict()
+    for chrom in chroms:
+        chrom_index = exon_index[chrom]
+        group_lengths = [chrom_index.lengths[[chrom_index.gene_idx[gene] for gene in genes]].sum()
+                         for genes in gene_overlap_dict[chrom].get('overlap_genes') or []]
+        group_sizes = [len(genes) for genes in gene_overlap_dict[chrom].get('overlap_genes') or []]
+        overlap_share = np.sum(group_lengths) / max(chrom_index.lengths.sum(), 1)
+        mean_group_size = np.average(group_sizes, weights=group_lengths) if np.sum(group_lengths) > 0 else 0.
+        read_seconds[chrom] = COST_MODEL['read_seconds'] + \
+            overlap_share * mean_group_size * COST_MODEL['overlap_read_seconds']
+
+    # (1) coverage and read counts: each sample's chromosomes are processed in parallel threads.
+    reads_runtime, reads_memory = 0., 0.
+    n_threads = max(1, min(n_jobs, len(chroms)))
+    for sample_id in read_stats:
+        stats_df = read_stats[sample_id].set_index('chr').loc[chroms]
+        chrom_seconds = stats_df.reads.values * np.array([read_seconds[chrom] for chrom in chroms])
+        chrom_bytes = stats_df.reads.values * COST_MODEL['read_bytes'] + 4 * stats_df.length.values
+
+        reads_runtime += max(chrom_seconds.max(), chrom_seconds.sum() / n_threads)
+        reads_memory = max(reads_memory, np.sort(chrom_bytes)[::-1][:n_threads].sum())
+
+    # (2) coverage merge: worker processes load dense chromosome coverage in memory-budgeted gene groups,
+    # the merged coverage matrices are then loaded into memory.
+    chrom_len = read_stats[list(read_stats.keys())[0]].set_index('chr').loc[chroms].length.values
+    merge_bytes = n_samples * chrom_len.sum() * cov_itemsize
+    merge_runtime = merge_bytes * COST_MODEL['merge_byte_seconds'] / max(1, min(n_jobs, len(chroms)))
+    mem_budget = min(500e6, n_samples * chrom_len.max() * cov_itemsize)
+    merge_memory = n_jobs * mem_budget + n_samples * lengths.sum() * cov_itemsize
+
+    # (3) NMF-OA: baseline selection refits each gene's NMF as up to (bins - minimum bins) bins are dropped.
+    n_fits = 1 if skip_baseline_selection else 1 + bins - int(np.ceil(0.2 * bins))
+    gene_seconds = COST_MODEL['nmf_fit_seconds'] + \
+        COST_MODEL['nmf_element_seconds'] * n_samples * np.ceil(lengths / downsample_rate)
+    nmf_runtime = degnorm_iter * nmf_iter * n_fits * gene_seconds.sum() / n_jobs
+    nmf_memory = n_samples * lengths.sum() * (cov_itemsize + 8 * (COST_MODEL['nmf_copies'] - 1))
+
+    return DataFrame({'stage': ['coverage and read counts', 'coverage merge', 'NMF-OA']
+                      , 'runtime_seconds': [reads_runtime, merge_runtime, nmf_runtime]
+                      , 'peak_memory_bytes': np.array([reads_memory, merge_memory, nmf_memory])
+                      + COST_MODEL['base_bytes']})
+
+
+def recommend_layout(read_stats, exon_index, gene_overlap_dict, max_jobs, memory=None, memory_fraction=0.8,
+                     **kwargs):
+    """
+    Recommend the number of processes per node: the most processes (up to max_jobs) whose predicted peak memory
+    fits within a fraction of available memory.
+
+    :param read_stats: dict of {sample ID: pandas.DataFrame} pairs, see estimate_resources.
+    :param exon_index: dict of {chromosome: gene_processing.ExonIndex} pairs, see estimate_resources.
+    :param gene_overlap_dict: dict of {chromosome: gene overlap structure} pairs, see estimate_resources.
+    :param max_jobs: int maximum number of processes, e.g. number of available CPUs
+    :param memory: int (optional) bytes of memory available, see utils.available_memory.
+    If None, memory does not constrain the number of processes.
+    :param memory_fraction: float fraction of memory that DegNorm's peak memory may take up.
+    :param kwargs: DegNorm parameters passed to estimate_resources
+    :return: 2-tuple (int recommended number of processes, pandas.DataFrame estimate_resources output for it)
+    """
+    for n_jobs in range(max(max_jobs, 1), 0, -1):
+        estimates_df = estimate_resources(read_stats
+                                          , exon_index=exon_index
+                                          , gene_overlap_dict=gene_overlap_dict
+                                          , n_jobs=n_jobs
+                                          , **kwargs)
+        if memory is None or estimates_df.peak_memory_bytes.max() <= memory_fraction * memory:
+            break
+
+    return n_jobs, estimates_df
+
+
+def dry_run(args):
+    """
+    Predict the runtime and peak memory of a DegNorm pipeline run from .bam file index statistics and headers,
+    the processed genome annotation and DegNorm parameters, and log a recommended -p/--proc-per-node
+    and MPI layout. No .bam file reads are loaded and no output is written.
+
+    :param args: parsed DegNorm command line arguments, see utils.parse_args
+    :return: pandas.DataFrame estimates for the requested -p/--proc-per-node, see estimate_resources.
+    """
+    # per-sample, per-chromosome read counts from .bam index statistics.
+    read_stats = OrderedDict()
+    chroms = list()
+    for bam_file, bai_file in zip(args.bam_files, args.bai_files):
+        sample_id = '.'.join(os.path.basename(bam_file).split('.')[:-1])
+        read_stats[sample_id] = bam_read_stats(bam_file
+                                               , index_file=bai_file)
+        new_chroms = read_stats[sample_id].chr.values.tolist()
+        chroms = new_chroms if not chroms else np.intersect1d(chroms, new_chroms).tolist()
+
+    if args.create_bai_files:
+        logging.info('No .bam index files for {0} .bam files, estimating their read counts from file size.'
+                     .format(len(args.create_bai_files)))
+
+    # transcript lengths and overlap gene groups from the processed genome annotation.
+    annotation_dat = process_annotation(args.genome_annotation
+                                        , chroms=chroms
+                                        , cache_dir=args.annotation_cache_dir)
+    exon_index = build_exon_index(annotation_dat['exon_df'])
+    params = {'degnorm_iter': args.iter
+              , 'nmf_iter': args.nmf_iter
+              , 'downsample_rate': args.downsample_rate
+              , 'skip_baseline_selection': args.skip_baseline_selection
+              , 'compact': args.compact_coverage}
+
+    estimates_df = estimate_resources(read_stats
+                                      , exon_index=exon_index
+                                      , gene_overlap_dict=annotation_dat['gene_overlap_dict']
+                                      , n_jobs=args.proc_per_node
+                                      , **params)
+
+    memory = available_memory()
+    n_jobs, rec_estimates_df = recommend_layout(read_stats
+                                                , exon_index=exon_index
+                                                , gene_overlap_dict=annotation_dat['gene_overlap_dict']
+                                                , max_jobs=max_cpu()
+                                                , memory=memory
+                                                , **params)
+
+    n_reads = int(np.sum([df[df.chr.isin(chroms)].reads.sum() for df in read_stats.values()]))
+    lines = ['DRY RUN -- {0} samples, {1} aligned reads, {2} chromosomes, {3} genes, '
+             'total transcript length {4}.'.format(len(read_stats), n_reads, len(exon_index)
+                                                   , int(np.sum([len(x.genes) for x in exon_index.values()]))
+                                                   , int(np.sum([x.lengths.sum() for x in exon_index.values()])))
+             , 'Predicted stage runtimes and peak memory with -p {0}:'.format(args.proc_per_node)]
+    for i in range(estimates_df.shape[0]):
+        lines.append('\t{0:<26}{1:>12}{2:>12}'.format(estimates_df.stage.iloc[i]
+                                                      , format_seconds(estimates_df.runtime_seconds.iloc[i])
+                                                      , format_bytes(estimates_df.peak_memory_bytes.iloc[i])))
+    lines.append('\t{0:<26}{1:>12}{2:>12}'.format('total'
+                                                  , format_seconds(estimates_df.runtime_seconds.sum())
+                                                  , format_bytes(estimates_df.peak_memory_bytes.max())))
+
+    lines.append('Recommended on this node ({0} CPUs, {1} memory available): -p {2}, '
+                 'predicted runtime {3}, peak memory {4}.'
+                 .format(available_cpus(), format_bytes(memory) if memory else 'unknown', n_jobs
+                         , format_seconds(rec_estimates_df.runtime_seconds.sum())
+                         , format_bytes(rec_estimates_df.peak_memory_bytes.max())))
+
+    # degnorm_mpi distributes samples across ranks for coverage and read counts, genes across ranks for NMF-OA,
+    # while the master rank merges all coverage.
+    rank_memory = rec_estimates_df.peak_memory_bytes.values
+    lines.append('MPI layout: degnorm_mpi with up to {0} ranks (one per sample) and -p {1} per rank. '
+                 'Worker ranks need ~{2}, the master rank ~{3}.'
+                 .format(len(read_stats), n_jobs
+                         , format_bytes(max(rank_memory[0], rank_memory[2] / len(read_stats)))
+                         , format_bytes(rank_memory.max())))
+
+    if args.nmf_tol is not None:
+        lines.append('NMF-OA predictions assume --nmf-iter iterations per fit, an upper bound with --nmf-tol.')
+
+    logging.info('\n'.join(lines))
+
+    return estimates_df
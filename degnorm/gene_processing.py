@@ -1,8 +1,12 @@
-import HTSeq
-import networkx as nx
 import pandas as pd
+import pickle as pkl
+import tempfile
 from degnorm.utils import *
 from degnorm.loaders import GeneAnnotationLoader
+from degnorm.intervals import expand_intervals, union_intervals
+
+# bump when the cached annotation data format or its processing changes, invalidating older cache files.
+ANNOTATION_CACHE_VERSION = 1
 
 
 class GeneAnnotationProcessor:
@@ -57,9 +61,8 @@ class GeneAnnotationProcessor:
 
         :return: df, but subset to genes that show up in exclusively one chromosome.
         """
-        grp = df.groupby(['gene'])
-        per_chrom_gene_cts = grp.chr.nunique()
-        rm_genes = per_chrom_gene_cts[per_chrom_gene_cts > 1].index.tolist()
+        per_chrom_gene_cts = df.groupby('gene').chr.nunique()
+        rm_genes = per_chrom_gene_cts.index[per_chrom_gene_cts > 1]
 
         return df[~df.gene.isin(rm_genes)]
 
@@ -81,19 +84,34 @@ class GeneAnnotationProcessor:
         :return: pandas.DataFrame with 'chr', 'gene', 'gene_start' and 'gene_end' columns
         """
         grp = df.groupby(['chr', 'gene'])
-        df_wide = grp.apply(lambda x: pd.Series({'gene_start': min(x.start), 'gene_end': max(x.end)}))
+        df_wide = grp.agg({'start': 'min', 'end': 'max'}).rename(columns={'start': 'gene_start'
+                                                                          , 'end': 'gene_end'})
         df_wide.reset_index(inplace=True)
 
         return df_wide
 
+    @staticmethod
+    def outline_exons(df):
+        """
+        Append each exon's gene outline (see gene_outline) to the exon's record, preserving the order of exons.
+
+        :param df: pandas.DataFrame containing 'gene', 'chr', exon 'start` and 'end' columns, e.g. from a .bed file
+        :return: df with 'gene_start' and 'gene_end' columns added
+        """
+        grp = df.groupby(['chr', 'gene']
+                         , sort=False)
+
+        return df.assign(gene_start=grp.start.transform('min')
+                         , gene_end=grp.end.transform('max'))
+
     def run(self):
         """
         Main function for GeneAnnotationProcessor. Runs transcriptome annotation processing pipeline:
 
          1. loads .gtf or .gff file for exon regions
          2. removes genes that occur in multiple chromosomes
-         3. outlines gene start/end positions
-         4. removes duplicates.
+         3. removes duplicates
+         4. outlines gene start/end positions.
 
         :param chroms: list of str chromosomes with which to subset data. Use if
         only a subset of chromosomes from genome annotation file will be useful.
@@ -111,11 +129,8 @@ class GeneAnnotationProcessor:
 
         # gene / exon processing
         exon_df = self.remove_multichrom_genes(exon_df)
-        exon_df.drop_duplicates(inplace=True)
-        gene_df = self.gene_outline(exon_df)
-        exon_df = exon_df.merge(gene_df
-                                , on=['chr', 'gene'])
-        exon_df.drop_duplicates(inplace=True)
+        exon_df = exon_df.drop_duplicates().reset_index(drop=True)
+        exon_df = self.outline_exons(exon_df)
 
         if self.verbose:
             logging.info('Processing successful. Final shape -- {0}'.format(exon_df.shape))
@@ -125,9 +140,9 @@ class GeneAnnotationProcessor:
 
 def get_gene_overlap_structure(gene_df):
     """
-    Build gene intersection matrix (a type of adjacency matrix), splitting genes into groups
-    of mutually overlapping genes (i.e. groups of genes that are reachable on paths within
-    adjacency matrix) and isolated genes that have no overlap with others.
+    Split genes into groups of mutually overlapping genes (i.e. connected components of the gene
+    overlap graph) and isolated genes that have no overlap with others. Groups are found by sweeping over
+    genes sorted by start position, so no gene-by-gene adjacency matrix is built.
 
     Example: Let gene_df be the pandas.DataFrame
 
@@ -155,77 +170,274 @@ def get_gene_overlap_structure(gene_df):
     genes A, B, and C form a group). Second element is 'isolated genes', a list of genes that have no overlap
     with others.
     """
-
     genes = gene_df.gene.values
     n_genes = len(genes)
 
-    # initialize gene overlap adjacency matrix.
-    adj_mat = np.zeros([n_genes, n_genes])
+    if n_genes == 0:
+        return {'overlap_genes': list()
+                , 'isolated_genes': list()}
 
     gene_starts = gene_df.gene_start.values
     gene_ends = gene_df.gene_end.values
-    gas = HTSeq.GenomicArrayOfSets(['chrom']
-                                   , stranded=False)
-
-    # build gene locator gas. Use 0-indexing.
-    for i in range(n_genes):
-        iv = HTSeq.GenomicInterval('chrom', gene_starts[i] - 1, gene_ends[i], '.')
-        gas[iv] += str(i)
-
-    # iterate over genes, find other genes that have overlap.
-    # for genes with overlap, store their exon region bounds.
-    for i in range(n_genes):
-        gene_start, gene_end = gene_starts[i] - 1, gene_ends[i]
-
-        # search gas for overlapping genes.
-        gas_intersect = [(st[0], sorted(st[1])) for
-                         st in gas[HTSeq.GenomicInterval('chrom', gene_start, gene_end, '.')].steps()]
-
-        # parse results from gas search, identify intersecting genes.
-        gene_intersect = list()
-        for ii in range(len(gas_intersect)):
-            cross_genes = gas_intersect[ii][1]
-            if cross_genes:
-                gene_intersect.extend(cross_genes)
-
-        # get indices of intersecting genes, update row of adjacency matrix.
-        gene_intersect = [int(x) for x in list(set(gene_intersect))]
-        if gene_intersect:
-            adj_mat[i, gene_intersect] = 1
-
-    # build network graph from adjacency (overlap) matrix.
-    graph = nx.from_numpy_matrix(adj_mat)
-
-    # now, parse graph:
-    # 1. starting with one gene, find all genes reachable from this gene. This is one
-    # adjacency group. If no other genes are reachable, gene is isolated.
-    # 2. Find set diff of adjacency groups with remaining genes, start search step 1. with
-    # any of these remaining genes.
-    # (continue iterating 1. and 2. until all genes have been grouped or labeled isolated.)
-    search_gene_idx = 0
-    progress = 0
-    isolated_genes = list()
+
+    # sweep over genes in order of start position while tracking the rightmost end of the genes swept so far:
+    # a gene starts a new group of overlapping genes when it starts after that rightmost end.
+    # Gene positions are 1-indexed and inclusive, so genes sharing a single base overlap.
+    order = np.argsort(gene_starts
+                       , kind='mergesort')
+    max_ends = np.maximum.accumulate(gene_ends[order])
+    new_group = np.ones(n_genes
+                        , dtype=bool)
+    new_group[1:] = gene_starts[order][1:] > max_ends[:-1]
+
+    # label each gene with its group, in the original gene order.
+    group_ids = np.empty(n_genes
+                         , dtype=np.int64)
+    group_ids[order] = np.cumsum(new_group) - 1
+
+    # genes that are alone in their group are isolated.
+    isolated = np.bincount(group_ids)[group_ids] == 1
+    isolated_genes = genes[isolated].tolist()
+
+    # collect groups of overlapping genes, ordered by their first gene in gene_df.
     overlap_genes = list()  # overlap_genes will be list of lists (sublists are groups of overlapping genes)
-    gene_ids = list(range(n_genes))
+    group_pos = dict()
+    for i in np.where(~isolated)[0]:
+        group_id = group_ids[i]
+        if group_id not in group_pos:
+            group_pos[group_id] = len(overlap_genes)
+            overlap_genes.append(list())
 
-    while progress < n_genes:
-        # get gene id's for all genes reachable from search_gene_idx
-        reachable_gene_idx = list(nx.single_source_shortest_path(graph, search_gene_idx).keys())
-        progress += len(reachable_gene_idx)
+        overlap_genes[group_pos[group_id]].append(genes[i])
 
-        # if gene is only reachable to itself -->> no overlap, append name to list of isolated genes.
-        if len(reachable_gene_idx) == 1:
-            isolated_genes.append(genes[reachable_gene_idx[0]])
+    return {'overlap_genes': overlap_genes
+            , 'isolated_genes': isolated_genes}
 
-        # if gene is in group of overlapping genes -->> store entire this set of overlapping genes.
-        else:
-            overlap_genes.append(genes[[x for x in reachable_gene_idx]].tolist())
 
-        gene_ids = list(set(gene_ids) - set(reachable_gene_idx))
-        if gene_ids:
-            search_gene_idx = gene_ids[0]
-        else:
-            break
+class ExonIndex:
 
-    return {'overlap_genes': overlap_genes
-            , 'isolated_genes': isolated_genes}
\ No newline at end of file
+    def __init__(self, chrom_exon_df):
+        """
+        Per-gene exon positioning index for a single chromosome's genes, built once from exon annotation data
+        so that coverage and read count computations can look up a gene's exon structure without scanning
+        the exon DataFrame.
+
+        All positions are 0-indexed to match .bam file read positions:
+         - exon bounds are [exon start - 1, exon end] pairs, where starts and ends are each sorted
+           within a gene. Used to determine whether reads lie within a gene's exons.
+         - exon unions are half-open [start, end) intervals of the union of a gene's exons, sorted by start.
+           Positions covered by a gene's exon unions make up its transcript.
+
+        :param chrom_exon_df: pandas.DataFrame with `gene`, `start` (exon start), `end` (exon end), `gene_start`,
+        and `gene_end` columns for a single chromosome's genes, as output by GeneAnnotationProcessor.run
+        """
+        codes, genes = pd.factorize(chrom_exon_df.gene)
+        n_genes = len(genes)
+        starts = chrom_exon_df.start.values.astype(np.int64)
+        ends = chrom_exon_df.end.values.astype(np.int64)
+
+        self.genes = np.asarray(genes)
+        self.gene_idx = dict(zip(self.genes.tolist(), range(n_genes)))
+
+        # gene outlines (1-indexed, inclusive), one per gene.
+        first_exon = np.unique(codes, return_index=True)[1]
+        self.gene_starts = chrom_exon_df.gene_start.values[first_exon].astype(np.int64)
+        self.gene_ends = chrom_exon_df.gene_end.values[first_exon].astype(np.int64)
+
+        # exon bounds: group exons by gene, sorting starts and ends independently within each gene.
+        start_order = np.lexsort((starts, codes))
+        end_order = np.lexsort((ends, codes))
+        self.exon_bounds = np.column_stack([starts[start_order] - 1, ends[end_order]])
+        self.exon_offsets = np.zeros(n_genes + 1
+                                     , dtype=np.int64)
+        self.exon_offsets[1:] = np.cumsum(np.bincount(codes, minlength=n_genes))
+
+        # exon unions: union of each gene's exons, see intervals.union_intervals.
+        self.exon_unions, union_codes = union_intervals(starts - 1
+                                                        , ends=ends
+                                                        , groups=codes)
+        self.union_offsets = np.zeros(n_genes + 1
+                                      , dtype=np.int64)
+        self.union_offsets[1:] = np.cumsum(np.bincount(union_codes, minlength=n_genes))
+
+        # transcript lengths Li: number of positions covered by a gene's exon unions.
+        self.lengths = np.bincount(union_codes
+                                   , weights=self.exon_unions[:, 1] - self.exon_unions[:, 0]
+                                   , minlength=n_genes).astype(np.int64)
+
+    def gene_exon_bounds(self, gene):
+        """
+        :param gene: str gene name
+        :return: (number of exons x 2) numpy array of a gene's exon bounds, see ExonIndex.
+        """
+        i = self.gene_idx[gene]
+        return self.exon_bounds[self.exon_offsets[i]:self.exon_offsets[i + 1]]
+
+    def gene_exon_unions(self, gene):
+        """
+        :param gene: str gene name
+        :return: (number of union intervals x 2) numpy array of a gene's exon unions, see ExonIndex.
+        """
+        i = self.gene_idx[gene]
+        return self.exon_unions[self.union_offsets[i]:self.union_offsets[i + 1]]
+
+    def transcript_positions(self, gene):
+        """
+        :param gene: str gene name
+        :return: 1-d numpy array of the sorted (0-indexed) chromosome positions making up a gene's transcript,
+        i.e. the positions covered by the gene's exons.
+        """
+        unions = self.gene_exon_unions(gene)
+        return expand_intervals(unions[:, 0]
+                                , ends=unions[:, 1])
+
+    def gene_span(self, genes):
+        """
+        :param genes: list of str gene names
+        :return: 2-tuple of int, the leftmost gene start and rightmost gene end (1-indexed, inclusive) of genes
+        """
+        idx = [self.gene_idx[gene] for gene in genes]
+        return int(self.gene_starts[idx].min()), int(self.gene_ends[idx].max())
+
+
+def build_exon_index(exon_df):
+    """
+    Build an ExonIndex for each chromosome in exon annotation data.
+
+    :param exon_df: pandas.DataFrame with `chr`, `gene`, `start`, `end`, `gene_start`, and `gene_end` columns,
+    as output by GeneAnnotationProcessor.run
+    :return: dict of {chromosome: ExonIndex} pairs
+    """
+    return {chrom: ExonIndex(chrom_exon_df) for chrom, chrom_exon_df in exon_df.groupby('chr', sort=False)}
+
+
+def annotation_cache_file(annotation_file, chroms, cache_dir):
+    """
+    Determine the annotation cache file of a genome annotation file's processed data, keyed by the
+    sha1 hash of the annotation file's contents and the set of chromosomes the annotation is subset to.
+
+    :param annotation_file: str .gtf file
+    :param chroms: list of str chromosome names used to subset gene annotation data
+    :param cache_dir: str path to annotation cache directory
+    :return: str path to cache file "<cache_dir>/annotation_<key>.pkl"
+    """
+    key_parts = [str(ANNOTATION_CACHE_VERSION), file_sha1(annotation_file)] + sorted(set(chroms))
+    key = hashlib.sha1('\n'.join(key_parts).encode('utf-8')).hexdigest()
+
+    return os.path.join(cache_dir, 'annotation_{0}.pkl'.format(key))
+
+
+def load_annotation_cache(cache_file):
+    """
+    Load processed genome annotation data saved by save_annotation_cache.
+
+    :param cache_file: str path to annotation cache file, see annotation_cache_file
+    :return: dict with keys 'chroms', 'exon_df', 'genes_df' and 'gene_overlap_dict', or None if
+    cache_file does not exist or cannot be read.
+    """
+    if not os.path.isfile(cache_file):
+        return None
+
+    try:
+        with open(cache_file, 'rb') as f:
+            return pkl.load(f)
+
+    except Exception:
+        logging.warning('Could not read annotation cache file {0}, ignoring it.'.format(cache_file))
+        return None
+
+
+def save_annotation_cache(cache_file, annotation_dat):
+    """
+    Save processed genome annotation data to an annotation cache file. Failure to write the cache is logged,
+    not raised, so that an unwritable cache directory does not interrupt a pipeline run.
+
+    :param cache_file: str path to annotation cache file, see annotation_cache_file
+    :param annotation_dat: dict with keys 'chroms' (list of str chromosomes), 'exon_df' and 'genes_df'
+    (processed exon and gene pandas.DataFrames), and 'gene_overlap_dict' (per-chromosome gene overlap
+    structures, see get_gene_overlap_structure)
+    """
+    cache_dir = os.path.dirname(cache_file)
+
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        # write to a temporary file first so that concurrent runs never load a partially written cache file.
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir
+                                        , suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pkl.dump(annotation_dat, f, protocol=pkl.HIGHEST_PROTOCOL)
+
+        os.replace(tmp_file, cache_file)
+
+    except OSError:
+        logging.warning('Could not write annotation cache file {0}.'.format(cache_file))
+
+
+def process_annotation(annotation_file, chroms, cache_dir=None, verbose=True):
+    """
+    Process a genome annotation file for a set of chromosomes: find exon positioning and gene outlines, subset
+    them to the chromosomes in both chroms and the annotation file, and determine per-chromosome gene overlap
+    structures. If cache_dir is specified, load the result from the annotation cache when the same annotation
+    file was processed for the same chromosomes before, otherwise save the result to the annotation cache.
+
+    :param annotation_file: str .gtf file
+    :param chroms: list of str chromosome names, e.g. those found in all .bam file headers
+    :param cache_dir: str (optional) path to annotation cache directory
+    :param verbose: bool indicator should progress be written to logger?
+    :return: dict with keys 'chroms', 'exon_df', 'genes_df' and 'gene_overlap_dict', see save_annotation_cache.
+    """
+    annotation_dat = None
+    if cache_dir:
+        cache_file = annotation_cache_file(annotation_file
+                                           , chroms=chroms
+                                           , cache_dir=cache_dir)
+        annotation_dat = load_annotation_cache(cache_file)
+
+    if annotation_dat:
+        if verbose:
+            logging.info('Loaded processed genome annotation data and gene overlap structure from cache {0}'
+                         .format(cache_file))
+            logging.info('Found {0} chromosomes in intersection of all experiments and gene annotation data:\n'
+                         '\t{1}'.format(len(annotation_dat['chroms']), ', '.join(annotation_dat['chroms'])))
+
+        return annotation_dat
+
+    if verbose:
+        logging.info('Begin genome annotation file processing...')
+
+    gap = GeneAnnotationProcessor(annotation_file
+                                  , verbose=verbose
+                                  , chroms=chroms)
+    exon_df = gap.run()
+
+    # take intersection of chromosomes available in genome annotation file and those in the reads data,
+    # if for some reason annotation file only contains subset.
+    chroms = np.intersect1d(chroms, exon_df.chr.unique()).tolist()
+
+    # subset exon (and therefore gene) data based on chromosome set.
+    exon_df = exon_df[exon_df.chr.isin(chroms)]
+    genes_df = exon_df[['chr', 'gene', 'gene_start', 'gene_end']].drop_duplicates().reset_index(drop=True)
+
+    if verbose:
+        logging.info('Found {0} chromosomes in intersection of all experiments and gene annotation data:\n'
+                     '\t{1}'.format(len(chroms), ', '.join(chroms)))
+        logging.info('Determining gene overlap structure across chromosomes.')
+
+    # break down gene overlap structures by chromosome.
+    gene_overlap_dict = dict()
+    for chrom in chroms:
+        gene_overlap_dict[chrom] = get_gene_overlap_structure(subset_to_chrom(genes_df
+                                                                              , chrom=chrom))
+
+    annotation_dat = {'chroms': chroms
+                      , 'exon_df': exon_df
+                      , 'genes_df': genes_df
+                      , 'gene_overlap_dict': gene_overlap_dict}
+
+    if cache_dir:
+        save_annotation_cache(cache_file
+                              , annotation_dat=annotation_dat)
+
+    return annotation_dat
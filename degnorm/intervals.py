@@ -0,0 +1,165 @@
+import numpy as np
+
+
+def _as_bounds(starts, ends):
+    """
+    Cast interval start and end positions to matching 1-d int64 numpy arrays.
+
+    :param starts: list of int or 1-d numpy array of int interval start positions
+    :param ends: list of int or 1-d numpy array of int interval end positions
+    :return: 2-tuple of 1-d int64 numpy arrays (starts, ends)
+    """
+    starts = np.asarray(starts, dtype=np.int64).ravel()
+    ends = np.asarray(ends, dtype=np.int64).ravel()
+
+    if starts.shape != ends.shape:
+        raise ValueError('interval starts and ends must have the same length.')
+
+    return starts, ends
+
+
+def expand_intervals(starts, ends):
+    """
+    Fill in half-open integer intervals [start, end) with the integers they cover, i.e. concatenate
+    np.arange(starts[i], ends[i]) over all intervals, without looping over intervals. For example:
+    starts = [10, 20], ends = [13, 24] -> [10, 11, 12, 20, 21, 22, 23]
+
+    Empty intervals (end <= start) contribute no integers.
+
+    :param starts: list of int or 1-d numpy array of int interval start positions
+    :param ends: list of int or 1-d numpy array of int interval end positions (exclusive)
+    :return: 1-d int64 numpy array
+    """
+    starts, ends = _as_bounds(starts, ends)
+    lengths = ends - starts
+    keep = lengths > 0
+    starts, ends, lengths = starts[keep], ends[keep], lengths[keep]
+
+    if not len(lengths):
+        return np.zeros(0, dtype=np.int64)
+
+    # step by 1 within an interval, and jump from the last integer of an interval to the next interval's start.
+    steps = np.ones(lengths.sum()
+                    , dtype=np.int64)
+    steps[0] = starts[0]
+    steps[np.cumsum(lengths[:-1])] = starts[1:] - ends[:-1] + 1
+
+    return np.cumsum(steps)
+
+
+def fill_in_bounds(bounds_vec, endpoint=False):
+    """
+    Fill in the outline of contiguous integer regions with integers. For example:
+    [10, 13, 20, 24] -> [10, 11, 12, 20, 21, 22, 23]
+
+    :param bounds_vec: list of int or 1-d numpy array of int, outline of contiguous integer regions. Must
+    have even number of elements.
+    :param endpoint: bool should odd-indexed elements of bounds_vec (the region endpoints) be included
+    in the filled in output? Same as numpy.linspace `endpoint` parameter.
+    :return: 1-d numpy array of int
+    """
+    n = len(bounds_vec)
+
+    if n % 2 != 0:
+        raise ValueError('bounds_vec = {0}, must have even number of values!'.format(bounds_vec))
+
+    bounds_vec = np.asarray(bounds_vec, dtype=np.int64)
+
+    return expand_intervals(bounds_vec[0::2]
+                            , ends=bounds_vec[1::2] + 1 if endpoint else bounds_vec[1::2])
+
+
+def union_intervals(starts, ends, groups=None):
+    """
+    Take the union of half-open integer intervals [start, end), merging intervals that overlap or touch.
+    For example, intervals [14563, 14600), [14590, 14640), [14640, 14700) reduce to [14563, 14700).
+
+    If groups are supplied, intervals are only merged with other intervals of the same group,
+    e.g. to take the union of each gene's exons in one pass. Empty intervals (end <= start) are ignored.
+
+    :param starts: list of int or 1-d numpy array of int interval start positions
+    :param ends: list of int or 1-d numpy array of int interval end positions (exclusive)
+    :param groups: (optional) list of int or 1-d numpy array of non-negative int interval group labels
+    :return: (m x 2) int64 numpy array of (start, end) union intervals, sorted by start. If groups are supplied,
+    a 2-tuple of union intervals sorted by group and then start, and a length-m int64 numpy array of their groups.
+    """
+    starts, ends = _as_bounds(starts, ends)
+    grouped = groups is not None
+    groups = np.zeros(len(starts), dtype=np.int64) if not grouped else np.asarray(groups, dtype=np.int64).ravel()
+
+    keep = ends > starts
+    starts, ends, groups = starts[keep], ends[keep], groups[keep]
+    order = np.lexsort((starts, groups))
+    starts, ends, groups = starts[order], ends[order], groups[order]
+
+    if not len(starts):
+        unions = np.zeros([0, 2], dtype=np.int64)
+        return (unions, groups) if grouped else unions
+
+    # running maximum of interval ends within each group: shift each group's ends above all prior groups' ends
+    # so that a single cumulative maximum does not carry over between groups.
+    shift = ends.max() - ends.min() + 1
+    group_rank = np.concatenate([[0], np.cumsum(groups[1:] != groups[:-1])])
+    prior_max_end = np.maximum.accumulate(ends - ends.min() + group_rank * shift) - group_rank * shift + ends.min()
+
+    # sweep over intervals by start position: a new union interval begins at a group's first interval,
+    # or when an interval starts after the rightmost end of the group's prior intervals.
+    new_union = np.ones(len(starts)
+                        , dtype=bool)
+    new_union[1:] = (groups[1:] != groups[:-1]) | (starts[1:] > prior_max_end[:-1])
+
+    union_idx = np.flatnonzero(new_union)
+    unions = np.column_stack([starts[union_idx]
+                              , np.maximum.reduceat(ends, union_idx)])
+
+    return (unions, groups[union_idx]) if grouped else unions
+
+
+def intersect_intervals(x, y):
+    """
+    Intersect two sets of sorted, disjoint half-open integer intervals, e.g. as output by union_intervals.
+    For example, x = [[0, 10], [20, 30]], y = [[5, 25]] -> [[5, 10], [20, 25]].
+
+    :param x: (n x 2) numpy array of sorted, disjoint (start, end) intervals
+    :param y: (m x 2) numpy array of sorted, disjoint (start, end) intervals
+    :return: (k x 2) int64 numpy array of sorted, disjoint, non-empty (start, end) intervals covering the positions
+    covered by both x and y.
+    """
+    x = np.asarray(x, dtype=np.int64).reshape(-1, 2)
+    y = np.asarray(y, dtype=np.int64).reshape(-1, 2)
+
+    # for each x interval, find the contiguous run of y intervals it overlaps.
+    lo = np.searchsorted(y[:, 1], x[:, 0], side='right')
+    hi = np.searchsorted(y[:, 0], x[:, 1], side='left')
+    n_pairs = np.maximum(hi - lo, 0)
+
+    x_idx = np.repeat(np.arange(x.shape[0]), n_pairs)
+    y_idx = expand_intervals(lo, hi)
+    intersections = np.column_stack([np.maximum(x[x_idx, 0], y[y_idx, 0])
+                                     , np.minimum(x[x_idx, 1], y[y_idx, 1])])
+
+    return intersections[intersections[:, 1] > intersections[:, 0]]
+
+
+def contained_in(starts, ends, unions):
+    """
+    Determine whether half-open integer intervals [start, end) lie entirely within a single interval
+    of a set of sorted, disjoint intervals, e.g. whether reads lie entirely within the union of exons.
+    Empty intervals (end <= start) are always contained.
+
+    :param starts: list of int or 1-d numpy array of int interval start positions
+    :param ends: list of int or 1-d numpy array of int interval end positions (exclusive)
+    :param unions: (m x 2) numpy array of sorted, disjoint (start, end) intervals, e.g. as output by union_intervals.
+    :return: 1-d bool numpy array, one element per [start, end) interval.
+    """
+    starts, ends = _as_bounds(starts, ends)
+    unions = np.asarray(unions, dtype=np.int64).reshape(-1, 2)
+
+    if not unions.shape[0]:
+        return ends <= starts
+
+    # find the rightmost union interval starting at or before each interval's start.
+    idx = np.searchsorted(unions[:, 0], starts, side='right') - 1
+    contained = (idx >= 0) & (ends <= unions[np.maximum(idx, 0), 1])
+
+    return contained | (ends <= starts)
@@ -1,6 +1,6 @@
 import pysam
 from degnorm.utils import *
-from pandas import read_csv
+from pandas import read_csv, concat
 
 
 class Loader:
@@ -72,44 +72,49 @@ class BamLoader(Loader):
 
 class GeneAnnotationLoader(Loader):
 
-    def __init__(self, to_load):
+    def __init__(self, to_load, chunksize=500000):
         """
-        .gtf file loader
+        .gtf file loader, for plain text or gzip-compressed (.gtf.gz) files.
 
         More about .gtf fields: https://useast.ensembl.org/info/website/upload/gff.html
 
-        :param to_load: str the realpath to a .gtf file.
+        :param to_load: str the realpath to a .gtf or .gtf.gz file.
+        :param chunksize: int number of .gtf lines to parse at a time, bounds memory used while parsing.
         """
-        Loader.__init__(self, '.gtf')
+        Loader.__init__(self, ['.gtf', '.gtf.gz'])
         self.get_file(to_load)
+        self.chunksize = chunksize
 
     @staticmethod
-    def _attribute_to_gene(attribute, exprs):
+    def _attributes_to_genes(attributes):
         """
-        Parse a .gtf attribute string for a gene_id or gene_name.
+        Parse .gtf attribute strings for a gene_name, or a gene_id when there is no gene_name.
 
         For example:
 
-        self._attribute_to_gene('gene_id "DDX11L1"; gene_name "DDX11L1"; transcript_id "NR_046018";'
-                                , exprs = [re.compile('gene_id')])
-        'DDX11L1'
+        self._attributes_to_genes(Series(['gene_id "DDX11L1"; gene_name "DDX11L1-2"; transcript_id "NR_046018";'
+                                          , 'gene_id "WASH7P"; transcript_id "NR_024540";']))
+        0    DDX11L1-2
+        1       WASH7P
+        dtype: object
 
-        :param attribute: str attribute string from .gtf file -- "A semicolon-separated list of tag-value pairs,
-        providing additional information about each feature."
-        :param exprs: list of compiled regex expressions to use to find a gene_id or gene_name
-        :return: str a gene_id or gene_name parsed out of attribute string
+        :param attributes: pandas.Series of str attribute strings from .gtf file -- "A semicolon-separated list of
+        tag-value pairs, providing additional information about each feature."
+        :return: pandas.Series of str gene_name or gene_id parsed out of attribute strings, NaN where neither is found
         """
-        splt = [x.strip() for x in attribute.split(';')]
-        gene = False
-        expr_idx = 0
-        while not gene:
-            gene_matches = list(filter(exprs[expr_idx].match, splt))
-            if gene_matches:
-                gene = gene_matches[0].replace(exprs[expr_idx].pattern, '').strip(' "')
+        # find the value of the first tag-value pair starting with gene_name.
+        expr = r'(?:^|;)\s*{0}([^;]*)'
+        genes = attributes.str.extract(expr.format('gene_name')
+                                       , expand=False)
 
-            expr_idx += 1
+        # fall back to gene_id, only searching attributes that are missing a gene_name.
+        missing = genes.isnull()
+        if missing.any():
+            genes[missing] = attributes[missing].str.extract(expr.format('gene_id')
+                                                             , expand=False)
 
-        return gene
+        # strip spaces and quotes from tag values.
+        return genes.str.strip(' "')
 
     def get_data(self):
         """
@@ -123,36 +128,52 @@ class GeneAnnotationLoader(Loader):
         |     chr6       |      17232      |      17368      |     LINC00266-3    |
         +----------------+-----------------+-----------------+--------------------+
 
+        The file is streamed in chunks of self.chunksize lines, and each chunk is subset to exon records
+        before gene identifiers are parsed, so only exon data is accumulated in memory.
+
         :return: pandas.DataFrame for exon annotated regions with fields 'chr', 'start', 'end', 'gene'
         """
-        # load file only if there are at least 9 columns.
-        try:
-            df = read_csv(self.filename
-                          , sep='\t'
-                          , header=None
-                          , usecols=list(range(9))
-                          , low_memory=False)
-        except ValueError:
-            raise ValueError('File {0} must have the 9 mandatory .gtf columns.\nRead more at https://useast.ensembl.org/info/website/upload/gff.html'.format(self.filename))
-
         cols = ['chr', 'source', 'feature', 'start',
                 'end', 'score', 'strand', 'frame', 'attribute']
-        df.columns = cols
+        col_error_msg = 'File {0} must have the 9 mandatory .gtf columns.\nRead more at https://useast.ensembl.org/info/website/upload/gff.html'.format(self.filename)
+        df_list = list()
+        missing_gene_id_ct = 0
+
+        try:
+            reader = read_csv(self.filename
+                              , sep='\t'
+                              , header=None
+                              , names=cols
+                              , usecols=['chr', 'feature', 'start', 'end', 'attribute']
+                              , dtype={'chr': str, 'feature': str, 'attribute': str}
+                              , compression='infer'
+                              , chunksize=self.chunksize)
+
+            for chunk in reader:
 
-        # subset annotation to just exons.
-        df = df[df.feature.apply(lambda x: x.lower()) == 'exon']
+                # load file only if there are at least 9 columns.
+                if chunk.attribute.isnull().any():
+                    raise ValueError(col_error_msg)
+
+                # subset annotation to just exons.
+                chunk = chunk[chunk.feature.str.lower() == 'exon']
+
+                # parse out gene identifiers from attribute strings.
+                genes = self._attributes_to_genes(chunk.attribute)
+                missing_gene_id_ct += genes.isnull().sum()
+
+                chunk = chunk[['chr', 'start', 'end']].assign(gene=genes)
+                df_list.append(chunk.drop_duplicates())
+
+        except ValueError:
+            raise ValueError(col_error_msg)
 
         # check that all .gtf attribute strings contain at least 'gene_name' or 'gene_id' identifiers.
-        missing_gene_id_ct = df.attribute.apply(lambda x: re.search(r'gene_id|gene_name', x) is None).sum()
         if missing_gene_id_ct:
             raise ValueError('Found .gtf records with attributes missing a required gene_id or gene_name identifier tag.')
 
-        # parse out gene identifiers from attribute strings.
-        find_me = [re.compile('gene_name'), re.compile('gene_id')]
-        df['gene'] = df.attribute.apply(lambda x: self._attribute_to_gene(x, exprs=find_me))
-
         # subset to the data we'll actually need, turning data into a .bed file format.
-        df = df[['chr', 'start', 'end', 'gene']].drop_duplicates().reset_index(drop=True)
+        df = concat(df_list).drop_duplicates().reset_index(drop=True)
 
         # ensure that gene metadata coming in with intended datatypes.
         try:
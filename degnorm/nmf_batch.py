@@ -0,0 +1,278 @@
+import numpy as np
+from collections import namedtuple
+from degnorm.rank_one import GRAM_MAX_DIM
+from degnorm.nmf_kernel import NMF_MIN_ITER
+
+# maximum bytes of a stacked (genes x p x L) float64 array in one batch. Small batches stay cache-resident.
+BATCH_MAX_BYTES = 5e5
+
+# largest number of coverage matrix elements (p x L) for which NMF-OA is batched. Beyond this, per-gene
+# numpy calls are no longer dominated by call overhead, and stacking only adds padding and cache misses.
+BATCH_MAX_SIZE = 2500
+
+# maximum ratio of a batch's (padded) length to the length of its shortest gene.
+BATCH_MAX_PAD = 1.25
+
+
+def batchable(x):
+    """
+    Should a coverage matrix's rank-one approximations be batched? The batched kernel is a stacked
+    Gram matrix eigen solve over samples, the same solve as rank_one.gram_rank_one for (p x L) matrices
+    with 2 <= p <= min(L, GRAM_MAX_DIM). Only small matrices (at most BATCH_MAX_SIZE elements) are batched.
+
+    :param x: numpy 2-d array, (p x L) coverage matrix
+    :return: bool
+    """
+    return 2 <= x.shape[0] <= min(x.shape[1], GRAM_MAX_DIM) and x.size <= BATCH_MAX_SIZE
+
+
+def length_buckets(lengths, p, max_pad=BATCH_MAX_PAD, max_bytes=BATCH_MAX_BYTES):
+    """
+    Group matrices into batches of similar length: within a batch, the longest matrix is at most max_pad
+    times as long as the shortest, and the padded (batch size x p x longest length) float64 array takes up
+    at most max_bytes.
+
+    :param lengths: list or 1-d numpy array of int matrix lengths (numbers of columns)
+    :param p: int number of matrix rows
+    :param max_pad: float maximum ratio of longest to shortest length within a batch.
+    :param max_bytes: int or float maximum bytes of a batch's padded float64 array.
+    :return: list of 1-d int numpy arrays, indices into lengths, one array per batch.
+    """
+    lengths = np.asarray(lengths)
+    order = np.argsort(lengths, kind='mergesort')
+    batches, start = list(), 0
+
+    for end in range(1, len(order) + 1):
+        if end == len(order) or lengths[order[end]] > max_pad * lengths[order[start]] or \
+                (end - start + 1) * p * lengths[order[end]] * 8 > max_bytes:
+            batches.append(order[start:end])
+            start = end
+
+    return batches
+
+
+def stack_padded(xs):
+    """
+    Stack (p x L_i) matrices into one zero-padded (n x p x max L_i) float64 array.
+
+    :param xs: list of numpy 2-d arrays with the same number of rows
+    :return: numpy 3-d array
+    """
+    out = np.zeros([len(xs), xs[0].shape[0], max([x.shape[1] for x in xs])])
+    for i, x in enumerate(xs):
+        out[i, :, :x.shape[1]] = x
+
+    return out
+
+
+# a step generator's NMF-OA fit request: a matrix x, with its optional precomputed (p x p) Gram matrix
+# and optional (K, E, lmbda) NMF-OA state to warm start from.
+FitRequest = namedtuple('FitRequest', ['x', 'gram', 'init'])
+FitRequest.__new__.__defaults__ = (None, None)
+
+
+def request_matrix(request):
+    """
+    Matrix of a step generator's fit request (see run_steps): requests are matrices or FitRequests.
+
+    :param request: numpy 2-d array or FitRequest
+    :return: numpy 2-d array
+    """
+    return request.x if isinstance(request, FitRequest) else request
+
+
+def batch_rank_one(y, gram=None):
+    """
+    Rank-one approximations of a stack of matrices, (K)(E^t) = U_{1} \\cdot \\sigma_{1}V_{1} for each, from
+    batched eigen solves of their (p x p) Gram matrices. Factors are oriented as in rank_one._orient.
+
+    Zero-padded columns of a matrix get zero E entries, so padding does not change any matrix's factors.
+
+    :param y: numpy 3-d array of shape (n x p x L)
+    :param gram: (optional) numpy 3-d array of shape (n x p x p), precomputed Gram matrices of y's matrices.
+    :return: 2-tuple (K, E) of numpy 3-d arrays of shapes (n x p x 1), (n x 1 x L)
+    """
+    if gram is None:
+        gram = np.matmul(y, y.transpose(0, 2, 1))
+
+    w, q = np.linalg.eigh(gram)
+    u, s = q[:, :, -1], np.sqrt(np.maximum(w[:, -1], 0.))
+
+    # v = Y^t u / s, or 0 for zero matrices.
+    v = np.matmul(u[:, None, :], y)[:, 0, :]
+    v /= np.where(s > 0, s, 1.)[:, None]
+    v[s == 0] = 0.
+
+    sign = np.where(u.sum(axis=1) < 0, -1., 1.)
+    return (u * (sign * s)[:, None])[:, :, None], (v * sign[:, None])[:, None, :]
+
+
+def batch_nmf(xs, nmf_iter=100, nmf_tol=None, grams=None, inits=None, return_lambda=False):
+    """
+    Run NMF-OA approximations (see nmf.GeneNMFOA.nmf) on several (p x L_i) matrices at once,
+    as stacked numpy operations on their zero-padded (n x p x max L_i) stack.
+
+    Padded columns stay exactly 0 in every matrix's estimate and Lagrange multipliers, so each matrix's
+    factors are those of its own NMF-OA, up to floating point summation order. With nmf_tol,
+    matrices leave the batch as they converge.
+
+    :param xs: list of numpy 2-d arrays with the same number of rows, see batchable.
+    :param nmf_iter: int number of NMF-OA iterations.
+    :param nmf_tol: (optional) float over-approximation tolerance for stopping early, see nmf_kernel.nmf_oa.
+    :param grams: (optional) list of numpy 2-d arrays, precomputed (p x p) Gram matrices of xs, used for
+    the initial rank-one approximations. Zero-padding does not change Gram matrices.
+    :param inits: (optional) list of (K, E, lmbda) NMF-OA states to warm start from (see nmf_kernel.nmf_oa),
+    or None for matrices that start from their rank-one approximations.
+    :param return_lambda: bool also return each matrix's final Lagrange multipliers?
+    :return: list of 3-tuples (K, E, n_iter), one per matrix: K is (p x 1), E is (1 x L_i),
+    n_iter the number of NMF-OA iterations run. If return_lambda, (p x L_i) Lagrange multipliers are appended.
+    """
+    x = stack_padded(xs)
+    K, E = batch_rank_one(x
+                          , gram=np.stack(grams) if grams is not None else None)
+    lmbda = np.zeros(x.shape)
+
+    # warm-started matrices: padded E and Lagrange multiplier columns stay 0.
+    if inits is not None:
+        for i, init in enumerate(inits):
+            if init is not None:
+                K[i], E[i] = init[0], 0.
+                E[i, :, :xs[i].shape[1]] = init[1]
+                lmbda[i, :, :xs[i].shape[1]] = init[2]
+
+    est = K * E
+    c = 1. / np.sqrt(nmf_iter)
+    min_iter = min(NMF_MIN_ITER, nmf_iter)
+    x_max = x.max(axis=(1, 2))
+
+    active = np.arange(len(xs))
+    out = [None] * len(xs)
+    lmbdas = [None] * len(xs)
+    n_iter = 0
+
+    for _ in range(nmf_iter):
+        res = est - x
+        lmbda -= c * res
+        lmbda[lmbda < 0.] = 0.
+        K, E = batch_rank_one(x + lmbda)
+        est_prev, est = est, K * E
+        n_iter += 1
+
+        # matrices over-approximated up to the tolerance leave the batch. Padded columns are 0 in x and est.
+        if nmf_tol is not None and n_iter >= min_iter:
+            done = (x - est).max(axis=(1, 2)) <= nmf_tol * x_max
+
+            if np.any(done):
+                for j in np.where(done)[0]:
+                    out[active[j]] = (K[j], E[j, :, :xs[active[j]].shape[1]], n_iter)
+                    lmbdas[active[j]] = lmbda[j, :, :xs[active[j]].shape[1]]
+
+                keep = ~done
+                active, x, lmbda, est, x_max = active[keep], x[keep], lmbda[keep], est[keep], x_max[keep]
+                K, E = K[keep], E[keep]
+
+                if not len(active):
+                    break
+
+    for j, i in enumerate(active):
+        out[i] = (K[j], E[j, :, :xs[i].shape[1]], n_iter)
+        lmbdas[i] = lmbda[j, :, :xs[i].shape[1]]
+
+    if return_lambda:
+        return [fit + (lmbda_i,) for fit, lmbda_i in zip(out, lmbdas)]
+
+    return out
+
+
+def batch_rank_one_approx(xs):
+    """
+    Rank-one approximations of several (p x L_i) matrices at once, see batch_rank_one.
+
+    :param xs: list of numpy 2-d arrays with the same number of rows, see batchable.
+    :return: list of 2-tuples (K, E), one per matrix: K is (p x 1), E is (1 x L_i).
+    """
+    K, E = batch_rank_one(stack_padded(xs))
+    return [(K[i], E[i, :, :x.shape[1]]) for i, x in enumerate(xs)]
+
+
+def run_steps(steps, fit):
+    """
+    Run a step generator to completion, serially. A step generator yields fit requests and receives
+    their fits, or the ValueError raised while fitting them; its return value is the result. Requests
+    are matrices or FitRequests (see request_matrix).
+
+    :param steps: generator, e.g. nmf.GeneNMFOA.baseline_selection_steps
+    :param fit: function mapping a yielded request to its fit.
+    :return: the generator's return value.
+    """
+    try:
+        request = next(steps)
+        while True:
+            try:
+                result = fit(request)
+            except ValueError as e:
+                request = steps.throw(e)
+                continue
+
+            request = steps.send(result)
+
+    except StopIteration as stop:
+        return stop.value
+
+
+def run_steps_batched(steps_list, fit, fit_batch):
+    """
+    Run many step generators (see run_steps) to completion in lockstep: on each round, every unfinished
+    generator's pending request is collected, requests for batchable matrices are grouped into length buckets
+    (see length_buckets) and fit together with fit_batch, the rest are fit one at a time with fit.
+
+    :param steps_list: list of generators
+    :param fit: function mapping a request to its fit.
+    :param fit_batch: function mapping a list of requests for batchable matrices with the same number of rows
+    to a list of their fits.
+    :return: list of the generators' return values, in order.
+    """
+    results = [None] * len(steps_list)
+    pending = dict()
+
+    def advance(i, result=None, error=None):
+        try:
+            if error is not None:
+                pending[i] = steps_list[i].throw(error)
+            elif i in pending:
+                pending[i] = steps_list[i].send(result)
+            else:
+                pending[i] = next(steps_list[i])
+
+        except StopIteration as stop:
+            pending.pop(i, None)
+            results[i] = stop.value
+
+    for i in range(len(steps_list)):
+        advance(i)
+
+    while pending:
+        requests = list(pending.items())
+        batch_idx = dict()
+        for i, request in requests:
+            x = request_matrix(request)
+            if batchable(x):
+                batch_idx.setdefault(x.shape[0], list()).append(i)
+
+            else:
+                try:
+                    result = fit(request)
+                except ValueError as e:
+                    advance(i, error=e)
+                    continue
+
+                advance(i, result=result)
+
+        for p in batch_idx:
+            idx = batch_idx[p]
+            for bucket in length_buckets([request_matrix(pending[i]).shape[1] for i in idx], p=p):
+                fits = fit_batch([pending[idx[j]] for j in bucket])
+                for j, result in zip(bucket, fits):
+                    advance(idx[j], result=result)
+
+    return results
@@ -0,0 +1,119 @@
+import numpy as np
+import threading
+import warnings
+
+# per-thread NMF-OA workspace buffers: threads (and worker processes) never share a workspace.
+_workspaces = threading.local()
+
+# minimum number of NMF-OA iterations run before stopping early.
+NMF_MIN_ITER = 10
+
+
+def workspace(shape, n):
+    """
+    Get n float64 work arrays of a given shape from the calling thread's workspace. Work arrays are C-contiguous
+    views into flat buffers that are only (re)allocated when a larger shape is requested, so repeated calls
+    for matrices no larger than the largest seen so far allocate nothing.
+
+    Views stay valid until the next call to workspace from the same thread.
+
+    :param shape: 2-tuple of int, work array shape
+    :param n: int number of work arrays
+    :return: list of n numpy 2-d arrays with uninitialized values.
+    """
+    size = int(np.prod(shape))
+    buffers = getattr(_workspaces, 'buffers', list())
+    while len(buffers) < n:
+        buffers.append(np.empty(0))
+
+    for i in range(n):
+        if buffers[i].size < size:
+            buffers[i] = np.empty(size)
+
+    _workspaces.buffers = buffers
+    return [buffer[:size].reshape(shape) for buffer in buffers[:n]]
+
+
+def nmf_oa(x, rank_one, nmf_iter=100, nmf_tol=None, gram=None, init=None):
+    """
+    NMF-OA iterations on a (p x L) float matrix, with every full-size array (estimate, previous estimate,
+    Lagrange multipliers, residual) kept in the calling thread's workspace and updated in place with
+    out= ufuncs, so that no (p x L) temporaries are allocated per iteration.
+
+    :param x: numpy 2-d float array
+    :param rank_one: function (y, init, gram) -> (K, E), rank-one approximation of y, optionally warm started
+    from a K factor init or using a precomputed Gram matrix. Must not keep references to y, which is
+    a workspace array.
+    :param nmf_iter: int number of NMF-OA iterations.
+    :param nmf_tol: (optional) float over-approximation tolerance for stopping early: after at least
+    NMF_MIN_ITER iterations, stop once the estimate falls below x by at most nmf_tol * max(x) anywhere,
+    i.e. max((x - est)+) <= nmf_tol * max(x).
+    :param gram: (optional) numpy 2-d array, precomputed (p x p) Gram matrix of x for the initial rank-one
+    approximation.
+    :param init: (optional) 3-tuple (K, E, lmbda) of (p x 1), (1 x L), (p x L) numpy arrays: NMF-OA state to
+    warm start from, e.g. a previous fit restricted to x's columns, instead of x's rank-one approximation
+    and zero Lagrange multipliers.
+    :return: 5-tuple (K, E, est, lmbda, n_iter): factors, estimate K.dot(E) and Lagrange multipliers as
+    workspace views (copy them to keep them past the next call to workspace), and the number of iterations run.
+    """
+    est, est_prev, lmbda, work = workspace(x.shape
+                                           , n=4)
+    if init is None:
+        K, E = rank_one(x, None, gram)
+        lmbda.fill(0.)
+
+    else:
+        K, E = init[0], init[1]
+        lmbda[:] = init[2]
+
+    np.dot(K, E, out=est)
+    c = 1. / np.sqrt(nmf_iter)
+    n_iter = 0
+    min_iter = min(NMF_MIN_ITER, nmf_iter)
+    x_max = x.max()
+
+    for _ in range(nmf_iter):
+
+        # lmbda <- max(lmbda - c(est - x), 0), then factor x + lmbda.
+        np.subtract(est, x, out=work)
+        np.multiply(work, c, out=work)
+        np.subtract(lmbda, work, out=lmbda)
+        np.maximum(lmbda, 0., out=lmbda)
+        np.add(x, lmbda, out=work)
+        K, E = rank_one(work, K, None)
+
+        est, est_prev = est_prev, est
+        np.dot(K, E, out=est)
+        n_iter += 1
+
+        # stop early once the estimate over-approximates x, up to the tolerance.
+        if nmf_tol is not None and n_iter >= min_iter:
+            np.subtract(x, est, out=work)
+            if work.max() <= nmf_tol * x_max:
+                break
+
+    return K, E, est, lmbda, n_iter
+
+
+def bin_scores(est, x, bin_starts):
+    """
+    Baseline selection bin scores: the mean, over each bin's positions, of the maximum (over samples) squared
+    relative residual (est - x) / (x + 1), ignoring NaN residuals as np.nanmax and np.nanmean would. Column
+    maxima are a single axis reduction and bin means are np.add.reduceat sums over the bin boundaries.
+
+    :param est: numpy 2-d array, (p x n) NMF-OA coverage estimate
+    :param x: numpy 2-d array, (p x n) coverage matrix
+    :param bin_starts: numpy 1-d array of int, first columns of consecutive, non-empty bins covering x's columns.
+    :return: numpy 1-d array of bin scores, NaN for bins whose residuals are all NaN.
+    """
+    res = np.add(x, 1.)
+    np.divide(np.subtract(est, x), res, out=res)
+    np.square(res, out=res)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        res_vec = np.nanmax(res, axis=0)
+
+    valid = ~np.isnan(res_vec)
+    with np.errstate(invalid='ignore'):
+        return np.add.reduceat(np.where(valid, res_vec, 0.), bin_starts) / np.add.reduceat(valid, bin_starts)
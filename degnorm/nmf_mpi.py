@@ -1,23 +1,13 @@
-from scipy.sparse.linalg import svds
 from pandas import DataFrame, concat
 from degnorm.utils import *
+from degnorm.rank_one import rank_one_approx, uses_row_gram
+from degnorm.nmf_kernel import bin_scores, nmf_oa
 import warnings
 from collections import OrderedDict
 import pickle as pkl
 from joblib import Parallel, delayed
 
 
-def rank_one_approx(x):
-    """
-    Decompose a matrix X via truncated SVD into (K)(E^t) = U_{1} \cdot \sigma_{1}V_{1}
-
-    :param x: numpy 2-d array
-    :return: 2-tuple (K, E) matrix factorization
-    """
-    u, s, v = svds(x, k=1)
-    return u * s, v
-
-
 def get_high_coverage_idx(x):
     """
     Find positions of high coverage in a gene's coverage matrix, defined
@@ -30,52 +20,82 @@ def get_high_coverage_idx(x):
     return np.where(x.max(axis=0) > 0.1 * x.max())[0]
 
 
-def nmf(x, factors=False, nmf_iter=100):
+def nmf(x, factors=False, nmf_iter=100, rank_one_solver='auto', rank_one_tol=None, nmf_tol=None,
+        return_n_iter=False, gram=None, init=None, return_lambda=False):
     """
     Run NMF-OA approximation. See "Normalization of generalized transcript degradation
     improves accuracy in RNA-seq analysis" supplement section 1.2.
 
+    Iterations run in place in a per-thread workspace, see nmf_kernel.nmf_oa.
+
     :param x: numpy 2-d array
     :param factors: boolean return 2-tuple of K, E matrix factorization? If False,
     return K.dot(E)
     :param nmf_iter: int number of SVD iterations per NMF approximation.
-    :return: depending on factors, return (K, E) matrices or K.dot(E) over-approximation to x
+    :param rank_one_solver: str rank-one solver, see degnorm.rank_one.rank_one_approx.
+    :param rank_one_tol: (optional) float tolerance for warm-starting each iteration's rank-one approximation
+    from the previous iteration's. If None, every iteration runs an exact rank-one solve.
+    :param nmf_tol: (optional) float over-approximation tolerance: stop once the estimate falls below x by at most
+    nmf_tol * max(x), see nmf_kernel.nmf_oa. If None, always run nmf_iter iterations.
+    :param return_n_iter: boolean also return the number of iterations run?
+    :param gram: (optional) numpy 2-d array, precomputed (p x p) Gram matrix of x, used for the initial
+    rank-one approximation by the Gram solver.
+    :param init: (optional) 3-tuple (K, E, lmbda), NMF-OA state to warm start from, see nmf_kernel.nmf_oa.
+    :param return_lambda: boolean with factors, also return the final (p x L) Lagrange multipliers?
+    :return: depending on factors, return (K, E) matrices or K.dot(E) over-approximation to x.
+    If return_n_iter, the int number of iterations run is appended, e.g. (K, E, n_iter),
+    then Lagrange multipliers if return_lambda, e.g. (K, E, n_iter, lmbda).
     """
-    K, E = rank_one_approx(x)
-    est = K.dot(E)
-    lmbda = np.zeros(shape=x.shape)
-    c = 1. / np.sqrt(nmf_iter)
-
-    for _ in range(nmf_iter):
-        res = est - x
-        lmbda -= c * res
-        lmbda[lmbda < 0.] = 0.
-        K, E = rank_one_approx(x + lmbda)
-        est = K.dot(E)
+    # coverage may be stored in a compact integer data type: convert to float for NMF-OA computations.
+    x = np.asarray(x, dtype=np.float_)
+
+    def rank_one(y, init, gram):
+        return rank_one_approx(y
+                               , solver=rank_one_solver
+                               , init=init if rank_one_tol is not None else None
+                               , tol=rank_one_tol
+                               , gram=gram)
+
+    K, E, est, lmbda, n_iter = nmf_oa(x
+                                      , rank_one=rank_one
+                                      , nmf_iter=nmf_iter
+                                      , nmf_tol=nmf_tol
+                                      , gram=gram
+                                      , init=init)
 
     if factors:
-        return K, E
+        out = (K, E, n_iter) if return_n_iter else (K, E)
 
-    return est
+        # copy Lagrange multipliers out of the workspace.
+        return out + (np.array(lmbda),) if return_lambda else out
+
+    # copy estimate out of the workspace.
+    est = np.array(est)
 
+    return (est, n_iter) if return_n_iter else est
 
-def ratio_svd(x):
+
+def ratio_svd(x, rank_one_solver='auto'):
     """
     One-iteration SVD over-approximation, but not the NMFOA algorithm.
     See https://bit.ly/2zR4XEn.
 
     :param x: 2-d numpy array
+    :param rank_one_solver: str rank-one solver, see degnorm.rank_one.rank_one_approx.
     :return: 2-d numpy array estimate, elements are at least as large as those in x.
     """
-    K, E = rank_one_approx(x)
+    # coverage may be stored in a compact integer data type: convert to float for NMF-OA computations.
+    x = np.asarray(x, dtype=np.float_)
+    K, E = rank_one_approx(x
+                           , solver=rank_one_solver)
     est = K.dot(E)
     est[est < x] = x[est < x]
 
     return est
 
 
-def run_ratio_svd_serial(x):
-    return list(map(ratio_svd, x))
+def run_ratio_svd_serial(x, rank_one_solver='auto'):
+    return list(map(lambda z: ratio_svd(z, rank_one_solver=rank_one_solver), x))
 
 
 def par_apply(fun, dat, n_jobs, mem_splits):
@@ -176,7 +196,8 @@ def run_baseline_selection_serial(x, **kwargs):
 
 
 def baseline_selection(F, nmf_iter=100, downsample_rate=1, min_high_coverage=20,
-                       bins=20, bin_frac=0.2, skip_baseline_selection=False):
+                       bins=20, bin_frac=0.2, skip_baseline_selection=False, rank_one_solver='auto',
+                       rank_one_tol=None, nmf_tol=None, nmf_warm_start=False):
     """
     Find "baseline" region for a gene's coverage curves - a region where it is
     suspected that degradation is minimal, so that the coverage envelope function
@@ -194,11 +215,17 @@ def baseline_selection(F, nmf_iter=100, downsample_rate=1, min_high_coverage=20,
     :param bins: int number of bins to use for breaking up transcript into distinct coverage regions.
     :param bin_frac: float in (0, 1], fraction of bins required to be kept before exiting baseline selection procedure.
     :param skip_baseline_selection: Bool skip baseline selection?
-
-    :return: 3-tuple --
-    (numpy 1-d array (DI scores)
-    , numpy 2-d array (estimate of F post baseline-selection algorithm)
-    , Boolean indicator of whether gene was sent through baseline selection)
+    :param rank_one_solver: str rank-one solver, see degnorm.rank_one.rank_one_approx.
+    :param rank_one_tol: (optional) float tolerance for warm-started rank-one approximations, see nmf.
+    :param nmf_tol: (optional) float over-approximation tolerance for stopping NMF-OA early, see nmf.
+    :param nmf_warm_start: Bool warm start NMF-OA after each bin drop from the previous NMF-OA's state,
+    restricted to the remaining columns?
+
+    :return: 4-tuple --
+    (numpy 2-d array (estimate of F post baseline-selection algorithm)
+    , numpy 1-d array (DI scores)
+    , Boolean indicator of whether gene was sent through baseline selection
+    , int total number of NMF-OA iterations run)
     """
 
     # ------------------------------------------------------------------------- #
@@ -216,6 +243,7 @@ def baseline_selection(F, nmf_iter=100, downsample_rate=1, min_high_coverage=20,
     output['rho'] = np.zeros(p)  # default degradation scores are all 0.
     output['estimate'] = F
     output['ran_baseline_selection'] = False
+    output['nmf_iterations'] = 0
 
     hi_cov_idx = get_high_coverage_idx(F)
 
@@ -232,7 +260,7 @@ def baseline_selection(F, nmf_iter=100, downsample_rate=1, min_high_coverage=20,
 
     # if there are not sufficiently-many high-coverage base pairs, return null degradation.
     if n_hi_cov < min_high_coverage:
-        return output['estimate'], output['rho'], output['ran_baseline_selection']
+        return output['estimate'], output['rho'], output['ran_baseline_selection'], output['nmf_iterations']
 
     # select high-coverage positions from (possibly downsampled) coverage matrix.
     hi_cov_idx.sort()
@@ -241,12 +269,18 @@ def baseline_selection(F, nmf_iter=100, downsample_rate=1, min_high_coverage=20,
 
     # if any sample sans coverage after filtering, return defaults.
     if np.sum(F_bin.sum(axis=1) > 0) < p:
-        return output['estimate'], output['rho'], output['ran_baseline_selection']
+        return output['estimate'], output['rho'], output['ran_baseline_selection'], output['nmf_iterations']
 
     # run NMF on filtered coverage, obtain initial coverage curve estimate.
-    K, E = nmf(F_bin
-               , factors=True
-               , nmf_iter=nmf_iter)
+    K, E, n_iter, lmbda = nmf(F_bin
+                              , factors=True
+                              , nmf_iter=nmf_iter
+                              , rank_one_solver=rank_one_solver
+                              , rank_one_tol=rank_one_tol
+                              , nmf_tol=nmf_tol
+                              , return_n_iter=True
+                              , return_lambda=True)
+    output['nmf_iterations'] += n_iter
     KE_bin = K.dot(E)
 
     # keep original NMFOA-estimated coverage in case we do not run baseline selection.
@@ -258,7 +292,7 @@ def baseline_selection(F, nmf_iter=100, downsample_rate=1, min_high_coverage=20,
 
     # exclude extreme cases where NMF result doesn't converge.
     if np.nanmedian(1 - rho_vec) > 1:
-        return output['estimate'], output['rho'], output['ran_baseline_selection']
+        return output['estimate'], output['rho'], output['ran_baseline_selection'], output['nmf_iterations']
 
     # establish minimum length of gene to work with. Bin relic.
     min_gene_len = max(2, np.ceil(200.0 * (1 / downsample_rate)))  # scale 200 default by downsample rate.
@@ -270,53 +304,77 @@ def baseline_selection(F, nmf_iter=100, downsample_rate=1, min_high_coverage=20,
     # If any of these criteria are satisfied, do not run baseline selection and return what we have.
     if (n_hi_cov >= min_gene_len) and (np.nanmin(rho_vec) <= 0.2) and (not skip_baseline_selection):
 
-        # split up consecutive regions of the high-coverage gene.
+        # split up consecutive regions of the high-coverage gene into bins with fixed boundaries.
         # even in downsampling regime, drop batches of sample points on each baseline selection iteration.
-        bin_segs = split_into_chunks(list(range(F_bin.shape[1]))
-                                     , n=bins)
-        n_bins = len(bin_segs)
+        # bins are tracked by an activity mask; F_bin holds the active bins' columns, in order.
+        bin_bounds = np.cumsum([0] + [len(seg) for seg in split_into_chunks(range(F_bin.shape[1])
+                                                                            , n=bins)])
+        bin_active = np.ones(len(bin_bounds) - 1
+                             , dtype=bool)
+        n_bins = len(bin_active)
+
+        # Gram matrix of F_bin for the Gram rank-one solver, downdated as bins are dropped.
+        gram = F_bin.dot(F_bin.T) if uses_row_gram(F_bin.shape, solver=rank_one_solver) else None
 
         while np.nanmax(rho_vec) > 0.1:
 
             # identify gene as having gone through baseline selection.
             output['ran_baseline_selection'] = True
 
+            # positions of the active bins within F_bin.
+            bin_ends = np.cumsum(np.diff(bin_bounds)[bin_active])
+            bin_starts = bin_ends - np.diff(bin_bounds)[bin_active]
+
             # compute relative residuals from NMF output,
             # then compute average weighted squared relative residual.
-            res_vec = np.apply_along_axis(lambda z: np.nanmax(z ** 2)
-                                          , axis=0
-                                          , arr=(KE_bin - F_bin) / (F_bin + 1))
-            ss_r = np.array(list(map(lambda idx: np.nanmean(res_vec[bin_segs[idx]]), range(n_bins))))
+            ss_r = bin_scores(KE_bin
+                              , x=F_bin
+                              , bin_starts=bin_starts)
 
             # if perfect approximation, exit loop.
             if np.nanmax(ss_r) == 0:
                 break
 
-            # drop the bin corresponding to the bin with the maximum normalized residual,
-            # along with corresponding indices of F.
+            # drop the bin corresponding to the bin with the maximum normalized residual:
+            # shift later bins' columns of F left over it, in place, and downdate the Gram matrix.
             drop_idx = np.nanargmax(ss_r)
-            F_bin = np.delete(F_bin
-                              , obj=bin_segs[drop_idx]
-                              , axis=1)
-            del bin_segs[drop_idx]
+            start, end = bin_starts[drop_idx], bin_ends[drop_idx]
+            if gram is not None:
+                gram -= F_bin[:, start:end].dot(F_bin[:, start:end].T)
 
-            n_hi_cov = F_bin.shape[1]
+            # when warm starting, restrict the last NMF-OA state to the remaining columns.
+            init = None
+            if nmf_warm_start:
+                init = (K
+                        , np.concatenate([E[:, :start], E[:, end:]], axis=1)
+                        , np.concatenate([lmbda[:, :start], lmbda[:, end:]], axis=1))
 
-            # update binned segments so that all bins are referencing indices in newly shrunken coverage matrices.
-            bin_segs = shift_bins(bin_segs
-                                  , dropped_bin=drop_idx)
-            n_bins = len(bin_segs)
+            F_bin[:, start:(F_bin.shape[1] - end + start)] = F_bin[:, end:]
+            F_bin = F_bin[:, :(F_bin.shape[1] - end + start)]
+            bin_active[np.where(bin_active)[0][drop_idx]] = False
+
+            n_hi_cov = F_bin.shape[1]
+            n_bins = np.sum(bin_active)
 
-            # shrink F matrix to the indices not dropped, cast back to wide matrix.
-            # estimate coverage curves from said indices with NMFOA. Try except in case
+            # estimate coverage curves from the remaining indices with NMFOA. Try except in case
             # baseline selection has left us with 1-column coverage matrix.
             try:
-                K, E = nmf(F_bin
-                           , factors=True
-                           , nmf_iter=nmf_iter)
+                use_gram = gram is not None and uses_row_gram(F_bin.shape, solver=rank_one_solver)
+                K, E, n_iter, lmbda = nmf(F_bin
+                                          , factors=True
+                                          , nmf_iter=nmf_iter
+                                          , rank_one_solver=rank_one_solver
+                                          , rank_one_tol=rank_one_tol
+                                          , nmf_tol=nmf_tol
+                                          , return_n_iter=True
+                                          , gram=gram if use_gram else None
+                                          , init=init
+                                          , return_lambda=True)
             except ValueError:
                 break
 
+            output['nmf_iterations'] += n_iter
+
             KE_bin = K.dot(E)
 
             # stop is fitted values are all zero for any sample (extreme cases).
@@ -375,7 +433,7 @@ def baseline_selection(F, nmf_iter=100, downsample_rate=1, min_high_coverage=20,
     output['estimate'] = estimate
 
     # return DI vector, estimate of F, True/False whether gene sent through baseline selection.
-    return output['estimate'], output['rho'], output['ran_baseline_selection']
+    return output['estimate'], output['rho'], output['ran_baseline_selection'], output['nmf_iterations']
 
 
 def par_apply_baseline_selection(dat, n_jobs, mem_splits, **kwargs):
@@ -389,10 +447,11 @@ def par_apply_baseline_selection(dat, n_jobs, mem_splits, **kwargs):
     :param n_jobs: int number of threads to use for running baseline selection in parallel on a single node.
     :param mem_splits: int number of splits to apply to dat. Threads work on individual splits, so
     more splits means less work per worker, but more times each worker needs to get a new split to work on.
-    :return: 3-tuple --
+    :return: 4-tuple --
     (list of 2-d numpy arrays used to visualize DegNorm estimated coverage matrices
     , rho (DI score matrix)
-    , baseline selection Boolean indicator vector, one T/F per gene)
+    , baseline selection Boolean indicator vector, one T/F per gene
+    , int vector of NMF-OA iterations run, one per gene)
     """
     # split up coverage matrices so that no worker gets much more than 50Mb.
     dat = split_into_chunks(dat
@@ -412,8 +471,10 @@ def par_apply_baseline_selection(dat, n_jobs, mem_splits, **kwargs):
     rho[rho < 0.] = 0.
 
     # return coverage curve estimates (for visualization purposes, not for DI score calculations),
-    # boolean array indicating whether or not each gene was sent through baseline selection
-    return [x[0] for x in baseline_dat], rho, np.array([x[2] for x in baseline_dat])
+    # boolean array indicating whether or not each gene was sent through baseline selection,
+    # number of NMF-OA iterations run per gene.
+    return [x[0] for x in baseline_dat], rho, np.array([x[2] for x in baseline_dat]), \
+        np.array([x[3] for x in baseline_dat])
 
 
 def downsample_2d(x, downsample_rate=1, by_row=True):
@@ -447,7 +508,7 @@ def downsample_2d(x, downsample_rate=1, by_row=True):
 
 def save_results(gene_manifest_df,
                  estimates, rho, x_adj, ran_baseline_selection,
-                 sample_ids, output_dir='.'):
+                 sample_ids, output_dir='.', nmf_iterations=None):
     """
     DegNorm output data to disk:
         - estimates: for each gene's estimated coverage matrix, find the chromosome to which the
@@ -459,6 +520,8 @@ def save_results(gene_manifest_df,
         - x_adj: save adjusted read counts to "adjusted_read_counts.csv" using sample_ids as the header.
         - ran_baseline_selection: save records of which genes were run through baseline selection on which
         DegNorm iteration to "ran_baseline_selection.csv". Columns are iterations of the DegNorm algorithm.
+        - nmf_iterations: save number of NMF-OA iterations run per gene per DegNorm iteration to
+        "nmf_iterations.csv".
 
     :param gene_manifest_df: pandas.DataFrame establishing chromosome-gene map. Must contain,
     at a minimum, the columns `chr` (str, chromosome) and `gene` (str, gene name).
@@ -470,6 +533,8 @@ def save_results(gene_manifest_df,
     :param output_dir: str output directory to save GeneNMFOA output.
     :param sample_ids: (optional) list of str names of RNA_seq experiments, to be used
      as headers for adjusted read counts matrix and degradation index score matrix.
+    :param nmf_iterations: (optional) 2-d numpy array of NMF-OA iterations run per gene (rows)
+    per DegNorm iteration (columns).
     """
     genes = list(estimates.keys())
 
@@ -551,9 +616,21 @@ def save_results(gene_manifest_df,
     ran_baseline_selection_df.to_csv(os.path.join(output_dir, 'ran_baseline_selection.csv')
                                      , index=False)
 
+    # append chromosome-gene index to NMF-OA iteration counts and save.
+    if nmf_iterations is not None:
+        nmf_iterations_df = DataFrame(nmf_iterations
+                                      , columns=iter_names)
+        nmf_iterations_df = concat([chrom_gene_df, nmf_iterations_df]
+                                   , axis=1)
+        nmf_iterations_df = nmf_iterations_df[['chr', 'gene'] + iter_names]
+        nmf_iterations_df.to_csv(os.path.join(output_dir, 'nmf_iterations.csv')
+                                 , index=False)
+
 
 def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate=1, min_high_coverage=50,
-                       nmf_iter=100, bins=20, n_jobs=1, skip_baseline_selection=False, random_state=123):
+                       nmf_iter=100, bins=20, n_jobs=1, skip_baseline_selection=False, random_state=123,
+                       cov_stats_df=None, rank_one_solver='auto', rank_one_tol=None, nmf_tol=None,
+                       nmf_warm_start=False):
     """
     Run DegNorm degradation normalization pipeline: adjust read counts, compute degradation index scores,
     and compute normalized coverage curve estimates.
@@ -575,6 +652,22 @@ def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate
     :param n_jobs: int number of cores used for distributing NMF computations over gene coverage matrices.
     :param skip_baseline_selection: Boolean should DegNorm skip baseline selection process?
     :param random_state: int seed for random number generator, useful if downsampling coverage matrices.
+    :param cov_stats_df: (optional, master only) pandas.DataFrame of per-gene coverage summary statistics with rows
+    aligned with the genes of cov_dat, as produced by reads_coverage_merge.merge_coverage. Uses `length`
+    and `sum_<sample ID>` columns (in sample order) in place of passes over the coverage matrices.
+    :param rank_one_solver: str solver for rank-one approximations, 'auto' (choose by coverage matrix shape)
+    or one of 'gram', 'lapack', 'randomized', 'arpack'. See degnorm.rank_one.
+    :param rank_one_tol: (optional) float tolerance for warm-started rank-one approximations within NMF-OA:
+    each NMF-OA iteration's factorization is refined from the previous iteration's by power iterations
+    until its left singular vector changes by at most rank_one_tol. If None, every NMF-OA iteration
+    runs an exact rank-one solve.
+    :param nmf_tol: (optional) float over-approximation tolerance for stopping NMF-OA early: an NMF-OA
+    approximation stops once its estimate falls below the coverage matrix by at most nmf_tol times the matrix's
+    maximum (after at least nmf_kernel.NMF_MIN_ITER iterations), or after nmf_iter iterations.
+    If None, always run nmf_iter iterations.
+    :param nmf_warm_start: Bool warm start each baseline selection NMF-OA after a bin drop from the previous
+    NMF-OA's factors and Lagrange multipliers, restricted to the remaining columns, instead of from scratch.
+    Requires nmf_tol, see nmf.GeneNMFOA.
 
     :return: list of 2-d numpy arrays, estimated coverage matrices. In same order as the keys (genes) of cov_dat.
     """
@@ -582,6 +675,9 @@ def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate
     rank = comm.rank
 
     # everyone needs DegNorm algorithm params. quickly qc them.
+    if nmf_warm_start and nmf_tol is None:
+        raise ValueError('nmf_warm_start requires nmf_tol.')
+
     degnorm_iter = np.abs(int(degnorm_iter))
     nmf_iter = np.abs(int(nmf_iter))
     bins = np.abs(int(bins))
@@ -591,7 +687,7 @@ def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate
     skip_baseline_selection = skip_baseline_selection
     random_state = random_state
 
-    # all coverage matrices must have >= 2 high-coverage indices if downsampling (svds function limitation).
+    # all coverage matrices must have >= 2 high-coverage indices if downsampling (rank-one approximation limitation).
     if downsample_rate > 1:
         min_high_coverage = 2
 
@@ -630,6 +726,7 @@ def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate
 
         # initialize baseline selection tracker entirely False (no genes have gone through baseline selection yet).
         ran_baseline_selection = np.zeros(shape=[n_genes, degnorm_iter]).astype(bool)
+        nmf_iterations = np.zeros(shape=[n_genes, degnorm_iter], dtype=int)
 
         # master housekeeping.
         my_cov_dat = master_cov_dat
@@ -648,7 +745,14 @@ def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate
         if not all(map(lambda z: z.ndim == 2, list(cov_dat.values()))):
             raise ValueError('Not all coverage matrices are 2-d arrays!')
 
-        li_vec = np.array(list(map(lambda z: z.shape[1], list(cov_dat.values()))))
+        if cov_stats_df is not None:
+            if cov_stats_df.shape[0] != n_genes:
+                raise ValueError('Number of genes in coverage summary statistics not equal to number of coverage matrices!')
+
+            li_vec = cov_stats_df.length.values
+        else:
+            li_vec = np.array(list(map(lambda z: z.shape[1], list(cov_dat.values()))))
+
         if np.sum(li_vec / p < 1) > 0:
             logging.warning('At least one coverage matrix is taller than it is wide.'
                             'Ensure that coverage matrices are shaped (p x L_i).')
@@ -664,7 +768,9 @@ def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate
         my_genes = list(my_cov_dat.keys())
 
     # determine (integer) number of data splits for threaded workers (50Mb per worker).
-    mem_splits = int(np.ceil(np.sum(list(map(lambda z: z.nbytes, list(my_cov_dat.values())))) / 5e7))
+    # workers hold float64 copies of coverage matrices, whatever their stored (e.g. compact uint) dtype.
+    mem_splits = int(np.ceil(np.sum(list(map(lambda z: z.size * np.dtype(np.float_).itemsize
+                                             , list(my_cov_dat.values())))) / 5e7))
     mem_splits = max(mem_splits, n_jobs)
 
     # ---------------------------------------------------------------------------- #
@@ -678,7 +784,7 @@ def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate
 
     # an individual worker has their own gene matrices by now,
     # so use ratio_svd to obtain first coverage matrix estimates, use to compute initial DI scores.
-    estimates = par_apply(fun=run_ratio_svd_serial
+    estimates = par_apply(fun=lambda z: run_ratio_svd_serial(z, rank_one_solver=rank_one_solver)
                           , dat=list(my_cov_dat.values())
                           , n_jobs=n_jobs
                           , mem_splits=mem_splits)
@@ -700,7 +806,11 @@ def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate
                                        , tag=444 + worker_id))
 
         est_sums = np.vstack(list(map(lambda x: x.sum(axis=1), [estimates.get(gene) for gene in all_genes])))
-        cov_sums = np.vstack(list(map(lambda x: x.sum(axis=1), list(cov_dat.values()))))
+        if cov_stats_df is not None:
+            cov_sums = cov_stats_df.filter(regex='^sum_').values
+        else:
+            cov_sums = np.vstack(list(map(lambda x: x.sum(axis=1), list(cov_dat.values()))))
+
         rho = 1 - (cov_sums / (est_sums + 1))
 
         # estimate normalization factors from initial DI scores.
@@ -782,7 +892,11 @@ def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate
                                                        , min_high_coverage=min_high_coverage
                                                        , bins=bins
                                                        , bin_frac=0.2
-                                                       , skip_baseline_selection=skip_baseline_selection)
+                                                       , skip_baseline_selection=skip_baseline_selection
+                                                       , rank_one_solver=rank_one_solver
+                                                       , rank_one_tol=rank_one_tol
+                                                       , nmf_tol=nmf_tol
+                                                       , nmf_warm_start=nmf_warm_start)
 
         # declare number of genes sent through baseline selection on this iteration.
         if not skip_baseline_selection:
@@ -801,7 +915,7 @@ def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate
         # begin host's work of organizing everyone's baseline selection data and re-scaling read counts.
         else:
             # obtain host's baseline selection output.
-            estimates, rho, bs_bool = [baseline_output[i] for i in range(3)]
+            estimates, rho, bs_bool, n_iter = [baseline_output[i] for i in range(4)]
 
             # get each worker's baseline selection output data, in order.
             # construct correctly ordered, comprehensive set of coverage matrix estimates, DI scores,
@@ -813,9 +927,17 @@ def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate
                 estimates += baseline_output[0]
                 rho = np.vstack([rho, baseline_output[1]])
                 bs_bool = np.append(bs_bool, baseline_output[2])
+                n_iter = np.append(n_iter, baseline_output[3])
 
             # update indicators whether gene was sent thru baseline selection on DegNorm iteration i
             ran_baseline_selection[:, i] = bs_bool
+            nmf_iterations[:, i] = n_iter
+
+            # declare NMF-OA iterations run on this iteration when stopping early.
+            if nmf_tol is not None:
+                msg = 'DegNorm iteration {0} -- {1} NMF-OA iterations run, {2:.1f} per gene' \
+                    .format(i + 1, np.sum(n_iter), np.mean(n_iter))
+                logging.info('({rank}/{size}) -- {msg}'.format(rank=rank + 1, size=size, msg=msg))
 
             # adjust (weighted) read counts.
             x_adj = x_weighted / (1 - rho)
@@ -855,7 +977,8 @@ def run_gene_nmfoa_mpi(comm, cov_dat, reads_dat, degnorm_iter=5, downsample_rate
                 output = {'estimates': dict(zip(all_genes, estimates))
                           , 'rho': rho
                           , 'x_adj': x_adj
-                          , 'ran_baseline_selection': ran_baseline_selection}
+                          , 'ran_baseline_selection': ran_baseline_selection
+                          , 'nmf_iterations': nmf_iterations}
 
                 return output
 
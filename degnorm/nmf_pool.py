@@ -0,0 +1,87 @@
+import numpy as np
+
+
+def create_arena(filename, p, lengths, dtype=np.float_, mats=None):
+    """
+    Preallocate a (p x sum(Li)) memory-mapped .npy arena holding a set of (p x Li) matrices side by side,
+    optionally filling it with the matrices. Worker processes open the arena by filename and read or write
+    their genes' columns in place, so matrices are never pickled between processes.
+
+    :param filename: str realpath of .npy file to create
+    :param p: int number of matrix rows
+    :param lengths: list or 1-d numpy array of int matrix lengths Li
+    :param dtype: numpy dtype of arena
+    :param mats: (optional) list of (p x Li) numpy 2-d arrays to copy into the arena, aligned with lengths.
+    :return: 1-d int64 numpy array of column offsets; matrix i occupies columns offsets[i]:offsets[i + 1].
+    """
+    offsets = np.zeros(len(lengths) + 1
+                       , dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+
+    arena = np.lib.format.open_memmap(filename
+                                      , mode='w+'
+                                      , dtype=dtype
+                                      , shape=(p, int(offsets[-1])))
+    if mats is not None:
+        for i, x in enumerate(mats):
+            arena[:, offsets[i]:offsets[i + 1]] = x
+
+        arena.flush()
+
+    del arena
+    return offsets
+
+
+def arena_matrices(filename, offsets, mode='r'):
+    """
+    Open matrices stored in a memory-mapped arena (see create_arena) as views.
+
+    :param filename: str realpath of arena .npy file
+    :param offsets: 1-d numpy array of column offsets of consecutive matrices, e.g. offsets[start:(end + 1)]
+    from create_arena for matrices start, ..., end - 1.
+    :param mode: str memmap mode, 'r' to read matrices, 'r+' to write to them.
+    :return: list of (p x Li) numpy 2-d array views into the arena.
+    """
+    arena = np.asarray(np.load(filename
+                               , mmap_mode=mode))
+    return [arena[:, offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def pool_ratio_svd(nmfoa, cov_file, offsets):
+    """
+    Worker process task: ratio-SVD estimates (see nmf.GeneNMFOA.ratio_svd) of a range of genes' coverage matrices.
+    Only estimates' row sums are sent back.
+
+    :param nmfoa: nmf.GeneNMFOA, see GeneNMFOA.worker_copy
+    :param cov_file: str realpath of coverage matrix arena
+    :param offsets: 1-d numpy array of the genes' arena column offsets, see arena_matrices.
+    :return: list of 1-d numpy arrays, estimated coverage sums (one per sample) of each gene.
+    """
+    estimates = nmfoa.run_ratio_svd_serial(arena_matrices(cov_file, offsets))
+    return [est.sum(axis=1) for est in estimates]
+
+
+def pool_baseline_selection(nmfoa, cov_file, est_file, offsets, seed):
+    """
+    Worker process task: baseline selection (see nmf.GeneNMFOA.baseline_selection) on a range of genes'
+    coverage matrices, scaled by nmfoa.scale_factors. Coverage estimates are written into the estimate arena,
+    so only per-gene DI scores, baseline selection flags and NMF-OA iteration counts are sent back.
+
+    :param nmfoa: nmf.GeneNMFOA, see GeneNMFOA.worker_copy
+    :param cov_file: str realpath of coverage matrix arena
+    :param est_file: str realpath of coverage estimate arena, laid out as the coverage matrix arena.
+    :param offsets: 1-d numpy array of the genes' arena column offsets, see arena_matrices.
+    :param seed: int or list of int random number generator seed, used when downsampling.
+    :return: list of 4-tuples (rho, None, ran baseline selection, number of NMF-OA iterations), one per gene.
+    """
+    np.random.seed(seed)
+    output = nmfoa.run_baseline_selection_serial(nmfoa.adjust_coverage_curves(arena_matrices(cov_file, offsets)))
+
+    est_mats = arena_matrices(est_file
+                              , offsets=offsets
+                              , mode='r+')
+    for est_mat, out in zip(est_mats, output):
+        est_mat[:] = out[1]
+
+    del est_mats
+    return [(out[0], None, out[2], out[3]) for out in output]
@@ -0,0 +1,224 @@
+import numpy as np
+from scipy.sparse.linalg import svds
+
+# largest matrix dimension for which the Gram matrix eigen solve is used.
+GRAM_MAX_DIM = 128
+
+# largest number of matrix elements for which the dense LAPACK SVD is used, when the Gram solve is not.
+LAPACK_MAX_SIZE = 250000
+
+
+def _orient(u, s, v):
+    """
+    Fix the sign of a leading singular vector pair, which is only determined up to a joint sign flip,
+    so that the left singular vector sums to a non-negative value. For the non-negative matrices used
+    in NMF-OA, this makes both singular vectors non-negative, regardless of solver.
+
+    :param u: 1-d numpy array, left singular vector (length p)
+    :param s: float leading singular value
+    :param v: 1-d numpy array, right singular vector (length L)
+    :return: 2-tuple (K, E) of (p x 1) and (1 x L) numpy 2-d arrays, K = u * s, E = v^t
+    """
+    if u.sum() < 0:
+        u, v = -u, -v
+
+    return (u * s).reshape(-1, 1), v.reshape(1, -1)
+
+
+def arpack_rank_one(x):
+    """
+    Leading singular vector pair of a matrix with ARPACK's truncated SVD (scipy.sparse.linalg.svds).
+
+    :param x: numpy 2-d array
+    :return: 3-tuple (u, s, v) of left singular vector, singular value, right singular vector
+    """
+    u, s, v = svds(x, k=1)
+    return u[:, 0], s[0], v[0]
+
+
+def gram_rank_one(x, gram=None):
+    """
+    Leading singular vector pair of a matrix from an eigen solve of its Gram matrix over its
+    smaller dimension. When x is (p x L) with p << L, XX^t is only (p x p), so the solve costs one pass
+    over x to form XX^t, then a tiny dense eigen decomposition.
+
+    :param x: numpy 2-d array
+    :param gram: (optional) numpy 2-d array, precomputed (p x p) Gram matrix XX^t, e.g. maintained incrementally
+    as columns are dropped from x. Only used when x is at least as wide as it is tall.
+    :return: 3-tuple (u, s, v) of left singular vector, singular value, right singular vector
+    """
+    transpose = x.shape[0] > x.shape[1]
+    y = x.T if transpose else x
+
+    if gram is None or transpose:
+        gram = y.dot(y.T)
+
+    w, q = np.linalg.eigh(gram)
+    u, s = q[:, -1], np.sqrt(max(w[-1], 0.))
+
+    # back out the other singular vector, v = X^t u / s. A zero matrix has no direction: v = 0.
+    v = y.T.dot(u) / s if s > 0 else np.zeros(y.shape[1])
+
+    return (v, s, u) if transpose else (u, s, v)
+
+
+def lapack_rank_one(x):
+    """
+    Leading singular vector pair of a matrix from a full dense (LAPACK) SVD.
+
+    :param x: numpy 2-d array
+    :return: 3-tuple (u, s, v) of left singular vector, singular value, right singular vector
+    """
+    u, s, vt = np.linalg.svd(x, full_matrices=False)
+    return u[:, 0], s[0], vt[0]
+
+
+def randomized_rank_one(x, n_oversamples=5, n_power_iter=4, random_state=0):
+    """
+    Leading singular vector pair of a matrix via randomized SVD (Halko, Martinsson and Tropp, 2011):
+    project x onto a few random directions, sharpen the projection with power iterations, and take
+    an exact SVD within the captured range.
+
+    Uses its own random number generator, so the global numpy random state is untouched.
+
+    :param x: numpy 2-d array
+    :param n_oversamples: int number of random directions beyond the one that is sought.
+    :param n_power_iter: int number of power iterations.
+    :param random_state: int seed for the random projection.
+    :return: 3-tuple (u, s, v) of left singular vector, singular value, right singular vector
+    """
+    rng = np.random.RandomState(random_state)
+    q, _ = np.linalg.qr(x.dot(rng.standard_normal((x.shape[1], 1 + n_oversamples))))
+
+    for _ in range(n_power_iter):
+        q, _ = np.linalg.qr(x.T.dot(q))
+        q, _ = np.linalg.qr(x.dot(q))
+
+    ub, s, vt = np.linalg.svd(q.T.dot(x), full_matrices=False)
+    return q.dot(ub[:, 0]), s[0], vt[0]
+
+
+def power_rank_one(x, u0, tol=1e-8, max_iter=20):
+    """
+    Leading singular vector pair of a matrix via power iterations warm-started from an approximate left singular
+    vector, e.g. that of a slightly different matrix. Iterations stop once the left singular vector changes
+    by at most tol (in Euclidean norm) between iterations.
+
+    :param x: numpy 2-d array
+    :param u0: 1-d numpy array, initial left singular vector (length p), need not be normalized.
+    :param tol: float convergence tolerance on the change in the (unit) left singular vector.
+    :param max_iter: int maximum number of power iterations.
+    :return: 4-tuple (u, s, v, converged) of left singular vector, singular value, right singular vector,
+    and bool whether the iterations converged within max_iter iterations.
+    """
+    u = np.ravel(u0)
+    u_norm = np.linalg.norm(u)
+    if u_norm == 0 or not np.isfinite(u_norm):
+        return u, 0., np.zeros(x.shape[1]), False
+
+    u = u / u_norm
+    s, v = 0., np.zeros(x.shape[1])
+    for _ in range(max_iter):
+        v = x.T.dot(u)
+        v_norm = np.linalg.norm(v)
+        if v_norm == 0:
+            return u, 0., v, False
+
+        v /= v_norm
+        u_new = x.dot(v)
+        s = np.linalg.norm(u_new)
+        u_new /= s
+
+        # XX^t is positive semi-definite, so u never flips sign between iterations.
+        delta = np.linalg.norm(u_new - u)
+        u = u_new
+        if delta <= tol:
+            return u, s, v, True
+
+    return u, s, v, False
+
+
+RANK_ONE_SOLVERS = {'arpack': arpack_rank_one
+                    , 'gram': gram_rank_one
+                    , 'lapack': lapack_rank_one
+                    , 'randomized': randomized_rank_one}
+
+
+def select_rank_one_solver(shape):
+    """
+    Choose a rank-one solver by matrix shape:
+        - gram: one matrix dimension is at most GRAM_MAX_DIM, e.g. the (p x L) coverage matrices
+        of a handful of samples.
+        - lapack: small matrices (at most LAPACK_MAX_SIZE elements).
+        - randomized: everything else, i.e. both dimensions large.
+
+    :param shape: 2-tuple of int, matrix shape
+    :return: str solver name, a key of RANK_ONE_SOLVERS
+    """
+    if min(shape) <= GRAM_MAX_DIM:
+        return 'gram'
+
+    if shape[0] * shape[1] <= LAPACK_MAX_SIZE:
+        return 'lapack'
+
+    return 'randomized'
+
+
+def uses_row_gram(shape, solver='auto'):
+    """
+    Will rank-one approximations of a (p x L) matrix be computed from its (p x p) row Gram matrix XX^t,
+    so that a precomputed Gram matrix can be used? True when the Gram solver applies and p <= L.
+
+    :param shape: 2-tuple of int, matrix shape
+    :param solver: str rank-one solver, 'auto' or a key of RANK_ONE_SOLVERS.
+    :return: bool
+    """
+    if shape[0] > shape[1]:
+        return False
+
+    return solver == 'gram' or (solver == 'auto' and select_rank_one_solver(shape) == 'gram')
+
+
+def rank_one_approx(x, solver='auto', init=None, tol=1e-8, max_iter=20, gram=None):
+    """
+    Decompose a matrix X via truncated SVD into (K)(E^t) = U_{1} \\cdot \\sigma_{1}V_{1}
+
+    All solvers return sign-consistent factors (see _orient), and, as ARPACK does, all raise a ValueError
+    for matrices with fewer than 2 rows or columns.
+
+    If init is supplied, e.g. K from the rank-one approximation of a nearby matrix, the factorization is
+    computed by warm-started power iterations (see power_rank_one) until the left singular vector changes by at
+    most tol, falling back to the solver if they do not converge within max_iter iterations.
+
+    :param x: numpy 2-d array
+    :param solver: str rank-one solver, one of 'auto' (choose by shape, see select_rank_one_solver)
+    or a key of RANK_ONE_SOLVERS.
+    :param init: (optional) numpy array with p elements, initial left singular vector, e.g. a previous K factor.
+    :param tol: float convergence tolerance for warm-started power iterations.
+    :param max_iter: int maximum number of warm-started power iterations.
+    :param gram: (optional) numpy 2-d array, precomputed (p x p) Gram matrix XX^t, used by the gram solver.
+    :return: 2-tuple (K, E) matrix factorization, shapes (p x 1) and (1 x L)
+    """
+    if min(x.shape) < 2:
+        raise ValueError('rank-one approximation requires a matrix with at least 2 rows and 2 columns, '
+                         'got shape {0}.'.format(x.shape))
+
+    if solver == 'auto':
+        solver = select_rank_one_solver(x.shape)
+
+    if solver not in RANK_ONE_SOLVERS:
+        raise ValueError('rank-one solver {0} not recognized. Use one of {1}.'
+                         .format(solver, ', '.join(['auto'] + sorted(RANK_ONE_SOLVERS))))
+
+    if init is not None:
+        u, s, v, converged = power_rank_one(x
+                                            , u0=init
+                                            , tol=tol
+                                            , max_iter=max_iter)
+        if converged:
+            return _orient(u, s, v)
+
+    if solver == 'gram' and gram is not None:
+        return _orient(*gram_rank_one(x, gram=gram))
+
+    return _orient(*RANK_ONE_SOLVERS[solver](x))
@@ -1,9 +1,14 @@
 from pandas import DataFrame, IntervalIndex, set_option
 from degnorm.utils import *
 from degnorm.loaders import BamLoader
+import pysam
+from degnorm.gene_processing import ExonIndex
+from degnorm.intervals import fill_in_bounds, expand_intervals, union_intervals, contained_in
 from joblib import Parallel, delayed
 from scipy import sparse
-import pickle as pkl
+
+# number of reads whose coverage is tallied at once when computing isolated genes' coverage.
+COVERAGE_BATCH_SIZE = 100000
 
 
 def cigar_segment_bounds(cigar, start):
@@ -66,30 +71,25 @@ def cigar_segment_bounds(cigar, start):
     return match_idx_list
 
 
-def fill_in_bounds(bounds_vec, endpoint=False):
-    """
-    Fill in the outline of contiguous integer regions with integers. For example:
-    [10, 13, 20, 24] -> [10, 11, 12, 20, 21, 22, 23]
-
-    :param bounds_vec: list of int or 1-d numpy array of int, outline of contiguous integer regions. Must
-    have even number of elements.
-    :param endpoint: bool should odd-indexed elements of bounds_vec (the region endpoints) be included
-    in the filled in output? Same as numpy.linspace `endpoint` parameter.
-    :return: 1-d numpy array of int
+def bam_header(bam_file):
     """
-    n = len(bounds_vec)
+    Parse the header of a .bam file and extract the chromosomes and corresponding lengths
+    of the chromosomes with reads contained in the .bam file. Does not require a .bam index file.
 
-    if n % 2 != 0:
-        raise ValueError('bounds_vec = {0}, must have even number of values!'.format(bounds_vec))
+    :param bam_file: str .bam filename
+    :return: pandas.DataFrame with `chr` and `length` columns
+    """
+    # open .bam file connection, parse header contained within .bam file.
+    with pysam.AlignmentFile(bam_file, mode='rb') as f:
+        header_dict = f.header.as_dict()['SQ']
 
-    if not endpoint:
-        filled_in = np.concatenate([np.arange(bounds_vec[j - 1], bounds_vec[j])
-                                    for j in np.arange(1, n, step=2)])
-    else:
-        filled_in = np.concatenate([np.arange(bounds_vec[j - 1], bounds_vec[j]+1)
-                                    for j in np.arange(1, n, step=2)])
+    chrom_len_dict = dict()
+    for header_line in header_dict:
+        chrom_len_dict[header_line.get('SN')] = header_line.get('LN')
 
-    return filled_in
+    # cast header as a pandas.DataFrame.
+    return DataFrame(list(chrom_len_dict.items())
+                     , columns=['chr', 'length'])
 
 
 class BamReadsProcessor:
@@ -149,23 +149,7 @@ class BamReadsProcessor:
         |     chr2       |     31192127    |
         +----------------+-----------------+
         """
-
-        # open .bam file connection.
-        bam_file = self.loader.get_data()
-        chrom_len_dict = dict()
-
-        # parse header contained within .bam file.
-        header_dict = bam_file.header.as_dict()['SQ']
-
-        # close .bam file connection.
-        bam_file.close()
-
-        for header_line in header_dict:
-            chrom_len_dict[header_line.get('SN')] = header_line.get('LN')
-
-        # cast header as a pandas.DataFrame.
-        self.header = DataFrame(list(chrom_len_dict.items())
-                                , columns=['chr', 'length'])
+        self.header = bam_header(self.filename)
 
         # based on supplied chromosome set and chromosomes in header, take intersection.
         if self.chroms is not None:
@@ -277,7 +261,7 @@ class BamReadsProcessor:
         :param read_bounds: list or 1-d array of even length alternating between positions of read
         matching region starts, matching region ends
         :param gene_exon_bounds: list of list of lists, each sublist is a list of [exon start, exon end] subsublists,
-        one sublist per gene.
+        one sublist per gene. Sublists may also be (number of exons x 2) numpy arrays, see ExonIndex.gene_exon_bounds.
         :return: list with integer indices of gene_exon_bounds corresponding to genes that fully capture read bounds.
         """
         full_capture_idx = list()
@@ -311,7 +295,7 @@ class BamReadsProcessor:
 
         return full_capture_idx
 
-    def chromosome_coverage_read_counts(self, gene_overlap_dat, chrom_gene_df, chrom_exon_df, chrom):
+    def chromosome_coverage_read_counts(self, gene_overlap_dat, chrom_gene_df, chrom_exon_df, chrom, exon_index=None):
         """
         Determine per-chromosome reads coverage and per-gene read counts from an RNA-seq experiment in
         a way that properly considers ambiguous reads - if a (paired) read falls entirely within the
@@ -322,9 +306,11 @@ class BamReadsProcessor:
          genes with no overlap with any other gene (a.k.a. "isolated genes") with filename
          'chrom_coverage_[sample_id]_[chrom].npz'
         2. Saves a dictionary of {gene_name: 1-d numpy gene coverage arrays (concatenated exonic regions)}
-         to a serialized pickle file for all genes that exonic have overlap with other genes (a.k.a. "overlap genes")
-         with filename 'overlap_coverage_[sample_id]_[chrom].pkl'
-        3. Saves read counts to self.save_dir with filename 'read_counts_[sample_id]_[chrom].csv'
+         to an indexed array store for all genes that exonic have overlap with other genes (a.k.a. "overlap genes")
+         with filenames 'overlap_coverage_[sample_id]_[chrom].npy' and 'overlap_coverage_[sample_id]_[chrom]_index.npz'.
+         See utils.save_coverage_arrays.
+        3. Saves read counts to self.save_dir with filename 'read_counts_[sample_id]_[chrom].npy', a 1-d integer
+         array aligned to the gene order of chrom_gene_df, so that all samples share one per-chromosome gene order.
 
         NOTE: if the required chromosome coverage files and read count file *already* exist prior to any coverage/read count
         calculations, Degnorm will default to using those files. This will only happen if a user either moves
@@ -342,6 +328,8 @@ class BamReadsProcessor:
         :param chrom_exon_df: pandas.DataFrame with `chr`, `gene`, `start`, `end` columns that delineate
         the start and end positions of exons on a gene.
         :param chrom: str chromosome name
+        :param exon_index: (optional) gene_processing.ExonIndex of the chromosome's genes, built from chrom_exon_df
+        if not supplied.
         :return: None. Coverage and read count files are written to self.save_dir.
         """
         # First, load this chromosome's reads.
@@ -366,8 +354,9 @@ class BamReadsProcessor:
 
         # create filepaths to non-overlapping read coverage, overlapping read coverage, read count files.
         chrom_cov_file = os.path.join(self.save_dir, 'chrom_coverage_' + self.sample_id + '_' + str(chrom) + '.npz')
-        ol_cov_file = os.path.join(self.save_dir, 'overlap_coverage_' + self.sample_id + '_' + str(chrom) + '.pkl')
-        count_file = os.path.join(self.save_dir, 'read_counts_' + self.sample_id + '_' + str(chrom) + '.csv')
+        ol_cov_stem = os.path.join(self.save_dir, 'overlap_coverage_' + self.sample_id + '_' + str(chrom))
+        ol_cov_file = coverage_array_files(ol_cov_stem)[1]
+        count_file = os.path.join(self.save_dir, 'read_counts_' + self.sample_id + '_' + str(chrom) + '.npy')
 
         # if all required coverage, read count files are present, e.g. created from a previous run attempt,
         # then skip all calculations and default to the existing files. Addresses issue #30.
@@ -388,6 +377,10 @@ class BamReadsProcessor:
         # initialize read counts.
         read_count_dict = {gene: 0 for gene in chrom_gene_df.gene}
 
+        # per-gene exon positioning lookups.
+        if exon_index is None:
+            exon_index = ExonIndex(chrom_exon_df)
+
         # set pandas.options.mode.chained_assignment = None to avoid SettingWithCopyWarnings
         set_option('mode.chained_assignment', None)
 
@@ -423,22 +416,10 @@ class BamReadsProcessor:
         # Step 2. Drop reads that don't fully fall within union of all exons.
         # ---------------------------------------------------------------------- #
         chrom_len = self.header[self.header.chr == chrom].length.iloc[0]
-        tscript_vec = np.ones([chrom_len]
-                              , dtype=int)  # large vector, will delete after using.
-
-        # build binary 0/1 exon/intron indicator vector.
-        # Need to account for exon data being 1-indexed, tscript_vec is 0-indexed, but
-        # exon end positions are inclusive.
-        exon_starts = chrom_exon_df.start.values - 1
-        exon_ends = chrom_exon_df.end.values
-        for i in range(len(exon_starts)):
-            tscript_vec[exon_starts[i]:exon_ends[i]] = 0
-
-        del exon_starts, exon_ends
-        gc.collect()
 
-        # store read_ids of reads to drop, and initialize dropped read count.
-        drop_reads = list()
+        # union of all exons on the chromosome, as 0-indexed half-open intervals.
+        exon_unions = union_intervals(exon_index.exon_unions[:, 0]
+                                      , ends=exon_index.exon_unions[:, 1])
 
         # store read match region bounds, so that we only parse CIGAR strings once.
         read_bounds = list()
@@ -466,49 +447,35 @@ class BamReadsProcessor:
                     bounds_2 = [min_bounds_1 - 1 if j >= min_bounds_1 else j for j in bounds_2]
                     bounds_2.sort()
 
-                # aggregate read pair's bounds.
-                bounds = bounds_1 + bounds_2
-
-                # iterate over match regions. If a single region is not fully contained
-                # within exon regions, drop the pair.
-                drop_read = False
-                for j in np.arange(1, len(bounds), step=2):
-
-                    # check whether matching regions on tscript_vec are fully contained within exonic regions.
-                    # note that right-bounds are inclusive.
-                    if np.sum(tscript_vec[(bounds[j - 1]):(bounds[j] + 1)]) > 0:
-                        drop_read = True
-
-                # append read id to set of read indices to drop (if appropriate).
-                if drop_read:
-                    drop_reads.extend([dat[ii - 1, 2], dat[ii, 2]])
-
-                # otherwise, append match region bounds list. Note: endpoints of regions are inclusive.
-                else:
-                    read_bounds.append(bounds)
+                # aggregate read pair's bounds. Note: endpoints of regions are inclusive.
+                read_bounds.append(bounds_1 + bounds_2)
 
         # for single-read RNA-Seq experiments, we do not need such special consideration.
         else:
             for ii in np.arange(dat.shape[0]):
-                # obtain read regions bounds.
-                bounds = cigar_segment_bounds(dat[ii, 0]
-                                              , start=dat[ii, 1])
-
-                # iterate over match regions. If a single region is not fully contained
-                # within exon regions, drop the read.
-                drop_read = False
-                for j in np.arange(1, len(bounds), step=2):
-
-                    if np.sum(tscript_vec[(bounds[j - 1]):(bounds[j] + 1)]) > 0:
-                        drop_read = True
+                # obtain read regions bounds. Note: endpoints of regions are inclusive.
+                read_bounds.append(cigar_segment_bounds(dat[ii, 0]
+                                                        , start=dat[ii, 1]))
+
+        # check whether all of a read's (or read pair's) match regions are fully contained within exonic regions.
+        # If a single region is not, drop the read (pair). Note that right-bounds are inclusive.
+        n_segments = np.array([len(bounds) // 2 for bounds in read_bounds]
+                              , dtype=np.int64)
+        segments = np.fromiter(chain.from_iterable(read_bounds)
+                               , dtype=np.int64
+                               , count=2 * n_segments.sum()).reshape(-1, 2)
+        segment_contained = contained_in(segments[:, 0]
+                                         , ends=segments[:, 1] + 1
+                                         , unions=exon_unions)
+        drop_read = np.bincount(np.repeat(np.arange(len(read_bounds)), n_segments)[~segment_contained]
+                                , minlength=len(read_bounds)) > 0
 
-                # append read id to set of read indices to drop (if appropriate).
-                if drop_read:
-                    drop_reads.append(dat[ii, 2])
+        if self.paired:
+            drop_reads = np.column_stack([dat[0:-1:2, 2], dat[1::2, 2]])[drop_read].ravel().tolist()
+        else:
+            drop_reads = dat[drop_read, 2].tolist()
 
-                # otherwise, append match region bounds list. Note: endpoints of regions are inclusive.
-                else:
-                    read_bounds.append(bounds)
+        read_bounds = [bounds for bounds, drop in zip(read_bounds, drop_read) if not drop]
 
         # drop reads that don't fully intersect exonic regions.
         if drop_reads:
@@ -523,7 +490,7 @@ class BamReadsProcessor:
         reads_df['bounds'] = read_bounds
 
         # delete objs, attempt to save on memory.
-        del tscript_vec, drop_reads, dat, read_bounds
+        del exon_unions, segments, drop_reads, dat, read_bounds
         gc.collect()
 
         # ---------------------------------------------------------------------- #
@@ -547,37 +514,30 @@ class BamReadsProcessor:
             # iterate over groups of overlapping genes.
             for ol_genes in gene_overlap_dat['overlap_genes']:
 
-                ol_gene_df = chrom_gene_df[chrom_gene_df.gene.isin(ol_genes)]
-                ol_gene_group_start = ol_gene_df.gene_start.min() - 1
-                ol_gene_group_end = ol_gene_df.gene_end.max() - 1
+                ol_gene_group_start, ol_gene_group_end = exon_index.gene_span(ol_genes)
+                ol_gene_group_start, ol_gene_group_end = ol_gene_group_start - 1, ol_gene_group_end - 1
 
                 ol_gene_starts = list()
                 gene_exon_bounds = list()
                 transcript_idx = list()  # list of 1-d np.arrays, each holding one overlapping gene's exon positioning.
 
-                # obtain exon regions for each gene in overlap group.
-                # Exon starts/ends are 1-indexed, change them to be 0-indexed.
+                # obtain exon regions for each gene in overlap group (already 0-indexed in exon_index).
                 for ol_gene in ol_genes:
-                    ol_gene_exon_df = chrom_exon_df[chrom_exon_df.gene == ol_gene]
 
                     # store gene starts for constructing per-gene coverage vectors.
                     # 0-index gene starts/ends.
-                    ol_gene_start = ol_gene_exon_df.gene_start.iloc[0] - 1
-                    ol_gene_end = ol_gene_exon_df.gene_end.iloc[0] - 1
+                    ol_gene_start, ol_gene_end = exon_index.gene_span([ol_gene])
+                    ol_gene_start, ol_gene_end = ol_gene_start - 1, ol_gene_end - 1
                     ol_gene_starts.append(ol_gene_start)
 
                     # initialize gene coverage vector for each gene in overlap group.
                     ol_cov_dict[ol_gene] = np.zeros([ol_gene_end - ol_gene_start + 1]
-                                                    , dtype=int)
+                                                    , dtype=np.uint32)
 
-                    # save gene exon positioning, for determining which reads captured by which genes.
-                    # 0-index exon positions, and include gene end positioning.
-                    e_starts, e_ends = np.sort(ol_gene_exon_df.start.values) - 1, np.sort(ol_gene_exon_df.end.values)
-                    gene_exon_bounds += [[[e_starts[j], e_ends[j]] for j in range(len(e_starts))]]      # list of list of lists, includes exon end pos.
-                    transcript_idx.append(np.unique(fill_in_bounds(flatten_2d(gene_exon_bounds[-1]))))  # transcript vector is 0-indexed, includes exon end pos.
-
-                # drop things we don't need any more.
-                del ol_gene_df, ol_gene_exon_df, e_starts, e_ends
+                    # save gene exon positioning, for determining which reads captured by which genes,
+                    # and gene transcript positions.
+                    gene_exon_bounds.append(exon_index.gene_exon_bounds(ol_gene))
+                    transcript_idx.append(exon_index.transcript_positions(ol_gene))
 
                 # storage for reads to drop.
                 drop_reads = list()
@@ -645,15 +605,15 @@ class BamReadsProcessor:
 
             # ---------------------------------------------------------------------- #
             # Step 3.5: save overlapping genes' coverage vectors.
-            # overlapping gene coverage vector dict ->> pkl file.
+            # overlapping gene coverage vector dict ->> flat .npy file + gene offset index.
             # ---------------------------------------------------------------------- #
             if self.verbose:
                 logging.info('SAMPLE {0}, CHR {1} -- saving overlapping gene coverage vectors.'
                              .format(self.sample_id, chrom))
 
             # dump overlapping genes' coverage matrices.
-            with open(ol_cov_file, 'wb') as f:
-                pkl.dump(ol_cov_dict, f)
+            save_coverage_arrays(ol_cov_stem
+                                 , cov_dict=ol_cov_dict)
 
             # free up some memory -- delete groups of intersecting genes, etc.
             del ol_reads_dat, ol_cov_dict, transcript_idx, gene_exon_bounds
@@ -675,30 +635,20 @@ class BamReadsProcessor:
             # reduce chrom_gene_df to remaining genes
             chrom_gene_df = chrom_gene_df[chrom_gene_df.gene.isin(gene_overlap_dat['isolated_genes'])]
 
-            # run same inclusion/exclusion transcript test but on the isolated genes.
-            tscript_vec = np.ones([chrom_len]
-                                  , dtype=int)
-
-            # identify regions of chromosome covered by isolated genes.
-            # change gene starts/ends to 0-indexed to match 0-indexed tscript_vec array, but
-            # gene ends are inclusive.
-            gene_starts = chrom_gene_df.gene_start.values - 1
-            gene_ends = chrom_gene_df.gene_end.values
-            for i in range(len(gene_starts)):
-                tscript_vec[gene_starts[i]:gene_ends[i]] = 0
+            # run same inclusion/exclusion test but on the isolated genes: identify regions of chromosome
+            # covered by isolated genes. change gene starts/ends to 0-indexed half-open intervals.
+            gene_unions = union_intervals(chrom_gene_df.gene_start.values - 1
+                                          , ends=chrom_gene_df.gene_end.values)
 
             # identify reads that do not fall within an isolated gene's (start, end).
-            drop_reads = list()
-            dat = reads_df[['pos', 'end_pos', 'read_id']].values
-            for i in range(dat.shape[0]):
-                read_start, read_end, read_id = dat[i, :]
-
-                # remember to include read end position. reads are 0-indexed.
-                if np.sum(tscript_vec[read_start:(read_end + 1)]) > 0:
-                    drop_reads.append(read_id)
+            # remember to include read end position. reads are 0-indexed.
+            read_contained = contained_in(reads_df.pos.values
+                                          , ends=reads_df.end_pos.values + 1
+                                          , unions=gene_unions)
+            drop_reads = reads_df.read_id.values[~read_contained].tolist()
 
             # drop memory hogs.
-            del dat, gene_starts, gene_ends, tscript_vec
+            del read_contained
 
             # drop reads that do not lie completely within area covered by isolated genes.
             if drop_reads:
@@ -712,7 +662,7 @@ class BamReadsProcessor:
 
                 # initialize chromosome coverage array.
                 cov_vec = np.zeros([chrom_len]
-                                   , dtype=int)
+                                   , dtype=np.uint32)
 
                 # ---------------------------------------------------------------------- #
                 # Step 4.5.1: join genes on reads data
@@ -734,44 +684,43 @@ class BamReadsProcessor:
                 # try another sweep to remove reads not within gene regions.
                 except KeyError:
 
-                    # outline valid read start positions along transcript.
-                    tscript_vec = np.ones([chrom_len]
-                                          , dtype=int)
-
-                    for i in range(chrom_gene_df.shape[0]):
-                        left = chrom_gene_df.index[i].left
-                        right = chrom_gene_df.index[i].right + 1
-                        tscript_vec[left:right] = 0
-
-                    # iterate over reads, checking whether read start position falls within
-                    # a [gene_start, gene_end] region.
-                    drop_reads = list()
-                    for i in range(reads_df.shape[0]):
-                        if tscript_vec[reads_df.pos.iloc[i]] != 0:
-                            drop_reads.append(reads_df.read_id.iloc[i])
+                    # check whether read start position falls within a [gene_start, gene_end] region.
+                    read_contained = contained_in(reads_df.pos.values
+                                                  , ends=reads_df.pos.values + 1
+                                                  , unions=gene_unions)
+                    drop_reads = reads_df.read_id.values[~read_contained].tolist()
 
                     # drop reads that do not start within valid [gene_start, gene_end] regions.
                     if drop_reads:
                         reads_df = reads_df[~reads_df.read_id.isin(drop_reads)]
 
-                    del tscript_vec, drop_reads
+                    del read_contained, drop_reads
                     gc.collect()
 
                     # subset reads to reads w/ valid read ID, then join with interval index again.
                     reads_df['gene'] = chrom_gene_df.loc[reads_df.pos].gene.values
 
-                # loop over reads for isolated genes, incrementing read count and coverage.
-                dat = reads_df[['bounds', 'gene']].values
-                for i in range(dat.shape[0]):
-                    bounds, gene = dat[i, :]
-
-                    # reads are already 0-indexed.
-                    read_idx = fill_in_bounds(bounds
-                                              , endpoint=True)
-
-                    # increment coverage and read count.
-                    cov_vec[read_idx] += 1
-                    read_count_dict[gene] += 1
+                # increment coverage over batches of reads for isolated genes. Take the union of each
+                # read's (inclusive) match regions so that each read covers a position at most once.
+                read_bounds = reads_df.bounds.values
+                for batch_start in range(0, len(read_bounds), COVERAGE_BATCH_SIZE):
+                    batch_bounds = read_bounds[batch_start:(batch_start + COVERAGE_BATCH_SIZE)]
+                    n_segments = np.array([len(bounds) // 2 for bounds in batch_bounds]
+                                          , dtype=np.int64)
+                    segments = np.fromiter(chain.from_iterable(batch_bounds)
+                                           , dtype=np.int64
+                                           , count=2 * n_segments.sum()).reshape(-1, 2)
+                    read_unions = union_intervals(segments[:, 0]
+                                                  , ends=segments[:, 1] + 1
+                                                  , groups=np.repeat(np.arange(len(batch_bounds)), n_segments))[0]
+                    cov_idx, cov_ct = np.unique(expand_intervals(read_unions[:, 0]
+                                                                 , ends=read_unions[:, 1])
+                                                , return_counts=True)
+                    cov_vec[cov_idx] += cov_ct.astype(cov_vec.dtype)
+
+                # increment read counts.
+                for gene, read_ct in reads_df.gene.value_counts().items():
+                    read_count_dict[gene] += read_ct
 
                 # ---------------------------------------------------------------------- #
                 # Step 4.5.2: save chromosome coverage vector.
@@ -786,7 +735,7 @@ class BamReadsProcessor:
                                 , matrix=sparse.csr_matrix(cov_vec))
 
                 # drop large data objects.
-                del cov_vec, dat, reads_df
+                del cov_vec, read_bounds, reads_df
 
             # drop remaining large data data objects.
             del chrom_gene_df, chrom_exon_df
@@ -798,26 +747,28 @@ class BamReadsProcessor:
 
         # ---------------------------------------------------------------------- #
         # Step 5. Save read counts.
-        # chromosome read counts ->> .csv file
+        # chromosome read counts ->> .npy file
         # ---------------------------------------------------------------------- #
-        # construct read count DataFrame from read count dictionary.
-        read_count_df = DataFrame({'gene': list(read_count_dict.keys())
-                                   , self.sample_id: list(read_count_dict.values())})
+        # read_count_dict was keyed in chrom_gene_df gene order, so the counts vector is aligned
+        # with the gene order every other sample uses for this chromosome.
+        read_counts = np.fromiter(read_count_dict.values()
+                                  , dtype=np.int64
+                                  , count=len(read_count_dict))
 
         del read_count_dict
         gc.collect()
 
         if self.verbose:
             logging.info('SAMPLE {0}, CHR {1} -- mean per-gene read count: {2:.4}'
-                         .format(self.sample_id, chrom, read_count_df[self.sample_id].mean()))
+                         .format(self.sample_id, chrom, read_counts.mean()))
             logging.info('SAMPLE {0}, CHR {1} -- saving read counts.'
                          .format(self.sample_id, chrom))
 
-        # save sample's chromosome read counts to .csv for joining later.
-        read_count_df.to_csv(count_file
-                             , index=False)
+        # save sample's chromosome read counts to binary .npy for stacking later.
+        np.save(count_file
+                , arr=read_counts)
 
-    def coverage_read_counts(self, gene_overlap_dict, gene_df, exon_df):
+    def coverage_read_counts(self, gene_overlap_dict, gene_df, exon_df, exon_index=None):
         """
         Main function for computing coverage arrays in parallel over chromosomes.
 
@@ -826,6 +777,10 @@ class BamReadsProcessor:
         :param gene_df: pandas.DataFrame with `chr`, `gene`, `gene_start`, and `gene_end` columns
         that delineate the start and end position of a gene's transcript on a chromosome. See
         GeneAnnotationProcessor.
+        :param exon_df: pandas.DataFrame with `chr`, `gene`, `start`, `end` columns that delineate
+        the start and end positions of exons on a gene.
+        :param exon_index: (optional) dictionary of {chromosome: gene_processing.ExonIndex} pairs,
+        see gene_processing.build_exon_index. Built per chromosome from exon_df if not supplied.
         :return: list of str file paths of compressed .npz files containing coverage arrays.
         """
         # create directory in DegNorm output dir where sample coverage vecs are saved.
@@ -843,5 +798,6 @@ class BamReadsProcessor:
             gene_overlap_dat=gene_overlap_dict.get(chrom),
             chrom_gene_df=subset_to_chrom(gene_df, chrom=chrom),
             chrom_exon_df=subset_to_chrom(exon_df, chrom=chrom),
-            chrom=chrom)
+            chrom=chrom,
+            exon_index=exon_index.get(chrom) if exon_index else None)
             for chrom in self.chroms)
@@ -1,20 +1,25 @@
-from pandas import read_csv, concat
+from pandas import DataFrame, concat
 from collections import OrderedDict
 from degnorm.utils import *
+from degnorm.gene_processing import ExonIndex, build_exon_index
 from scipy import sparse
 from joblib import Parallel, delayed
-import pickle as pkl
 import numpy as np
+import tempfile
+import shutil
 import os
 import gc
-import tqdm
 
 
-def merge_read_counts(data_dir, sample_ids, chroms):
+def merge_read_counts(data_dir, sample_ids, chroms, gene_df):
     """
     Merge set of RNA-Seq samples' chromosome gene coverage count files into one pandas.DataFrame with
     one row per gene, columns are `chr`, `gene`, <sample IDs> by scanning data_dir for sample ID subdirectories
-    and extracting chromosome read count .csv files.
+    and extracting chromosome read count .npy files.
+
+    Each read count file is a 1-d integer array aligned to the order of the chromosome's genes in gene_df, so
+    samples' read counts are stacked side by side into one (n genes x p samples) matrix per chromosome
+    instead of being joined on gene name.
 
     See reads.BamReadsProcessor.coverage_read_counts method.
 
@@ -23,13 +28,13 @@ def merge_read_counts(data_dir, sample_ids, chroms):
     Suppose data_dir is comprised of a file tree structure like this:
     |-- data_dir
     |   |-- sample123
-    |   |   |-- read_counts_sample123_chr1.csv
-    |   |   |-- read_counts_sample123_chr2.csv
+    |   |   |-- read_counts_sample123_chr1.npy
+    |   |   |-- read_counts_sample123_chr2.npy
     |   |-- sample124
-    |   |   |-- read_counts_sample124_chr1.csv
-    |   |   |-- read_counts_sample124_chr2.csv
+    |   |   |-- read_counts_sample124_chr1.npy
+    |   |   |-- read_counts_sample124_chr2.npy
 
-    ->> merge_read_counts(data_dir, ['sample123', 'sample124'], ['chr1', 'chr2']) ->>
+    ->> merge_read_counts(data_dir, ['sample123', 'sample124'], ['chr1', 'chr2'], gene_df) ->>
 
     +-----------+---------+-----------------+-----------------+
     |    chr    |  gene   |    sample123    |    sample124    |
@@ -42,43 +47,52 @@ def merge_read_counts(data_dir, sample_ids, chroms):
     +-----------+---------+-----------------+-----------------+
 
     :param data_dir: str path of directory containing RNA-Seq sample ID subdirectories, one per sample ID contained
-    in sample_ids, each subdirectory containing one read count .csv file per chromosome, named in the fashion
-    "read_counts_<sample ID>_<chromosome>.csv"
+    in sample_ids, each subdirectory containing one read count .npy file per chromosome, named in the fashion
+    "read_counts_<sample ID>_<chromosome>.npy"
     :param sample_ids: list of str names RNA Seq samples, i.e. basenames of various alignment files.
     :param chroms: list of str names of chromosomes for which to load read counts
+    :param gene_df: pandas.DataFrame with `chr` and `gene` columns, the same gene DataFrame that was supplied to
+    reads.BamReadsProcessor.coverage_read_counts. Determines the gene order of each chromosome's read counts.
     :return: pandas.DataFrame containing gene read counts across samples. Columns are `chr` (chromosome), `gene`,
     <sample IDs>
     """
     chrom_df_list = list()
+    n_samples = len(sample_ids)
 
     for chrom in chroms:
-        for i in range(len(sample_ids)):
+        chrom_genes = subset_to_chrom(gene_df, chrom=chrom).gene.values
+        n_genes = len(chrom_genes)
+
+        # preallocate (n genes x p samples) read count matrix for this chromosome.
+        counts_mat = np.zeros([n_genes, n_samples]
+                              , dtype=np.int64)
+
+        for i in range(n_samples):
 
             # identify one (chromosome, sample ID) combination, and therefore, path to
-            # of read counts .csv containing this chromosome's gene read counts for this sample.
+            # of read counts .npy containing this chromosome's gene read counts for this sample.
             sample_id = sample_ids[i]
             counts_file = os.path.join(data_dir
                                        , sample_id
-                                       , 'read_counts_{0}_{1}.csv'.format(sample_id, chrom))
+                                       , 'read_counts_{0}_{1}.npy'.format(sample_id, chrom))
 
             if not os.path.isfile(counts_file):
                 raise FileNotFoundError('read counts file {0} not available!'.format(counts_file))
 
-            # load sample's chromosome's read counts.
-            sample_chrom_counts_df = read_csv(counts_file)
-
-            # join together other samples' read counts for this chromosome.
-            if i == 0:
-                chrom_counts_df = sample_chrom_counts_df
-            else:
-                chrom_counts_df = chrom_counts_df.merge(sample_chrom_counts_df
-                                                        , on='gene')
+            # load sample's chromosome's read counts into its column of the read count matrix.
+            sample_chrom_counts = np.load(counts_file)
+            if sample_chrom_counts.shape[0] != n_genes:
+                raise ValueError('read counts file {0} has {1} genes, expected {2}.'
+                                 .format(counts_file, sample_chrom_counts.shape[0], n_genes))
 
-        # append chromosome column.
-        chrom_counts_df['chr'] = chrom
+            counts_mat[:, i] = sample_chrom_counts
 
-        # save this chromosome's read count DataFrame with consistent ordering of column names.
-        chrom_df_list.append(chrom_counts_df[['chr', 'gene'] + sample_ids])
+        # build this chromosome's read count DataFrame with consistent ordering of column names.
+        chrom_counts_df = DataFrame(counts_mat
+                                    , columns=sample_ids)
+        chrom_counts_df.insert(0, column='gene', value=chrom_genes)
+        chrom_counts_df.insert(0, column='chr', value=chrom)
+        chrom_df_list.append(chrom_counts_df)
 
     # vertically stack chromosomes read count DataFrames.
     chrom_counts_df = concat(chrom_df_list)
@@ -90,127 +104,114 @@ def merge_read_counts(data_dir, sample_ids, chroms):
     return chrom_counts_df
 
 
-def merge_overlap_gene_coverage(data_dir, sample_ids, chrom):
+def gene_coverage_stats(genes, lengths, cov_max, cov_sum, sample_ids, itemsize=8):
     """
-    For single chromosome, join multiple RNA Seq alignment files' gene coverage vectors for genes in genome
-    that overlap others on the chromosome of interest. Similar in spirit to merge_chrom_coverage,
-    but join is over individual genes' coverage vectors, not entire chromosomes' coverage vectors.
-
-    See reads.BamReadsProcessor.coverage_read_counts method.
-
-    Example:
-
-    Suppose data_dir is comprised of a file tree structure like this:
-    |-- data_dir
-    |   |-- sample123
-    |   |   |-- overlap_coverage_sample123_chr1.pkl
-    |   |   |-- overlap_coverage_sample123_chr2.pkl
-    |   |-- sample124
-    |   |   |-- overlap_coverage_sample124_chr1.pkl
-    |   |   |-- overlap_coverage_sample124_chr2.pkl
+    Assemble a per-gene coverage summary statistics table, one row per gene:
 
-    ->> merge_overlap_gene_coverage(data_dir, ['sample123', 'sample124'], 'chrj') ->>
+    +---------+----------+-----------+---------------+-----+---------------+-----+
+    |  gene   |  length  |  nbytes   | max_<sample1> | ... | sum_<sample1> | ... |
+    +=========+==========+===========+===============+=====+===============+=====+
+    |  ATX2   |   2594   |   103760  |     150.0     | ... |   211024.0    | ... |
+    +---------+----------+-----------+---------------+-----+---------------+-----+
 
-    {('gene Aj'): <L1 x 2 coverage array>,
-     ('gene Bj'): <L2 x 2 coverage array>,
-     ...
-     ('gene Nj'): <LNj x 2 coverage array>}
+    where length is Li, the number of columns in a gene's (p x Li) coverage matrix, nbytes is the size of the
+    coverage matrix, and max_<sample ID>, sum_<sample ID> are the maximum and sum of a sample's coverage.
 
-    :param data_dir: str path of directory containing RNA-Seq sample ID subdirectories, one per sample ID contained
-    in sample_ids, each subdirectory containing one read count .csv file per chromosome, named in the fashion
-    "overlap_coverage_<sample ID>_<chromosome>.csv"
+    :param genes: list or 1-d numpy array of str gene names
+    :param lengths: 1-d numpy array of int coverage matrix lengths, aligned with genes
+    :param cov_max: (n genes x p samples) numpy array of per-sample maximum coverage
+    :param cov_sum: (n genes x p samples) numpy array of per-sample total coverage
     :param sample_ids: list of str names RNA Seq samples, i.e. basenames of various alignment files.
-    :param chrom: str name of chromosome
-    :return: dictionary of the form {gene_name: coverage numpy array} for genes in genome that overlap others
-    on the chromosome of interest.
+    :param itemsize: int number of bytes per coverage matrix element
+    :return: pandas.DataFrame with `gene`, `length`, `nbytes`, `max_<sample ID>`, and `sum_<sample ID>` columns
     """
-    # output storage: (gene name, coverage matrix) key-value pairs.
-    sample_cov_dict = dict()
-    gene_cov_dict = dict()
-    n_samples = len(sample_ids)
-
-    # sample by sample, build gene coverage matrices.
-    for i in range(n_samples):
-
-        # identify one (chromosome, sample ID) combination, and therefore, path to
-        # of read counts .csv containing this chromosome's gene read counts for this sample.
-        sample_id = sample_ids[i]
-        cov_file = os.path.join(data_dir
-                                , sample_id
-                                , 'overlap_coverage_{0}_{1}.pkl'.format(sample_id, chrom))
-
-        # if there are no overlapping genes for this chromosome, return empty iterable.
-        if not os.path.isfile(cov_file):
-            return dict()
-
-        # load (sample, chromosome) gene coverage vector dictionary.
-        with open(cov_file, 'rb') as f:
-            sample_cov_dict = pkl.load(f)
-
-        for gene in sample_cov_dict:
-            cov_vec = sample_cov_dict[gene]
+    lengths = np.asarray(lengths, dtype=np.int64)
+    cov_max, cov_sum = np.asarray(cov_max), np.asarray(cov_sum)
+    stats_df = DataFrame({'gene': genes
+                          , 'length': lengths
+                          , 'nbytes': lengths * len(sample_ids) * itemsize})
 
-            # if loading the first sample's coverage vectors, initialize gene coverage matrices.
-            if i == 0:
-                gene_cov_dict[gene] = np.zeros(shape=[n_samples, len(cov_vec)]
-                                               , dtype=np.float_)
+    for j in range(len(sample_ids)):
+        stats_df['max_' + sample_ids[j]] = cov_max[:, j]
 
-            # update sample's coverage within coverage matrix.
-            gene_cov_dict[gene][i, :] = cov_vec
+    for j in range(len(sample_ids)):
+        stats_df['sum_' + sample_ids[j]] = cov_sum[:, j]
 
-    del sample_cov_dict
-    gc.collect()
-
-    return gene_cov_dict
+    return stats_df
 
 
-def merge_chrom_coverage(data_dir, sample_ids,
-                         chrom_exon_df, verbose=True):
+def coverage_stats_from_arrays(cov_dict, sample_ids):
     """
-    Join multiple RNA Seq alignment files' chromosome coverage vectors into a dictionary of per-gene
-    overage matrices based on exon positioning for that chromosome.
-
-    Example:
+    Compute the per-gene coverage summary statistics table (see gene_coverage_stats) from coverage matrices.
 
-    Suppose data_dir is comprised of a file tree structure like this:
+    :param cov_dict: dictionary or OrderedDict of {gene: (p x Li) coverage matrix} pairs
+    :param sample_ids: list of str names RNA Seq samples, in the order of coverage matrix rows.
+    :return: pandas.DataFrame, see gene_coverage_stats
+    """
+    cov_mats = list(cov_dict.values())
+    n_samples = len(sample_ids)
+    itemsize = cov_mats[0].itemsize if cov_mats else 8
 
-    |-- data_dir
-    |   |-- sample123
-    |   |   |-- chrom_coverage_sample123_chr1.pkl
-    |   |-- sample124
-    |   |   |-- chrom_coverage_sample124_chr1.pkl
+    return gene_coverage_stats(list(cov_dict.keys())
+                               , lengths=[x.shape[1] for x in cov_mats]
+                               , cov_max=np.array([x.max(axis=1) for x in cov_mats]
+                                                  , dtype=np.float_).reshape(-1, n_samples)
+                               , cov_sum=np.array([x.sum(axis=1, dtype=np.float_) for x in cov_mats]
+                                                  , dtype=np.float_).reshape(-1, n_samples)
+                               , sample_ids=sample_ids
+                               , itemsize=itemsize)
 
-    and suppose chrom_exon_df is a pandas.DataFrame looking like this:
 
-    +-----------+----------+-----------------+-----------------+
-    |    chr    |   gene   |   gene_start    |     gene_end    |
-    +===========+==========+=================+=================+
-    |   chr1    |  ZNF326  |      12275      |      14533      |
-    +-----------+----------+-----------------+-----------------+
-    |    ...    |    ...   |      ...        |       ...       |
-    +-----------+----------+-----------------+-----------------+
-    |   chr1    |   GORAB  |     3098838     |     3121055     |
-    +-----------+----------+-----------------+-----------------+
+def load_coverage_stats(file_stem, sample_ids):
+    """
+    Load the per-gene coverage summary statistics table of a chromosome's coverage matrix store, as saved
+    to its index by merge_coverage. If the index does not hold statistics, compute them from the coverage matrices.
 
-    ->> merge_overlap_gene_coverage(data_dir, ['sample123', 'sample124'], chrom_exon_df) ->>
+    :param file_stem: str realpath to coverage matrix store, without file extension.
+    :param sample_ids: list of str names RNA Seq samples, in the order of coverage matrix rows.
+    :return: pandas.DataFrame, see gene_coverage_stats
+    """
+    cov_file, index_file = coverage_array_files(file_stem)
+    with np.load(index_file) as index:
+        if 'max' not in index:
+            return coverage_stats_from_arrays(load_coverage_arrays(file_stem, mmap_mode='r')
+                                              , sample_ids=sample_ids)
+
+        return gene_coverage_stats(index['genes']
+                                   , lengths=np.diff(index['offsets'])
+                                   , cov_max=index['max']
+                                   , cov_sum=index['sum']
+                                   , sample_ids=sample_ids
+                                   , itemsize=np.load(cov_file, mmap_mode='r').itemsize)
+
+
+def chrom_merge_layout(data_dir, sample_ids, chrom_exon_df, exon_index=None, compact=False, mem_budget=500e6,
+                       verbose=True):
+    """
+    Plan the merge of a single chromosome's per-sample coverage files into per-gene coverage matrices:
+    determine which genes get coverage matrices, their order, their lengths, which genes' coverage comes
+    from per-sample overlap gene coverage stores, and how to split genes into memory-manageable groups.
 
-    {('gene Aj'): <2 x L1 coverage array>,
-     ('gene Bj'): <2 x L2 coverage array>,
-     ...
-     ('gene Nj'): <2 x LN coverage array>}
+    Genes are ordered by gene end position. Genes that overlap others take their coverage from the
+    "overlap_coverage_<sample ID>_<chromosome>" stores, all other genes take their coverage from the
+    "chrom_coverage_<sample ID>_<chromosome>.npz" chromosome coverage vectors.
 
-    :param data_dir: str path of directory containing RNA-Seq sample ID subdirectories,
-     each subdirectory containing the chromosome of interest's coverage array in an .npz file, named in the fashion
-    "chrom_coverage_<sample ID>_<chromosome>.csv"
+    :param data_dir: str path of directory containing RNA-Seq sample ID subdirectories.
     :param sample_ids: list of str names RNA Seq samples, i.e. basenames of various alignment files.
     :param chrom_exon_df: pandas.DataFrame outlining exon positions within a single chromosome; has columns 'chr',
     'start' (exon start), 'end' (exon end), 'gene' (gene name), 'gene_end', and 'gene_start'
+    :param exon_index: (optional) gene_processing.ExonIndex of the chromosome's genes, built from chrom_exon_df
+    if not supplied.
+    :param compact: bool indicator should the maximum coverage of the chromosome's coverage files be found?
+    :param mem_budget: int or float approximate number of bytes of dense chromosome coverage to load per group of genes.
     :param verbose: bool indicator should progress be written with logger?
-    :return: dictionary of the form {gene_name: coverage numpy array} for isolated genes within specified chromosome
+    :return: dictionary with keys
+    - genes: 1-d numpy array of str genes to merge, in output order
+    - lengths: 1-d numpy array of int coverage matrix lengths (number of columns), aligned with genes
+    - overlap_genes: set of str genes whose coverage comes from overlap gene coverage stores
+    - gene_splits: list of int indices into genes delineating groups of genes to merge together
+    - max_coverage: int maximum coverage across all of the chromosome's coverage files if compact, otherwise None
     """
-    # output storage: (gene name, coverage matrix) key-value pairs.
-    gene_cov_dict = dict()
-
     # identify the chromosome in question.
     unique_chrom = chrom_exon_df.chr.unique()
     if len(unique_chrom) > 1:
@@ -218,42 +219,46 @@ def merge_chrom_coverage(data_dir, sample_ids,
 
     chrom = unique_chrom[0]
 
+    if exon_index is None:
+        exon_index = ExonIndex(chrom_exon_df)
+
+    # sort genes by end position so that gene groups span contiguous regions of the chromosome.
+    gene_order = np.argsort(exon_index.gene_ends
+                            , kind='mergesort')
+    genes = exon_index.genes[gene_order]
+
     # identify all sample coverage arrays for this chromosome.
     npz_files = [os.path.join(data_dir, x, 'chrom_coverage_{0}_{1}.npz'.format(x, chrom)) for x in sample_ids]
+    ol_stems = [os.path.join(data_dir, x, 'overlap_coverage_{0}_{1}'.format(x, chrom)) for x in sample_ids]
+    avail_npz_files = [x for x in npz_files if os.path.isfile(x)]
 
-    # determine if this chromosome even has chromosome coverage from isolated genes to parse.
-    # If so, select a random chromosome coverage file.
-    has_chrom_coverage = False
-    for random_cov_file in np.random.choice(npz_files, size=len(npz_files), replace=False):
-        if os.path.isfile(random_cov_file):
-            has_chrom_coverage = True
-            break
+    # overlap genes are only taken from overlap gene coverage stores if every sample has one.
+    overlap_genes = set()
+    if all([os.path.isfile(coverage_array_files(x)[1]) for x in ol_stems]):
+        overlap_genes = set(load_coverage_index(ol_stems[0])[0].tolist())
 
     # if there simply are no chromosome coverage arrays for this chromosome
-    # (e.g. if chromosome was not read in any RNA-seq experiment), return empty dictionary.
-    if not has_chrom_coverage:
+    # (e.g. if chromosome was not read in any RNA-seq experiment), only overlap genes get coverage matrices.
+    mem_splits = 1
+    itemsize = np.dtype(np.uint32 if compact else np.float_).itemsize
+    if not avail_npz_files:
         if verbose:
             logging.info('CHR {0} -- no chromosome coverage files available.'.format(chrom))
 
-        return dict()
+        gene_order = gene_order[np.isin(genes, list(overlap_genes))]
+        genes = exon_index.genes[gene_order]
 
     # Keep memory manageable:
-    # break genes into groups so that each group's total coverage matrix
-    # is ~ 500Mb. mem_splits dictates size of gene groups for load procedure.
-    # use a randomly sampled chromosome coverage file to determine size of gene groups.
-    cov_vec_sp = sparse.load_npz(random_cov_file)
-    mem_splits = int(np.ceil(len(sample_ids) * cov_vec_sp.asfptype().todense().nbytes / 500e6))
-    del cov_vec_sp
-
-    # sort genes by end position so we won't need to have entire chromosome coverage vectors loaded at once,
-    # then break genes up into mem_splits subsets.
-    chrom_exon_df = chrom_exon_df.sort_values('gene_end'
-                                              , axis=0)
-    genes = chrom_exon_df['gene'].unique()
+    # break genes into groups so that each group's dense chromosome coverage matrix
+    # is ~ mem_budget bytes. mem_splits dictates size of gene groups for merge procedure.
+    else:
+        chrom_len = sparse.load_npz(avail_npz_files[0]).shape[1]
+        mem_splits = int(np.ceil(len(sample_ids) * chrom_len * itemsize / mem_budget))
+
     n_genes = len(genes)
 
     # if no breaks (e.g. if set of genes very small), the breaks are [0, number of genes]
-    if mem_splits == 1:
+    if mem_splits <= 1:
         gene_splits = [0, n_genes]
     else:
         gene_splits = np.linspace(0
@@ -264,195 +269,331 @@ def merge_chrom_coverage(data_dir, sample_ids,
         gene_splits = list(set(gene_splits))
         gene_splits.sort()
 
-    mem_splits = len(gene_splits) - 1
+    lengths = exon_index.lengths[gene_order]
+
+    # find an upper bound on coverage of the chromosome's genes, to choose a compact coverage data type.
+    max_coverage = None
+    if compact:
+        max_coverage = 0
+        for npz_file in avail_npz_files:
+            cov_vec = sparse.load_npz(npz_file)
+            if cov_vec.nnz > 0:
+                max_coverage = max(max_coverage, int(cov_vec.data.max()))
+
+        if overlap_genes:
+            for ol_stem in ol_stems:
+                ol_cov_vec = np.load(coverage_array_files(ol_stem)[0]
+                                     , mmap_mode='r')
+                if ol_cov_vec.size > 0:
+                    max_coverage = max(max_coverage, int(ol_cov_vec.max()))
+
+    return {'genes': genes
+            , 'lengths': lengths
+            , 'overlap_genes': overlap_genes
+            , 'gene_splits': gene_splits
+            , 'max_coverage': max_coverage}
+
+
+def merge_chrom_coverage(data_dir, sample_ids, chrom, exon_index,
+                         genes, offsets, overlap_genes, cov_file):
+    """
+    Merge one group of a chromosome's genes: join multiple RNA Seq alignment files' coverage into per-gene
+    coverage matrices and write them into their columns of a preallocated (p x sum(Li)) coverage matrix .npy file.
+    Handles both genes isolated from others (coverage sliced out of the chromosome coverage vectors based on exon
+    positioning) and genes overlapping others (coverage copied from per-sample overlap gene coverage stores).
 
-    use_pbar = False
-    if verbose:
-        logging.info('CHR {0} -- begin coverage matrix processing. \n'
-                     'Using {1} gene splits for memory efficiency.'.format(chrom, mem_splits))
+    Runs in a worker process: results are written to cov_file, only per-gene summary statistics are returned.
 
-        # Instantiate progress bar if parsing non-negligible number of genes. Update in intervals of 5%.
-        use_pbar = n_genes > 100
-        if use_pbar:
-            gene_idx = 0
-            pbar_step_size = int(np.ceil(n_genes / 10))
-            pbar = tqdm.tqdm(total=100
-                             , leave=False
-                             , desc='CHR {0}: coverage matrix progress'.format(chrom)
-                             , unit='%')
+    Example:
 
-    # create the coverage matrix for each subset of genes.
-    for i in range(mem_splits):
+    Suppose data_dir is comprised of a file tree structure like this:
 
-        # subset exon data to current gene subset.
-        sub_genes = genes[gene_splits[i]:gene_splits[i + 1]].tolist()
-        sub_chrom_exon_df = chrom_exon_df[chrom_exon_df.gene.isin(sub_genes)]
+    |-- data_dir
+    |   |-- sample123
+    |   |   |-- chrom_coverage_sample123_chr1.npz
+    |   |   |-- overlap_coverage_sample123_chr1.npy
+    |   |   |-- overlap_coverage_sample123_chr1_index.npz
+    |   |-- sample124
+    |   |   |-- chrom_coverage_sample124_chr1.npz
+    |   |   |-- overlap_coverage_sample124_chr1.npy
+    |   |   |-- overlap_coverage_sample124_chr1_index.npz
+
+    then for genes A, B with offsets [0, L1] the (2 x L1) coverage matrix of gene A is written to columns
+    [0, L1) of cov_file and the (2 x L2) coverage matrix of gene B is written to columns [L1, L1 + L2).
+
+    :param data_dir: str path of directory containing RNA-Seq sample ID subdirectories.
+    :param sample_ids: list of str names RNA Seq samples, i.e. basenames of various alignment files.
+    :param chrom: str chromosome name
+    :param exon_index: gene_processing.ExonIndex of (at least) the chromosome's genes in genes.
+    :param genes: list of str genes to merge
+    :param offsets: list of int column offsets of genes' coverage matrices within cov_file, aligned with genes
+    :param overlap_genes: set of str genes whose coverage comes from overlap gene coverage stores.
+    :param cov_file: str path to a preallocated (p x sum(Li)) .npy file, see merge_coverage. Coverage is
+    stored in the data type of cov_file.
+    :return: dictionary with keys 'genes' (list of str genes merged), 'max' and 'sum' ((n genes x p samples)
+    numpy arrays of per-sample maximum and total coverage).
+    """
+    n_samples = len(sample_ids)
+    offset_dict = dict(zip(genes, offsets))
+    gene_idx = dict(zip(genes, range(len(genes))))
+    cov_max = np.zeros([len(genes), n_samples])
+    cov_sum = np.zeros([len(genes), n_samples])
+    cov_mat = np.load(cov_file
+                      , mmap_mode='r+')
+
+    # ------------------------------------------------------------------ #
+    # isolated genes: slice chromosome coverage vectors.
+    # ------------------------------------------------------------------ #
+    iso_genes = [gene for gene in genes if gene not in overlap_genes]
+    if iso_genes:
 
         # determine gene span: we only need a subset of the chromosome's coverage for current gene subset,
         # so grab the gene subset's starting and ending position on the transcript (0-indexed).
-        start_pos = int(sub_chrom_exon_df.gene_start.min() - 1)
-        end_pos = int(sub_chrom_exon_df.gene_end.max())
-
-        # load up gene span's coverage matrix.
-        idx = 0
-        for npz_file in npz_files:
+        start_pos, end_pos = exon_index.gene_span(iso_genes)
+        start_pos -= 1
+
+        # load up gene span's dense (p x span) coverage matrix. In case there is no stored
+        # chromosome coverage array (e.g. if whole chrom was not read), leave sample's coverage as zeroes.
+        span_mat = np.zeros([n_samples, end_pos - start_pos]
+                            , dtype=cov_mat.dtype)
+        for i in range(n_samples):
+            npz_file = os.path.join(data_dir
+                                    , sample_ids[i]
+                                    , 'chrom_coverage_{0}_{1}.npz'.format(sample_ids[i], chrom))
 
-            # try loading the gene span of a sample's compressed sparse row chromosome coverage array.
             if os.path.isfile(npz_file):
-                cov_vec_sp = sparse.load_npz(npz_file).transpose()[start_pos:end_pos, :]
-
-            # in case there is no stored chromosome coverage array (e.g. if whole chrom was not read),
-            # create (len(chrom) x 1) csr matrix of zeros.
-            else:
-                if verbose and i == 0:
-                    logging.info('CHR {0} -- nonexistent chromosome coverage file {1} (imputing zeroes).'
-                                 .format(chrom, npz_file))
-
-                cov_vec_sp = sparse.csr_matrix(((end_pos - start_pos), 1)
-                                               , dtype=int)
-
-            # initialize tall coverage matrix (len(chrom) x p) with copy of first experiment's coverage array.
-            if idx == 0:
-                cov_mat = cov_vec_sp.copy()
-
-            # column-append sparse coverage vector to existing coverage matrix.
-            else:
-                cov_mat = sparse.hstack([cov_mat, cov_vec_sp]
-                                        , dtype=int)
-
-            idx += 1
-
-        # clean up coverage array data.
-        del cov_vec_sp
-        gc.collect()
-
-        # convert coverage matrix to dense matrix for speed in splicing,
-        # should blow up coverage matrix size to about 500Mb, on average.
-        cov_mat = cov_mat.asfptype().todense()
-
-        # tear out each gene's coverage matrix from loaded chromosome coverage sub-matrix.
-        for ii in range(len(sub_genes)):
-
-            gene = sub_genes[ii]
-
-            # subset chromosome's gene/exon data to a single gene and
-            # identify gene's start and end positions.
-            single_gene_df = sub_chrom_exon_df[sub_chrom_exon_df.gene == gene]
-
-            # Slice up cov_mat based on relative exon positions within a gene while remembering to
-            # shift starts and ends based on the start position of the current gene span.
-            # Coverage vectors are 0-indexed so take off 1 from 1-indexed gene positions,
-            # but remembering to include exon end positions.
-            e_starts, e_ends = single_gene_df.start.values - start_pos - 1, single_gene_df.end.values - start_pos
-            slicing = [np.arange(e_starts[j], e_ends[j]) for j in range(len(e_starts))]
-
-            # in case exons are overlapping, take union of their covered regions.
-            slicing = np.unique(flatten_2d(slicing))
-
-            # Save transposed coverage matrix so that shape is p x Li.
-            gene_cov_dict[gene] = np.array(cov_mat[slicing, :].T).astype(np.float_)
-
-            if use_pbar:
-                if (gene_idx % pbar_step_size == 0) and (gene_idx > 0):
-                    pbar.update(10)
-                    gene_idx += 1
-
-    # close progress bar if using one.
-    if use_pbar:
-        pbar.close()
-
-    # free up memory allocation for dense coverage matrix, exon data subset.
-    del cov_mat, sub_chrom_exon_df
+                cov_vec = sparse.load_npz(npz_file)[:, start_pos:end_pos].toarray().ravel()
+                span_mat[i, :len(cov_vec)] = cov_vec
+
+        # tear out each gene's coverage matrix from chromosome coverage sub-matrix.
+        for gene in iso_genes:
+
+            # Slice up span_mat based on the gene's (0-indexed) transcript positions, i.e. the union of
+            # its exons' positions, shifted by the start position of the current gene span.
+            slicing = exon_index.transcript_positions(gene) - start_pos
+
+            offset = offset_dict[gene]
+            gene_cov_mat = span_mat[:, slicing]
+            cov_mat[:, offset:(offset + len(slicing))] = gene_cov_mat
+
+            # summarize gene's coverage matrix while it's in memory.
+            cov_max[gene_idx[gene], :] = gene_cov_mat.max(axis=1)
+            cov_sum[gene_idx[gene], :] = gene_cov_mat.sum(axis=1, dtype=np.float_)
+
+        del span_mat
+
+    # ------------------------------------------------------------------ #
+    # overlap genes: bulk copy from overlap gene coverage stores.
+    # ------------------------------------------------------------------ #
+    ol_genes = [gene for gene in genes if gene in overlap_genes]
+    if ol_genes:
+        for i in range(n_samples):
+            cov_stem = os.path.join(data_dir
+                                    , sample_ids[i]
+                                    , 'overlap_coverage_{0}_{1}'.format(sample_ids[i], chrom))
+            ol_genes_idx, ol_offsets = load_coverage_index(cov_stem)
+            ol_offset_dict = dict(zip(ol_genes_idx.tolist(), ol_offsets[:-1].tolist()))
+            ol_len_dict = dict(zip(ol_genes_idx.tolist(), np.diff(ol_offsets).tolist()))
+            ol_cov_vec = np.load(coverage_array_files(cov_stem)[0]
+                                 , mmap_mode='r')
+
+            for gene in ol_genes:
+                if gene not in ol_offset_dict:
+                    raise ValueError('gene {0} missing from overlap gene coverage for sample {1}, chromosome {2}.'
+                                     .format(gene, sample_ids[i], chrom))
+
+                offset, ol_offset, ol_len = offset_dict[gene], ol_offset_dict[gene], ol_len_dict[gene]
+                gene_cov_vec = ol_cov_vec[ol_offset:(ol_offset + ol_len)]
+                cov_mat[i, offset:(offset + ol_len)] = gene_cov_vec
+
+                # summarize sample's coverage of gene.
+                cov_max[gene_idx[gene], i] = gene_cov_vec.max()
+                cov_sum[gene_idx[gene], i] = gene_cov_vec.sum(dtype=np.float_)
+
+            del ol_cov_vec
+
+    # push this gene group's coverage matrices to disk.
+    cov_mat.flush()
+    del cov_mat
     gc.collect()
 
-    if verbose:
-        logging.info('CHR {0} -- obtained {1} coverage matrices.'
-                     .format(chrom, len(gene_cov_dict)))
-
-    return gene_cov_dict
+    return {'genes': genes
+            , 'max': cov_max
+            , 'sum': cov_sum}
 
 
 def merge_coverage(data_dir, sample_ids, exon_df, n_jobs=1,
-                   output_dir=None, verbose=True):
+                   output_dir=None, compact=False, exon_index=None, verbose=True):
     """
     For each chromosome, load the coverage arrays resulting from each alignment file, join them,
-    and then slice the joined coverage array into per-gene coverage matrices. Run process in parallel over
-    chromosomes with the n_jobs argument.
+    and then slice the joined coverage array into per-gene coverage matrices.
+
+    Each chromosome's per-gene coverage matrices are stored side by side in one (p x sum(Li)) coverage matrix
+    store (see utils.save_coverage_arrays) that is preallocated on disk. Groups of genes from all chromosomes
+    are merged in parallel worker processes with the n_jobs argument, each writing to its own genes' columns.
+
+    Coverage matrices are float64 by default. With compact=True, each chromosome's coverage matrices are
+    stored in the smallest unsigned integer data type that holds the chromosome's maximum coverage
+    (see utils.smallest_uint_dtype), e.g. uint16, which cuts coverage memory and disk usage by 2-8x.
 
     Example output:
 
-    {('gene A'): <L1 x 2 coverage array>,
-     ('gene B'): <L2 x 2 coverage array>,
+    {('gene A'): <2 x L1 coverage array>,
+     ('gene B'): <2 x L2 coverage array>,
      ...
-     ('gene N'): <LN x 2 coverage array>}
+     ('gene N'): <2 x LN coverage array>}
 
     :param data_dir: str directory containing subdirectories named after the alignment sample IDs in sample_ids
-    list, each containing files named `overlap_coverage_<sample ID>_<chromosome>.pkl` and
-    `chrom_coverage_<sample ID>_<chromosome>.npz`.
+    list, each containing files named `overlap_coverage_<sample ID>_<chromosome>.npy`,
+    `overlap_coverage_<sample ID>_<chromosome>_index.npz` and `chrom_coverage_<sample ID>_<chromosome>.npz`.
     :param sample_ids: list of str names RNA Seq samples, i.e. basenames of various alignment files.
     :param exon_df: pandas.DataFrame outlining exon positions for an entire genome; has columns 'chr',
     'start' (exon start), 'end' (exon end), 'gene' (gene name), 'gene_end', and 'gene_start'
-    :param n_jobs: int number of cores used for distributing gene coverage merge process over different chromosomes.
-    :param output_dir: str (optional) if specified, save chromosome gene coverage matrix dictionaries
-     to serialized .pkl files of the form `<output_dir>/<chromosome>/coverage_matrices_<chromosome>.pkl`
+    :param n_jobs: int number of processes used for distributing gene coverage merge process over chromosomes
+    and groups of genes. Groups of genes are sized so that each process loads at most ~500Mb of dense coverage,
+    less if n_jobs processes would exceed half of the memory available to DegNorm (see utils.available_memory).
+    :param output_dir: str (optional) if specified, save chromosome gene coverage matrices to files
+    `<output_dir>/<chromosome>/coverage_matrices_<chromosome>.npy` and
+    `<output_dir>/<chromosome>/coverage_matrices_<chromosome>_index.npz`. Otherwise, coverage matrices are
+    merged in a temporary directory within data_dir.
+    :param compact: bool indicator should coverage matrices be stored in a compact unsigned integer data type?
+    :param exon_index: (optional) dictionary of {chromosome: gene_processing.ExonIndex} pairs,
+    see gene_processing.build_exon_index. Built from exon_df if not supplied.
     :param verbose: bool indicator should progress be written with logger?
-    :return: OrderedDict of the form {gene: 2-d numpy coverage array} for all genes present in exon_df.
+    :return: tuple (OrderedDict of the form {gene: 2-d numpy coverage array} for all genes present in exon_df,
+    pandas.DataFrame of per-gene coverage summary statistics in the same gene order, see gene_coverage_stats).
+    Summary statistics are also saved to each chromosome's coverage matrix index, see load_coverage_stats.
     """
     chroms = exon_df.chr.unique()
     gene_cov_dict = OrderedDict()
 
-    # get list of gene coverage matrix dictionaries from joining chromosome-wide coverage arrays.
-    chrom_gene_cov_dicts = Parallel(n_jobs=min(n_jobs, len(chroms))
-                              , verbose=0
-                              , backend='threading')(delayed(merge_chrom_coverage)(
-        data_dir=data_dir,
-        sample_ids=sample_ids,
-        chrom_exon_df=subset_to_chrom(exon_df, chrom=chrom),
-        verbose=verbose) for chrom in chroms)
-
-    # get list of gene coverage matrix dictionaries upon joining gene coverage arrays for genes in overlapping groups.
-    if verbose:
-        logging.info('Joining overlapping genes\' coverage vectors into coverage matrices.')
-
-    overlap_gene_cov_dicts = Parallel(n_jobs=min(n_jobs, len(chroms))
-                                      , verbose=0
-                                      , backend='threading')(delayed(merge_overlap_gene_coverage)(
-        data_dir=data_dir,
-        sample_ids=sample_ids,
-        chrom=chrom) for chrom in chroms)
-
-    # (1) concatenate chromosome coverage dictionaries into one ordered dictionary.
-    # (2) for each chromosome, save gene coverage matrices to .pkl file in per-chromosome subdirectories.
-    for i in range(len(chroms)):
-
-        chrom = chroms[i]
-
-        # concatenate coverage matrices from different sources (isolated or gene overlap genes).
-        chrom_cov_dict = {**chrom_gene_cov_dicts[i], **overlap_gene_cov_dicts[i]}
-
-        # move chromosome's gene coverage matrices into overall gene coverage matrix storage.
-        for gene in chrom_cov_dict:
-            gene_cov_dict[gene] = chrom_cov_dict[gene]
-
-        # save {gene: coverage matrix} dictionary data per chromosome,
-        # in a new directory named after the chromosome.
-        if output_dir:
-            save_dir = os.path.join(output_dir, str(chrom))
-
-            if not os.path.isdir(save_dir):
-                os.makedirs(save_dir)
-
-            # save per-gene coverage matrices to .pkl file, one .pkl file per chromosome.
-            chrom_cov_file = os.path.join(save_dir, 'coverage_matrices_{0}.pkl'.format(chrom))
-            if verbose:
-                logging.info('CHR {0} -- saving coverage matrices to {1}'
-                             .format(chrom, chrom_cov_file))
-
-            with open(chrom_cov_file, 'wb') as f:
-                pkl.dump(chrom_cov_dict, f)
-
-    del chrom_gene_cov_dicts, overlap_gene_cov_dicts, chrom_cov_dict
-    gc.collect()
+    if exon_index is None:
+        exon_index = build_exon_index(exon_df)
+    stats_df_list = list()
+
+    save_root = output_dir
+    if not output_dir:
+        save_root = tempfile.mkdtemp(dir=data_dir)
+
+    # split available memory across merge worker processes.
+    mem_budget = worker_memory_budget(n_jobs
+                                      , max_bytes=500e6)
+
+    # (1) lay out and preallocate each chromosome's coverage matrix store, then
+    # (2) break each chromosome's genes into merge tasks.
+    chrom_stems = list()
+    tasks = list()
+    task_chroms = list()
+    for chrom in chroms:
+        chrom_exon_df = subset_to_chrom(exon_df, chrom=chrom)
+        layout = chrom_merge_layout(data_dir
+                                    , sample_ids=sample_ids
+                                    , chrom_exon_df=chrom_exon_df
+                                    , exon_index=exon_index[chrom]
+                                    , compact=compact
+                                    , mem_budget=mem_budget
+                                    , verbose=verbose)
+        genes, lengths = layout['genes'], layout['lengths']
+        cov_dtype = smallest_uint_dtype(layout['max_coverage']) if compact else np.dtype(np.float_)
+
+        if len(genes) == 0:
+            continue
 
-    return gene_cov_dict
+        if verbose:
+            logging.info('CHR {0} -- begin coverage matrix processing. \n'
+                         'Using {1} gene splits for memory efficiency, storing coverage as {2}.'
+                         .format(chrom, len(layout['gene_splits']) - 1, cov_dtype.name))
+
+        save_dir = os.path.join(save_root, str(chrom))
+        if not os.path.isdir(save_dir):
+            os.makedirs(save_dir)
+
+        # preallocate chromosome's (p x sum(Li)) coverage matrix on disk, along with its gene offset index.
+        chrom_stem = os.path.join(save_dir, 'coverage_matrices_{0}'.format(chrom))
+        cov_file, index_file = coverage_array_files(chrom_stem)
+        offsets = np.zeros(len(genes) + 1
+                           , dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+
+        cov_mat = np.lib.format.open_memmap(cov_file
+                                            , mode='w+'
+                                            , dtype=cov_dtype
+                                            , shape=(len(sample_ids), int(offsets[-1])))
+        del cov_mat
+        np.savez(index_file
+                 , genes=np.array(genes, dtype=str)
+                 , offsets=offsets)
+        chrom_stems.append((chrom, chrom_stem, cov_dtype))
+
+        gene_splits = layout['gene_splits']
+        for i in range(len(gene_splits) - 1):
+            sub_genes = genes[gene_splits[i]:gene_splits[i + 1]].tolist()
+            tasks.append(delayed(merge_chrom_coverage)(
+                data_dir=data_dir,
+                sample_ids=sample_ids,
+                chrom=chrom,
+                exon_index=exon_index[chrom],
+                genes=sub_genes,
+                offsets=offsets[gene_splits[i]:gene_splits[i + 1]].tolist(),
+                overlap_genes=layout['overlap_genes'].intersection(sub_genes),
+                cov_file=cov_file))
+            task_chroms.append(chrom)
+
+    # run merge tasks in worker processes; each task writes disjoint columns of a coverage matrix store.
+    task_stats = Parallel(n_jobs=max(1, min(n_jobs, len(tasks)))
+                          , verbose=0
+                          , backend='loky')(tasks)
+
+    # (3) gather merge tasks' per-gene summary statistics, save them to chromosome's coverage matrix index, and
+    # (4) concatenate chromosome coverage dictionaries into one ordered dictionary.
+    for chrom, chrom_stem, cov_dtype in chrom_stems:
+        genes, offsets = load_coverage_index(chrom_stem)
+        gene_idx = dict(zip(genes.tolist(), range(len(genes))))
+        cov_max = np.zeros([len(genes), len(sample_ids)])
+        cov_sum = np.zeros([len(genes), len(sample_ids)])
+
+        for i in [ii for ii in range(len(tasks)) if task_chroms[ii] == chrom]:
+            row_idx = [gene_idx[gene] for gene in task_stats[i]['genes']]
+            cov_max[row_idx, :] = task_stats[i]['max']
+            cov_sum[row_idx, :] = task_stats[i]['sum']
+
+        np.savez(coverage_array_files(chrom_stem)[1]
+                 , genes=genes
+                 , offsets=offsets
+                 , max=cov_max
+                 , sum=cov_sum)
+        stats_df_list.append(gene_coverage_stats(genes
+                                                 , lengths=np.diff(offsets)
+                                                 , cov_max=cov_max
+                                                 , cov_sum=cov_sum
+                                                 , sample_ids=sample_ids
+                                                 , itemsize=cov_dtype.itemsize))
+
+        chrom_cov_dict = load_coverage_arrays(chrom_stem)
+
+        if verbose:
+            logging.info('CHR {0} -- obtained {1} coverage matrices.'
+                         .format(chrom, len(chrom_cov_dict)))
+
+            if output_dir:
+                logging.info('CHR {0} -- saved coverage matrices to {1}'
+                             .format(chrom, coverage_array_files(chrom_stem)[0]))
+
+        gene_cov_dict.update(chrom_cov_dict)
+
+    if not output_dir:
+        shutil.rmtree(save_root)
+
+    # vertically stack chromosomes' summary statistics.
+    if stats_df_list:
+        cov_stats_df = concat(stats_df_list).reset_index(drop=True)
+    else:
+        cov_stats_df = gene_coverage_stats([]
+                                           , lengths=[]
+                                           , cov_max=np.zeros([0, len(sample_ids)])
+                                           , cov_sum=np.zeros([0, len(sample_ids)])
+                                           , sample_ids=sample_ids)
+
+    gc.collect()
 
+    return gene_cov_dict, cov_stats_df
@@ -1,7 +1,6 @@
-import pkg_resources
 import subprocess
 from degnorm.data_access import *
-from degnorm.utils import find_software
+from degnorm.utils import find_software, resource_path
 from pandas import DataFrame
 from jinja2 import Environment, FileSystemLoader
 
@@ -57,6 +56,7 @@ def render_report(data_dir, degnorm_data, bam_files,
                                               , save_dir=report_dir
                                               , figsize=[12, 8])
     else:
+        plt, sns = load_pyplot()
         with sns.axes_style('darkgrid'):
             fig = plt.figure(figsize=[10, 12])
             fig.suptitle('Degradation index scores by sample')
@@ -117,7 +117,7 @@ def render_report(data_dir, degnorm_data, bam_files,
     # ---------------------------------------------------------------------------- #
 
     # load report template from degnorm package resources.
-    resources_dir = pkg_resources.resource_filename('degnorm', 'resources')
+    resources_dir = resource_path()
     env = Environment(loader=FileSystemLoader(resources_dir))
     template = env.get_template('degnorm_report.html')
 
@@ -1,7 +1,6 @@
 import argparse
 import os
 import pytest
-import pkg_resources
 
 
 def parse_args():
@@ -31,7 +30,7 @@ def main():
 
     # run existing unit tests.
     print('RUNNING DegNorm TESTS...')
-    tests_dir = pkg_resources.resource_filename('degnorm', 'tests')
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
     pytest.main(['-x', tests_dir])
 
 
@@ -0,0 +1,107 @@
+import pytest
+import os
+import numpy as np
+from pandas import DataFrame
+from degnorm.gene_processing import build_exon_index, get_gene_overlap_structure
+from degnorm.dry_run import *
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ----------------------------------------------------- #
+# degnorm.dry_run tests
+# ----------------------------------------------------- #
+@pytest.fixture
+def dry_run_setup():
+    exon_df = DataFrame({'chr': ['chr1'] * 4 + ['chr2'] * 2
+                         , 'gene': ['A', 'A', 'B', 'C', 'D', 'E']
+                         , 'start': [101, 301, 351, 5001, 101, 20001]
+                         , 'end': [200, 500, 1000, 9000, 3000, 25000]
+                         , 'gene_start': [101, 101, 351, 5001, 101, 20001]
+                         , 'gene_end': [500, 500, 1000, 9000, 3000, 25000]})
+    genes_df = exon_df[['chr', 'gene', 'gene_start', 'gene_end']].drop_duplicates()
+    gene_overlap_dict = {chrom: get_gene_overlap_structure(genes_df[genes_df.chr == chrom])
+                         for chrom in ['chr1', 'chr2']}
+    read_stats = {'sample{0}'.format(i): DataFrame({'chr': ['chr1', 'chr2', 'chrM']
+                                                    , 'length': [1000000, 500000, 16000]
+                                                    , 'reads': [20000 * (i + 1), 5000, 100]}) for i in range(3)}
+
+    return read_stats, build_exon_index(exon_df), gene_overlap_dict
+
+
+def test_estimate_resources(dry_run_setup):
+    read_stats, exon_index, gene_overlap_dict = dry_run_setup
+    estimates_df = estimate_resources(read_stats
+                                      , exon_index=exon_index
+                                      , gene_overlap_dict=gene_overlap_dict)
+    assert estimates_df.stage.tolist() == ['coverage and read counts', 'coverage merge', 'NMF-OA']
+    assert np.all(estimates_df.runtime_seconds > 0)
+    assert np.all(estimates_df.peak_memory_bytes > COST_MODEL['base_bytes'])
+
+    # NMF-OA runtime scales with the number of DegNorm and NMF-OA iterations, and drops with more processes.
+    longer_df = estimate_resources(read_stats
+                                   , exon_index=exon_index
+                                   , gene_overlap_dict=gene_overlap_dict
+                                   , degnorm_iter=10
+                                   , nmf_iter=200)
+    assert np.isclose(longer_df.runtime_seconds.iloc[2], 4 * estimates_df.runtime_seconds.iloc[2])
+
+    parallel_df = estimate_resources(read_stats
+                                     , exon_index=exon_index
+                                     , gene_overlap_dict=gene_overlap_dict
+                                     , n_jobs=4)
+    assert np.all(parallel_df.runtime_seconds <= estimates_df.runtime_seconds)
+
+    # downsampling, skipping baseline selection and compact coverage only ever reduce costs.
+    cheap_df = estimate_resources(read_stats
+                                  , exon_index=exon_index
+                                  , gene_overlap_dict=gene_overlap_dict
+                                  , downsample_rate=5
+                                  , skip_baseline_selection=True
+                                  , compact=True)
+    assert np.all(cheap_df.runtime_seconds <= estimates_df.runtime_seconds)
+    assert np.all(cheap_df.peak_memory_bytes <= estimates_df.peak_memory_bytes)
+
+
+def test_recommend_layout(dry_run_setup):
+    read_stats, exon_index, gene_overlap_dict = dry_run_setup
+    n_jobs, estimates_df = recommend_layout(read_stats
+                                            , exon_index=exon_index
+                                            , gene_overlap_dict=gene_overlap_dict
+                                            , max_jobs=8)
+    assert n_jobs == 8
+
+    # with limited memory, fewer processes are recommended so that peak memory fits.
+    memory = estimate_resources(read_stats
+                                , exon_index=exon_index
+                                , gene_overlap_dict=gene_overlap_dict
+                                , n_jobs=4).peak_memory_bytes.max() / 0.8
+    n_jobs, estimates_df = recommend_layout(read_stats
+                                            , exon_index=exon_index
+                                            , gene_overlap_dict=gene_overlap_dict
+                                            , max_jobs=8
+                                            , memory=memory)
+    assert n_jobs == 4
+    assert estimates_df.peak_memory_bytes.max() <= 0.8 * memory
+
+
+def test_bam_read_stats():
+    bam_file = os.path.join(THIS_DIR, 'data', 'hg_small_1.bam')
+    bai_file = os.path.join(THIS_DIR, 'data', 'hg_small_1.bai')
+    stats_df = bam_read_stats(bam_file
+                              , index_file=bai_file)
+    assert stats_df.columns.tolist() == ['chr', 'length', 'reads']
+    assert stats_df.reads.sum() > 0
+
+    # without an index file, read counts are estimated from the .bam file size.
+    estimated_df = bam_read_stats(bam_file)
+    assert estimated_df.chr.tolist() == stats_df.chr.tolist()
+    assert estimated_df.reads.sum() > 0
+
+
+def test_format_units():
+    assert format_bytes(512) == '512.0 B'
+    assert format_bytes(1.5 * 1024 ** 3) == '1.5 GB'
+    assert format_seconds(59) == '59s'
+    assert format_seconds(125) == '2m 05s'
+    assert format_seconds(7500) == '2h 05m'
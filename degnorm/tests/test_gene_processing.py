@@ -1,7 +1,8 @@
 import pytest
 import os
+import numpy as np
 from pandas import DataFrame
-from degnorm.gene_processing import GeneAnnotationProcessor, get_gene_overlap_structure
+from degnorm.gene_processing import *
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -30,6 +31,22 @@ def test_gtf_processor_run(gene_processor_setup):
     assert all([col in exons_df.columns.tolist() for col in reqd_cols])
 
 
+def test_gtf_processor_outline():
+    exons_df = DataFrame({'chr': ['chr1', 'chr2', 'chr1', 'chr2', 'chr1']
+                          , 'gene': ['A', 'B', 'A', 'B', 'C']
+                          , 'start': [100, 500, 50, 700, 10]
+                          , 'end': [200, 550, 80, 900, 20]})
+    outlined_df = GeneAnnotationProcessor.outline_exons(exons_df)
+    gene_df = GeneAnnotationProcessor.gene_outline(exons_df)
+
+    # exon order is preserved, and gene outlines agree with the per-gene outline table.
+    assert outlined_df[['chr', 'gene', 'start', 'end']].equals(exons_df)
+    assert outlined_df.gene_start.tolist() == [50, 500, 50, 500, 10]
+    assert outlined_df.gene_end.tolist() == [200, 900, 200, 900, 20]
+    assert outlined_df[['chr', 'gene', 'gene_start', 'gene_end']].drop_duplicates() \
+        .sort_values(['chr', 'gene']).reset_index(drop=True).equals(gene_df)
+
+
 # ----------------------------------------------------- #
 # Other degnorm.gene_processing function tests
 # ----------------------------------------------------- #
@@ -45,3 +62,85 @@ def test_get_gene_overlap_structure():
     assert len(gene_overlap_dat['overlap_genes']) == 1
     assert len(set(gene_overlap_dat['overlap_genes'][0]) - {'A', 'B', 'C'}) == 0
     assert len(set(gene_overlap_dat['isolated_genes']) - {'D'}) == 0
+
+
+def test_get_gene_overlap_structure_random():
+    rng = np.random.RandomState(123)
+    n_genes = 200
+    gene_starts = rng.randint(1, 20000, size=n_genes)
+    genes_df = DataFrame({'gene': ['GENE' + str(i) for i in range(n_genes)]
+                          , 'gene_start': gene_starts
+                          , 'gene_end': gene_starts + rng.randint(0, 300, size=n_genes)
+                          , 'chr': ['chr1'] * n_genes})
+    gene_overlap_dat = get_gene_overlap_structure(genes_df)
+
+    # brute force: group genes by repeatedly merging groups containing pairwise overlapping genes.
+    starts, ends = genes_df.gene_start.values, genes_df.gene_end.values
+    overlap = (starts[:, None] <= ends[None, :]) & (starts[None, :] <= ends[:, None])
+    group = np.arange(n_genes)
+    for _ in range(n_genes):
+        new_group = np.array([group[overlap[i]].min() for i in range(n_genes)])
+        if np.array_equal(new_group, group):
+            break
+        group = new_group
+
+    expected_groups = [set(genes_df.gene.values[group == g]) for g in np.unique(group)]
+    assert sorted(map(sorted, gene_overlap_dat['overlap_genes'])) == \
+        sorted([sorted(x) for x in expected_groups if len(x) > 1])
+    assert sorted(gene_overlap_dat['isolated_genes']) == sorted([list(x)[0] for x in expected_groups if len(x) == 1])
+
+
+def test_exon_index():
+    exon_df = DataFrame({'chr': ['chr1'] * 5
+                         , 'gene': ['GENE_1', 'GENE_1', 'GENE_1', 'GENE_2', 'GENE_2']
+                         , 'start': [9, 1, 5, 100, 300]
+                         , 'end': [20, 10, 8, 199, 300]
+                         , 'gene_start': [1, 1, 1, 100, 100]
+                         , 'gene_end': [20, 20, 20, 300, 300]})
+    exon_index = build_exon_index(exon_df)['chr1']
+
+    assert exon_index.genes.tolist() == ['GENE_1', 'GENE_2']
+    assert exon_index.lengths.tolist() == [20, 101]
+    assert exon_index.gene_span(['GENE_1', 'GENE_2']) == (1, 300)
+
+    # exon bounds are 0-indexed, with starts and ends sorted separately.
+    assert exon_index.gene_exon_bounds('GENE_1').tolist() == [[0, 8], [4, 10], [8, 20]]
+
+    # exon unions are 0-indexed, half-open intervals.
+    assert exon_index.gene_exon_unions('GENE_1').tolist() == [[0, 20]]
+    assert exon_index.gene_exon_unions('GENE_2').tolist() == [[99, 199], [299, 300]]
+    assert exon_index.transcript_positions('GENE_2').tolist() == list(range(99, 199)) + [299]
+
+
+# ----------------------------------------------------- #
+# Annotation cache tests
+# ----------------------------------------------------- #
+def test_annotation_cache(gene_processor_setup, tmpdir):
+    gtf_file = gene_processor_setup.filename
+    cache_dir = os.path.join(str(tmpdir), 'cache')
+    cache_file = annotation_cache_file(gtf_file
+                                       , chroms=['chr1', 'chr2']
+                                       , cache_dir=cache_dir)
+
+    # cache key depends on the chromosome set, not its order.
+    assert cache_file == annotation_cache_file(gtf_file
+                                               , chroms=['chr2', 'chr1']
+                                               , cache_dir=cache_dir)
+    assert cache_file != annotation_cache_file(gtf_file
+                                               , chroms=['chr1']
+                                               , cache_dir=cache_dir)
+    assert load_annotation_cache(cache_file) is None
+
+    exon_df = gene_processor_setup.run()
+    genes_df = exon_df[['chr', 'gene', 'gene_start', 'gene_end']].drop_duplicates().reset_index(drop=True)
+    save_annotation_cache(cache_file
+                          , annotation_dat={'chroms': ['chr1']
+                                            , 'exon_df': exon_df
+                                            , 'genes_df': genes_df
+                                            , 'gene_overlap_dict': {'chr1': get_gene_overlap_structure(genes_df)}})
+
+    annotation_dat = load_annotation_cache(cache_file)
+    assert annotation_dat['chroms'] == ['chr1']
+    assert annotation_dat['exon_df'].equals(exon_df)
+    assert annotation_dat['genes_df'].equals(genes_df)
+    assert annotation_dat['gene_overlap_dict'] == {'chr1': get_gene_overlap_structure(genes_df)}
@@ -0,0 +1,103 @@
+import pytest
+import numpy as np
+from degnorm.intervals import *
+
+
+# ----------------------------------------------------- #
+# reference implementations: loop over intervals.
+# ----------------------------------------------------- #
+def covered_positions(intervals):
+    """
+    :param intervals: iterable of half-open (start, end) intervals
+    :return: sorted list of int positions covered by at least one interval.
+    """
+    return sorted(set([i for start, end in intervals for i in range(start, end)]))
+
+
+def random_intervals(rng, n, max_pos=200, max_len=25):
+    starts = rng.randint(0, max_pos, size=n)
+    return starts, starts + rng.randint(-3, max_len, size=n)
+
+
+# ----------------------------------------------------- #
+# degnorm.intervals property tests
+# ----------------------------------------------------- #
+def test_expand_intervals():
+    assert expand_intervals([10, 20], [13, 24]).tolist() == [10, 11, 12, 20, 21, 22, 23]
+    assert expand_intervals([], []).tolist() == []
+
+    rng = np.random.RandomState(123)
+    for _ in range(200):
+        starts, ends = random_intervals(rng, n=rng.randint(0, 10))
+        expected = [i for start, end in zip(starts, ends) for i in range(start, end)]
+        assert expand_intervals(starts, ends).tolist() == expected
+
+
+def test_fill_in_bounds_random():
+    rng = np.random.RandomState(123)
+    for _ in range(200):
+        starts, ends = random_intervals(rng, n=rng.randint(1, 10))
+        bounds_vec = np.column_stack([starts, ends]).ravel()
+
+        for endpoint in [False, True]:
+            expected = np.concatenate([np.arange(bounds_vec[j - 1], bounds_vec[j] + int(endpoint))
+                                       for j in np.arange(1, len(bounds_vec), step=2)])
+            assert np.array_equal(fill_in_bounds(bounds_vec, endpoint=endpoint), expected)
+
+    with pytest.raises(ValueError):
+        fill_in_bounds([10, 15, 40])
+
+
+def test_union_intervals():
+    unions = union_intervals([14590, 14563, 14640, 15000], [14640, 14600, 14700, 15010])
+    assert unions.tolist() == [[14563, 14700], [15000, 15010]]
+
+    rng = np.random.RandomState(123)
+    for _ in range(200):
+        starts, ends = random_intervals(rng, n=rng.randint(0, 15))
+        unions = union_intervals(starts, ends)
+
+        # unions are sorted, disjoint, non-adjacent and cover the same positions as the original intervals.
+        assert np.all(unions[:, 1] > unions[:, 0])
+        assert np.all(unions[1:, 0] > unions[:-1, 1])
+        assert covered_positions(unions) == covered_positions(zip(starts, ends))
+
+
+def test_union_intervals_groups():
+    rng = np.random.RandomState(123)
+    for _ in range(100):
+        n = rng.randint(1, 30)
+        starts, ends = random_intervals(rng, n=n)
+        groups = rng.randint(0, 4, size=n)
+        unions, union_groups = union_intervals(starts, ends, groups=groups)
+
+        assert np.all(np.diff(union_groups) >= 0)
+        for g in np.unique(groups):
+            assert np.array_equal(unions[union_groups == g]
+                                  , union_intervals(starts[groups == g], ends[groups == g]))
+
+
+def test_intersect_intervals():
+    assert intersect_intervals([[0, 10], [20, 30]], [[5, 25]]).tolist() == [[5, 10], [20, 25]]
+
+    rng = np.random.RandomState(123)
+    for _ in range(200):
+        x = union_intervals(*random_intervals(rng, n=rng.randint(0, 10)))
+        y = union_intervals(*random_intervals(rng, n=rng.randint(0, 10)))
+        intersections = intersect_intervals(x, y)
+
+        assert covered_positions(intersections) == \
+            sorted(set(covered_positions(x)) & set(covered_positions(y)))
+        assert np.all(intersections[1:, 0] >= intersections[:-1, 1])
+
+
+def test_contained_in():
+    rng = np.random.RandomState(123)
+    for _ in range(200):
+        unions = union_intervals(*random_intervals(rng, n=rng.randint(0, 10)))
+        starts, ends = random_intervals(rng, n=20, max_len=10)
+
+        # reference: an interval is contained if all of its positions are covered, cf. a 0/1 indicator vector.
+        covered = set(covered_positions(unions))
+        expected = [all([i in covered for i in range(start, end)]) for start, end in zip(starts, ends)]
+        assert contained_in(starts, ends, unions=unions).tolist() == expected
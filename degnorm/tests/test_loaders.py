@@ -1,6 +1,8 @@
 import pytest
 import os
-from pandas import DataFrame
+import gzip
+import shutil
+from pandas import DataFrame, Series
 from pysam.libcalignmentfile import AlignmentFile
 from degnorm.loaders import Loader, BamLoader, GeneAnnotationLoader
 
@@ -50,4 +52,24 @@ def test_gtf_data(gene_loader):
     reqd_cols = ['chr', 'start', 'end', 'gene']
     assert isinstance(gene_loader, DataFrame)
     assert not gene_loader.empty
-    assert all([col in gene_loader.columns.tolist() for col in reqd_cols])
\ No newline at end of file
+    assert all([col in gene_loader.columns.tolist() for col in reqd_cols])
+
+
+def test_gtf_gzip_data(gene_loader, tmpdir):
+    gtf_file = os.path.join(THIS_DIR, 'data', 'chr1_small.gtf')
+    gz_file = os.path.join(str(tmpdir), 'chr1_small.gtf.gz')
+    with open(gtf_file, 'rb') as f_in, gzip.open(gz_file, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+
+    gz_df = GeneAnnotationLoader(gz_file, chunksize=5).get_data()
+    assert gz_df.equals(gene_loader)
+
+
+def test_gtf_attributes_to_genes():
+    attributes = Series(['gene_id "DDX11L1"; gene_name "DDX11L1-2"; transcript_id "NR_046018";'
+                         , 'gene_id "WASH7P"; transcript_id "NR_024540";'
+                         , 'transcript_id "NR_024540";'])
+    genes = GeneAnnotationLoader._attributes_to_genes(attributes)
+
+    assert genes.iloc[:2].tolist() == ['DDX11L1-2', 'WASH7P']
+    assert genes.isnull().iloc[2]
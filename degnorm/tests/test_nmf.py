@@ -0,0 +1,186 @@
+import pytest
+import os
+import numpy as np
+from collections import OrderedDict
+from degnorm.nmf import GeneNMFOA
+from degnorm.nmf_kernel import NMF_MIN_ITER
+
+
+# ----------------------------------------------------- #
+# GeneNMFOA tests
+# ----------------------------------------------------- #
+@pytest.fixture
+def coverage_setup():
+    rng = np.random.RandomState(123)
+    envelope = np.abs(np.sin(np.linspace(0, 6, 1000))) + 0.2
+    degradation = np.linspace(1, 0.3, 1000) ** rng.uniform(0, 2, size=(4, 1))
+    return rng.poisson(30 * envelope * degradation).astype(np.float_)
+
+
+def test_nmf_early_stopping(coverage_setup):
+    x = coverage_setup
+
+    # without a tolerance, all iterations run.
+    est, n_iter = GeneNMFOA(nmf_iter=50).nmf(x
+                                             , return_n_iter=True)
+    assert n_iter == 50
+    assert np.array_equal(est, GeneNMFOA(nmf_iter=50).nmf(x))
+
+    # a loose tolerance stops after the minimum number of iterations, a tight tolerance matches the full run.
+    K, E, n_iter = GeneNMFOA(nmf_iter=50, nmf_tol=0.5).nmf(x
+                                                          , factors=True
+                                                          , return_n_iter=True)
+    assert n_iter == NMF_MIN_ITER
+    assert K.shape == (4, 1) and E.shape == (1, 1000)
+
+    # a realistic tolerance stops once x is over-approximated up to the tolerance, close to the full run.
+    est_full = GeneNMFOA(nmf_iter=100).nmf(x)
+    est_tol, n_iter = GeneNMFOA(nmf_iter=100, nmf_tol=0.05).nmf(x
+                                                                , return_n_iter=True)
+    assert NMF_MIN_ITER < n_iter < 100
+    assert (x - est_tol).max() <= 0.05 * x.max()
+    rho_full = 1 - x.sum(axis=1) / (est_full.sum(axis=1) + 1)
+    rho_tol = 1 - x.sum(axis=1) / (est_tol.sum(axis=1) + 1)
+    assert np.abs(rho_tol - rho_full).max() < 0.01
+
+    est_tol, n_iter = GeneNMFOA(nmf_iter=50, nmf_tol=1e-12).nmf(x
+                                                                , return_n_iter=True)
+    assert n_iter == 50
+    assert np.array_equal(est_tol, est)
+
+
+def test_baseline_selection_nmf_iterations(coverage_setup):
+    nmfoa = GeneNMFOA(nmf_iter=10)
+    nmfoa.p = coverage_setup.shape[0]
+    rho, estimate, ran_baseline_selection, n_iter = nmfoa.baseline_selection(coverage_setup)
+
+    # every NMF-OA fit runs nmf_iter iterations: one fit, plus one per dropped bin.
+    assert n_iter > 0 and n_iter % 10 == 0
+    assert estimate.shape == coverage_setup.shape
+    assert rho.shape == (coverage_setup.shape[0],)
+
+
+def test_processes_backend(coverage_setup, tmpdir):
+    rng = np.random.RandomState(42)
+    cov_dat = OrderedDict()
+    for i in range(6):
+        cov_dat['gene{0}'.format(i)] = coverage_setup[:, rng.randint(0, 500):][:, :rng.randint(200, 500)]
+
+    reads_dat = np.vstack([x.sum(axis=1) for x in cov_dat.values()]) / 100
+
+    os.environ['JOBLIB_TEMP_FOLDER'] = tmpdir.strpath
+    try:
+        est = GeneNMFOA(degnorm_iter=2, nmf_iter=10, n_jobs=2).run(cov_dat
+                                                                   , reads_dat=reads_dat)
+        nmfoa = GeneNMFOA(degnorm_iter=2, nmf_iter=10, n_jobs=2, backend='processes')
+        est_proc = nmfoa.run(cov_dat
+                             , reads_dat=reads_dat)
+
+    finally:
+        del os.environ['JOBLIB_TEMP_FOLDER']
+
+    # same results as the threading backend, and the memory-mapped arenas are cleaned up.
+    assert len(est_proc) == len(est)
+    for x, y in zip(est_proc, est):
+        np.testing.assert_allclose(x, y, rtol=1e-10)
+
+    assert nmfoa.arena_files is None
+    assert tmpdir.listdir() == []
+
+
+def test_baseline_selection_gram_downdates(coverage_setup):
+    # Gram matrices downdated as bins are dropped agree with solves that never use a Gram matrix.
+    nmfoa = GeneNMFOA(nmf_iter=10)
+    nmfoa.p = coverage_setup.shape[0]
+    nmfoa_lapack = GeneNMFOA(nmf_iter=10, rank_one_solver='lapack')
+    nmfoa_lapack.p = coverage_setup.shape[0]
+
+    rho, estimate, ran_baseline_selection, n_iter = nmfoa.baseline_selection(coverage_setup)
+    rho_lapack, estimate_lapack, _, n_iter_lapack = nmfoa_lapack.baseline_selection(coverage_setup)
+    assert ran_baseline_selection
+    assert n_iter == n_iter_lapack
+    np.testing.assert_allclose(rho, rho_lapack, rtol=1e-8)
+    np.testing.assert_allclose(estimate, estimate_lapack, rtol=1e-8)
+
+
+def test_baseline_selection_warm_start(coverage_setup):
+    # warm starting NMF-OA across bin drops cuts iterations when stopping early.
+    nmfoa = GeneNMFOA(nmf_iter=100, nmf_tol=0.05)
+    nmfoa.p = coverage_setup.shape[0]
+    nmfoa_warm = GeneNMFOA(nmf_iter=100, nmf_tol=0.05, nmf_warm_start=True)
+    nmfoa_warm.p = coverage_setup.shape[0]
+
+    rho, _, ran_baseline_selection, n_iter = nmfoa.baseline_selection(coverage_setup)
+    rho_warm, estimate_warm, ran_baseline_selection_warm, n_iter_warm = nmfoa_warm.baseline_selection(coverage_setup)
+    assert ran_baseline_selection and ran_baseline_selection_warm
+    assert n_iter_warm < n_iter
+    assert estimate_warm.shape == coverage_setup.shape
+    assert np.all((rho_warm >= 0) & (rho_warm < 1))
+
+    # warm starting only saves iterations by stopping early.
+    with pytest.raises(ValueError):
+        GeneNMFOA(nmf_warm_start=True)
+
+
+def test_baseline_selection_carry_state(coverage_setup):
+    nmfoa = GeneNMFOA(nmf_iter=100, nmf_tol=0.05, carry_state=True)
+    nmfoa.p = coverage_setup.shape[0]
+
+    # the first DegNorm iteration runs as without carried state, and fills in the state.
+    state = dict()
+    rho, _, ran_baseline_selection, n_iter = nmfoa.baseline_selection(coverage_setup
+                                                                      , state=state)
+    rho_fresh, _, _, n_iter_fresh = nmfoa.baseline_selection(coverage_setup)
+    assert ran_baseline_selection
+    assert n_iter == n_iter_fresh
+    assert np.array_equal(rho, rho_fresh)
+    assert set(state.keys()) == {'row_sums', 'start', 'final'}
+    assert len(state['final'][0]) < len(state['start'][0])
+
+    # a rescaled coverage matrix resumes from the carried state, at a fraction of the cost.
+    scale = np.array([1., 0.8, 1.25, 1.1]).reshape(-1, 1)
+    rho_carry, estimate_carry, ran_baseline_selection_carry, n_iter_carry = nmfoa.baseline_selection(coverage_setup * scale
+                                                                                                     , state=state)
+    assert ran_baseline_selection_carry
+    assert n_iter_carry < n_iter / 2
+    assert estimate_carry.shape == coverage_setup.shape
+    assert np.all((rho_carry >= 0) & (rho_carry < 1))
+
+    with pytest.raises(ValueError):
+        GeneNMFOA(carry_state=True, backend='processes')
+
+
+def test_carried_nmf_state(coverage_setup):
+    x = coverage_setup[:, :10]
+    K = x.mean(axis=1).reshape(-1, 1)
+    E = np.arange(1., 11.).reshape(1, -1)
+    lmbda = np.ones(x.shape)
+    row_scale = np.array([1., 2., 1., 0.5]).reshape(-1, 1)
+
+    # positions 0, 2 and 12 were not carried.
+    positions = np.array([0, 1, 2, 3, 5, 8, 12])
+    K_init, E_init, lmbda_init = GeneNMFOA.carried_nmf_state(x[:, :7] * row_scale
+                                                             , positions=positions
+                                                             , carried=(np.array([1, 3, 4, 5, 8]), K, E, lmbda)
+                                                             , row_scale=row_scale)
+    assert np.allclose(K_init, K * row_scale)
+    assert np.array_equal(E_init[0, [1, 3, 4, 5]], [1., 2., 4., 5.])
+    x_missing, K_missing = x[:, [0, 2, 6]] * row_scale, K * row_scale
+    assert np.allclose(E_init[0, [0, 2, 6]], (K_missing.T.dot(x_missing) / K_missing.T.dot(K_missing)).ravel())
+    assert np.array_equal(lmbda_init[:, [0, 2, 6]], np.zeros((4, 3)))
+    assert np.array_equal(lmbda_init[:, [1, 3, 4, 5]], np.ones((4, 4)) * row_scale)
+
+
+def test_mem_splits_compact_coverage():
+    # compact coverage matrices are split by the size of the float64 copies workers make, not their stored size.
+    rng = np.random.RandomState(42)
+    cov_dat = OrderedDict()
+    for i in range(6):
+        cov_dat['gene{0}'.format(i)] = rng.poisson(20, size=(4, 300000)).astype(np.uint8)
+
+    reads_dat = np.vstack([x.sum(axis=1) for x in cov_dat.values()]) / 100.
+
+    nmfoa = GeneNMFOA(degnorm_iter=1, nmf_iter=1, skip_baseline_selection=True)
+    nmfoa.run(cov_dat
+              , reads_dat=reads_dat)
+    assert nmfoa.mem_splits == int(np.ceil(6 * 4 * 300000 * 8 / 5e7))
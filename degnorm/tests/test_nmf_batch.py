@@ -0,0 +1,92 @@
+import pytest
+import numpy as np
+from degnorm.nmf import GeneNMFOA
+from degnorm.nmf_batch import *
+
+
+# ----------------------------------------------------- #
+# Batched NMF-OA tests
+# ----------------------------------------------------- #
+@pytest.fixture
+def coverage_setup():
+    rng = np.random.RandomState(321)
+    xs = list()
+    for length in rng.randint(50, 400, size=12):
+        envelope = np.abs(np.sin(np.linspace(0, 4, length))) + 0.2
+        degradation = np.linspace(1, 0.2, length) ** rng.uniform(0, 2, size=(4, 1))
+        xs.append(rng.poisson(30 * envelope * degradation).astype(np.float_))
+
+    return xs
+
+
+def test_length_buckets():
+    lengths = np.array([100, 520, 110, 500, 124, 126, 90])
+    buckets = length_buckets(lengths
+                             , p=4
+                             , max_pad=1.25
+                             , max_bytes=1e6)
+
+    # every matrix lands in exactly one bucket.
+    assert sorted(np.concatenate(buckets).tolist()) == list(range(len(lengths)))
+    for bucket in buckets:
+        assert lengths[bucket].max() <= 1.25 * lengths[bucket].min()
+
+    # buckets also respect the padded array size limit, unless a matrix exceeds it on its own.
+    buckets = length_buckets(lengths
+                             , p=4
+                             , max_bytes=4 * 130 * 8 * 2)
+    for bucket in buckets:
+        assert len(bucket) == 1 or len(bucket) * 4 * lengths[bucket].max() * 8 <= 4 * 130 * 8 * 2
+
+
+def test_batch_nmf(coverage_setup):
+    xs = coverage_setup
+    nmfoa = GeneNMFOA(nmf_iter=20)
+
+    fits = batch_nmf(xs
+                     , nmf_iter=20)
+    for x, (K, E, n_iter) in zip(xs, fits):
+        K_gene, E_gene = nmfoa.nmf(x
+                                   , factors=True)
+        assert n_iter == 20
+        assert E.shape == (1, x.shape[1])
+        np.testing.assert_allclose(K.dot(E), K_gene.dot(E_gene), rtol=1e-10)
+
+    # with a tolerance, matrices stop as they converge, as they would on their own.
+    nmfoa = GeneNMFOA(nmf_iter=50, nmf_tol=0.1)
+    fits = batch_nmf(xs
+                     , nmf_iter=50
+                     , nmf_tol=0.1)
+    for x, (K, E, n_iter) in zip(xs, fits):
+        est, n_iter_gene = nmfoa.nmf(x
+                                     , return_n_iter=True)
+        assert n_iter == n_iter_gene
+        np.testing.assert_allclose(K.dot(E), est, rtol=1e-10)
+
+
+def test_run_steps_batched(coverage_setup):
+    # include a sparse matrix, whose baseline selection drops bins until a rank-one fit fails.
+    xs = coverage_setup + [np.eye(4, 60)]
+    nmfoa = GeneNMFOA(nmf_iter=10, batch=True)
+    nmfoa.p = 4
+
+    serial = list(map(nmfoa.baseline_selection, xs))
+    batched = nmfoa.run_baseline_selection_serial(xs)
+    assert len(batched) == len(serial)
+    for (rho, est, ran, n_iter), (rho_b, est_b, ran_b, n_iter_b) in zip(serial, batched):
+        assert ran == ran_b
+        assert n_iter == n_iter_b
+        np.testing.assert_allclose(rho_b, rho, rtol=1e-8, atol=1e-12)
+        np.testing.assert_allclose(est_b, est, rtol=1e-8)
+
+
+def test_run_steps_batched_warm_start(coverage_setup):
+    nmfoa = GeneNMFOA(nmf_iter=20, nmf_tol=0.1, nmf_warm_start=True)
+    nmfoa.p = 4
+
+    serial = list(map(nmfoa.baseline_selection, coverage_setup))
+    batched = nmfoa.run_baseline_selection_serial(coverage_setup)
+    for (rho, est, ran, n_iter), (rho_b, est_b, ran_b, n_iter_b) in zip(serial, batched):
+        assert ran == ran_b
+        assert n_iter == n_iter_b
+        np.testing.assert_allclose(rho_b, rho, rtol=1e-8, atol=1e-12)
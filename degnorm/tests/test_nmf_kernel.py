@@ -0,0 +1,110 @@
+import pytest
+import numpy as np
+from degnorm.rank_one import rank_one_approx
+from degnorm.nmf_kernel import *
+
+
+# ----------------------------------------------------- #
+# NMF-OA kernel tests
+# ----------------------------------------------------- #
+@pytest.fixture
+def coverage_setup():
+    rng = np.random.RandomState(7)
+    envelope = np.abs(np.sin(np.linspace(0, 5, 800))) + 0.2
+    degradation = np.linspace(1, 0.3, 800) ** rng.uniform(0, 2, size=(5, 1))
+    return rng.poisson(30 * envelope * degradation).astype(np.float_)
+
+
+def test_workspace():
+    a, b = workspace((3, 100)
+                     , n=2)
+    assert a.shape == b.shape == (3, 100)
+    assert a.flags['C_CONTIGUOUS'] and not np.shares_memory(a, b)
+
+    # smaller requests reuse the same buffers, larger requests grow them.
+    c, = workspace((2, 50)
+                   , n=1)
+    assert np.shares_memory(a, c)
+
+    d, = workspace((4, 100)
+                   , n=1)
+    assert d.shape == (4, 100)
+
+
+def test_nmf_oa(coverage_setup):
+    x = coverage_setup
+
+    def rank_one(y, init, gram):
+        return rank_one_approx(y
+                               , gram=gram)
+
+    # reference NMF-OA, allocating new arrays on every iteration.
+    K, E = rank_one_approx(x)
+    est = K.dot(E)
+    lmbda = np.zeros(shape=x.shape)
+    c = 1. / np.sqrt(30)
+    for _ in range(30):
+        lmbda -= c * (est - x)
+        lmbda[lmbda < 0.] = 0.
+        K, E = rank_one_approx(x + lmbda)
+        est = K.dot(E)
+
+    K_ws, E_ws, est_ws, lmbda_ws, n_iter = nmf_oa(x
+                                                  , rank_one=rank_one
+                                                  , nmf_iter=30)
+    assert n_iter == 30
+    assert np.array_equal(est_ws, est)
+    assert np.array_equal(K_ws, K) and np.array_equal(E_ws, E)
+    assert np.array_equal(lmbda_ws, lmbda)
+
+    # input is never written to.
+    assert np.array_equal(x, coverage_setup)
+
+
+def test_nmf_oa_warm_start(coverage_setup):
+    x = coverage_setup
+
+    def rank_one(y, init, gram):
+        return rank_one_approx(y)
+
+    K, E, est, lmbda, n_iter = nmf_oa(x
+                                      , rank_one=rank_one
+                                      , nmf_iter=200
+                                      , nmf_tol=0.05)
+    K, E, est, lmbda = np.copy(K), np.copy(E), np.copy(est), np.copy(lmbda)
+    assert n_iter > 1
+
+    # warm starting from a converged state stops after the minimum number of iterations, near the same estimate.
+    lmbda_init = np.copy(lmbda)
+    K_warm, E_warm, est_warm, lmbda_warm, n_iter_warm = nmf_oa(x
+                                                               , rank_one=rank_one
+                                                               , nmf_iter=200
+                                                               , nmf_tol=0.05
+                                                               , init=(K, E, lmbda))
+    assert n_iter_warm == NMF_MIN_ITER
+    assert np.abs(est_warm - est).max() < 0.05 * est.max()
+
+    # the initial state is not written to.
+    assert np.array_equal(lmbda, lmbda_init)
+
+
+def test_bin_scores(coverage_setup):
+    x = coverage_setup
+    K, E = rank_one_approx(x)
+    est = K.dot(E)
+    est[0, 5] = np.nan
+    est[:, 790:] = np.nan
+    bin_bounds = np.array([0, 100, 350, 351, 600, 790, 800])
+
+    # reference scores, looping over columns and bins.
+    res_vec = np.apply_along_axis(lambda z: np.nanmax(z ** 2)
+                                  , axis=0
+                                  , arr=(est - x) / (x + 1))
+    ss_r = np.array([np.nanmean(res_vec[start:end]) for start, end in zip(bin_bounds[:-1], bin_bounds[1:])])
+
+    scores = bin_scores(est
+                        , x=x
+                        , bin_starts=bin_bounds[:-1])
+    assert scores.shape == ss_r.shape
+    assert np.isnan(scores[-1]) and np.isnan(ss_r[-1])
+    np.testing.assert_allclose(scores[:-1], ss_r[:-1], rtol=1e-12)
@@ -0,0 +1,98 @@
+import pytest
+import numpy as np
+from degnorm.rank_one import *
+
+
+# ----------------------------------------------------- #
+# degnorm.rank_one tests
+# ----------------------------------------------------- #
+@pytest.fixture
+def coverage_setup():
+    rng = np.random.RandomState(123)
+
+    # non-negative, coverage-like matrices: degraded sample envelopes with Poisson noise.
+    shapes = [(2, 50), (5, 1000), (40, 3000), (200, 1200), (300, 300), (1000, 3)]
+    return [rng.poisson(20, size=shape) * np.linspace(1, 0.2, shape[1]) for shape in shapes]
+
+
+def test_rank_one_solvers(coverage_setup):
+    for x in coverage_setup:
+        u, s, vt = np.linalg.svd(x, full_matrices=False)
+        expected = s[0] * np.outer(u[:, 0], vt[0])
+
+        for solver in ['auto'] + sorted(RANK_ONE_SOLVERS):
+            K, E = rank_one_approx(x
+                                   , solver=solver)
+            assert K.shape == (x.shape[0], 1)
+            assert E.shape == (1, x.shape[1])
+            assert np.allclose(K.dot(E), expected, rtol=1e-6, atol=1e-6 * np.abs(x).max())
+
+            # factors are sign-consistent: non-negative for non-negative matrices.
+            assert np.all(K >= -1e-8) and np.all(E >= -1e-8)
+
+
+def test_select_rank_one_solver():
+    assert select_rank_one_solver((5, 100000)) == 'gram'
+    assert select_rank_one_solver((100000, 5)) == 'gram'
+    assert select_rank_one_solver((300, 300)) == 'lapack'
+    assert select_rank_one_solver((500, 20000)) == 'randomized'
+
+
+def test_rank_one_approx_errors():
+    with pytest.raises(ValueError):
+        rank_one_approx(np.ones([1, 20]))
+
+    with pytest.raises(ValueError):
+        rank_one_approx(np.ones([5, 20])
+                        , solver='qr')
+
+    # zero matrices have a zero approximation.
+    K, E = rank_one_approx(np.zeros([5, 20])
+                           , solver='gram')
+    assert np.array_equal(K.dot(E), np.zeros([5, 20]))
+
+
+def test_warm_started_rank_one(coverage_setup):
+    rng = np.random.RandomState(123)
+    for x in coverage_setup[:4]:
+        K, E = rank_one_approx(x)
+
+        # warm start from a perturbed matrix's factors: power iterations converge to the exact solve.
+        K_near, _ = rank_one_approx(x + rng.uniform(0, 5, size=x.shape))
+        u, s, v, converged = power_rank_one(x
+                                            , u0=K_near
+                                            , tol=1e-10
+                                            , max_iter=200)
+        assert converged
+        assert np.allclose(s * np.outer(u, v), K.dot(E), atol=1e-6 * np.abs(x).max())
+
+        K_warm, E_warm = rank_one_approx(x
+                                         , init=K_near
+                                         , tol=1e-10
+                                         , max_iter=200)
+        assert np.allclose(K_warm.dot(E_warm), K.dot(E), atol=1e-6 * np.abs(x).max())
+
+        # unconverged power iterations fall back to the exact solve.
+        K_fallback, E_fallback = rank_one_approx(x
+                                                 , init=K_near
+                                                 , tol=0.
+                                                 , max_iter=1)
+        assert np.allclose(K_fallback.dot(E_fallback), K.dot(E))
+
+
+def test_precomputed_gram(coverage_setup):
+    assert uses_row_gram((5, 1000))
+    assert uses_row_gram((200, 1200), solver='gram')
+    assert not uses_row_gram((200, 1200))
+    assert not uses_row_gram((1000, 3), solver='gram')
+    assert not uses_row_gram((5, 1000), solver='lapack')
+
+    # a Gram matrix downdated by dropped columns gives the same factors as the shrunken matrix's own.
+    x = coverage_setup[1]
+    gram = x.dot(x.T) - x[:, 200:400].dot(x[:, 200:400].T)
+    x_drop = np.delete(x, obj=range(200, 400), axis=1)
+
+    K, E = rank_one_approx(x_drop)
+    K_gram, E_gram = rank_one_approx(x_drop
+                                     , gram=gram)
+    assert np.allclose(K_gram.dot(E_gram), K.dot(E), rtol=1e-10)
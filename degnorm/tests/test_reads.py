@@ -110,12 +110,13 @@ def test_bam_coverage_counts_paired(bam_setup, gtf_setup):
 
     # check that chromosome coverage file and read counts file exist.
     assert 'chrom_coverage_hg_small_1_chr1.npz' in output_files
-    assert 'read_counts_hg_small_1_chr1.csv' in output_files
+    assert 'read_counts_hg_small_1_chr1.npy' in output_files
 
-    # check read counts file.
-    reads_df = read_csv(os.path.join(bam_setup.save_dir, 'read_counts_hg_small_1_chr1.csv'))
-    assert not reads_df.empty
-    assert len(list(set(reads_df.columns.tolist()) - {'gene', 'hg_small_1'})) == 0
+    # check read counts file: one count per gene, in gene_df order.
+    read_counts = np.load(os.path.join(bam_setup.save_dir, 'read_counts_hg_small_1_chr1.npy'))
+    assert read_counts.ndim == 1
+    assert read_counts.shape[0] == gene_df.shape[0]
+    assert read_counts.sum() > 0
 
 
 # test coverage / read count calculations on single-end reads alignment file.
@@ -135,12 +136,13 @@ def test_bam_coverage_counts_single(bam_setup, gtf_setup):
 
     # check that chromosome coverage file and read counts file exist.
     assert 'chrom_coverage_ff_small_chr1.npz' in output_files
-    assert 'read_counts_ff_small_chr1.csv' in output_files
+    assert 'read_counts_ff_small_chr1.npy' in output_files
 
-    # check read counts file.
-    reads_df = read_csv(os.path.join(bam_setup.save_dir, 'read_counts_ff_small_chr1.csv'))
-    assert not reads_df.empty
-    assert len(list(set(reads_df.columns.tolist()) - {'gene', 'ff_small'})) == 0
+    # check read counts file: one count per gene, in gene_df order.
+    read_counts = np.load(os.path.join(bam_setup.save_dir, 'read_counts_ff_small_chr1.npy'))
+    assert read_counts.ndim == 1
+    assert read_counts.shape[0] == gene_df.shape[0]
+    assert read_counts.sum() > 0
 
 
 # ----------------------------------------------------- #
@@ -66,18 +66,53 @@ def test_bam_coverage_counts_paired(bam_setup, gtf_setup):
 
     read_counts_df = merge_read_counts(bam_setup[0]
                                        , sample_ids=sample_ids
-                                       , chroms=['chr1'])
+                                       , chroms=['chr1']
+                                       , gene_df=gene_df)
 
-    gene_cov_dict = merge_coverage(bam_setup[0]
-                                   , sample_ids=sample_ids
-                                   , exon_df=exon_df
-                                   , n_jobs=2
-                                   , output_dir=bam_setup[0])
+    gene_cov_dict, cov_stats_df = merge_coverage(bam_setup[0]
+                                                 , sample_ids=sample_ids
+                                                 , exon_df=exon_df
+                                                 , n_jobs=2
+                                                 , output_dir=bam_setup[0])
 
     assert isinstance(read_counts_df, DataFrame)
     assert isinstance(gene_cov_dict, OrderedDict)
     assert all(read_counts_df.columns == ['chr', 'gene'] + sample_ids)
     assert not read_counts_df.empty
+    assert read_counts_df.gene.tolist() == gene_df.gene.tolist()
     assert gene_cov_dict.get(list(gene_cov_dict.keys())[0]).ndim == 2
     assert all([gene_cov_dict[x].ndim == 2 for x in gene_cov_dict])
-    assert os.path.exists(os.path.join(bam_setup[0], 'chr1', 'coverage_matrices_chr1.pkl'))
+    assert os.path.exists(os.path.join(bam_setup[0], 'chr1', 'coverage_matrices_chr1.npy'))
+    assert os.path.exists(os.path.join(bam_setup[0], 'chr1', 'coverage_matrices_chr1_index.npz'))
+
+    # coverage matrices saved to disk match those returned.
+    saved_cov_dict = load_coverage_arrays(os.path.join(bam_setup[0], 'chr1', 'coverage_matrices_chr1'))
+    assert list(saved_cov_dict.keys()) == list(gene_cov_dict.keys())
+    assert all([np.array_equal(saved_cov_dict[x], gene_cov_dict[x]) for x in gene_cov_dict])
+
+    # coverage summary statistics computed during merge match the coverage matrices.
+    assert cov_stats_df.gene.tolist() == list(gene_cov_dict.keys())
+    expected_stats_df = coverage_stats_from_arrays(gene_cov_dict
+                                                   , sample_ids=sample_ids)
+    assert np.array_equal(cov_stats_df.drop('gene', axis=1).values, expected_stats_df.drop('gene', axis=1).values)
+
+    saved_stats_df = load_coverage_stats(os.path.join(bam_setup[0], 'chr1', 'coverage_matrices_chr1')
+                                         , sample_ids=sample_ids)
+    assert saved_stats_df.equals(cov_stats_df)
+
+    # compact coverage matrices hold the same coverage in an unsigned integer data type.
+    compact_dir = os.path.join(bam_setup[0], 'compact')
+    os.makedirs(compact_dir)
+    compact_cov_dict, compact_stats_df = merge_coverage(bam_setup[0]
+                                                        , sample_ids=sample_ids
+                                                        , exon_df=exon_df
+                                                        , n_jobs=2
+                                                        , output_dir=compact_dir
+                                                        , compact=True)
+
+    assert list(compact_cov_dict.keys()) == list(gene_cov_dict.keys())
+    assert all([compact_cov_dict[x].dtype.kind == 'u' for x in compact_cov_dict])
+    assert all([np.array_equal(compact_cov_dict[x], gene_cov_dict[x]) for x in gene_cov_dict])
+    assert np.array_equal(compact_stats_df.filter(regex='^(max|sum)_').values
+                          , cov_stats_df.filter(regex='^(max|sum)_').values)
+    assert all(compact_stats_df.nbytes < cov_stats_df.nbytes)
@@ -1,4 +1,5 @@
 import pytest
+import shutil
 from pandas import DataFrame
 from degnorm.utils import *
 from numpy import ndarray
@@ -55,4 +56,165 @@ def test_split_into_chunks():
     assert len(split_into_chunks(l, n=3)) == 3
     assert len(split_into_chunks(l, n=7)) == 5
     assert len(split_into_chunks(l, n=10)) == 10
-    assert len(split_into_chunks(l, n=20)) == 10
\ No newline at end of file
+    assert len(split_into_chunks(l, n=20)) == 10
+
+
+# ----------------------------------------------------- #
+# indexed coverage array store tests
+# ----------------------------------------------------- #
+def test_coverage_arrays_round_trip(tmpdir):
+    cov_dict = OrderedDict([('GENEB', np.arange(6).reshape(2, 3))
+                            , ('GENEA', np.ones([2, 1], dtype=int))
+                            , ('GENEC', np.zeros([2, 4], dtype=int))])
+    file_stem = os.path.join(str(tmpdir), 'overlap_coverage_sample_chr1')
+    save_coverage_arrays(file_stem, cov_dict=cov_dict)
+
+    genes, offsets = load_coverage_index(file_stem)
+    assert genes.tolist() == ['GENEB', 'GENEA', 'GENEC']
+    assert offsets.tolist() == [0, 3, 4, 8]
+
+    for mmap_mode in [None, 'r']:
+        loaded = load_coverage_arrays(file_stem, mmap_mode=mmap_mode)
+        assert list(loaded.keys()) == list(cov_dict.keys())
+        assert all([np.array_equal(loaded[gene], cov_dict[gene]) for gene in cov_dict])
+
+
+def test_coverage_arrays_errors(tmpdir):
+    file_stem = os.path.join(str(tmpdir), 'overlap_coverage_sample_chr1')
+
+    with pytest.raises(ValueError):
+        save_coverage_arrays(file_stem, cov_dict=dict())
+
+    with pytest.raises(FileNotFoundError):
+        load_coverage_arrays(file_stem)
+
+
+def test_smallest_uint_dtype():
+    assert smallest_uint_dtype(0) == np.uint8
+    assert smallest_uint_dtype(255) == np.uint8
+    assert smallest_uint_dtype(256) == np.uint16
+    assert smallest_uint_dtype(70000.) == np.uint32
+
+
+def test_cgroup_limits(tmpdir):
+    # cgroup v2.
+    v2_root = str(tmpdir.mkdir('v2'))
+    assert cgroup_cpu_limit(v2_root) is None
+    assert cgroup_memory_limit(v2_root) is None
+
+    with open(os.path.join(v2_root, 'cpu.max'), 'w') as f:
+        f.write('max 100000\n')
+    with open(os.path.join(v2_root, 'memory.max'), 'w') as f:
+        f.write('max\n')
+    assert cgroup_cpu_limit(v2_root) is None
+    assert cgroup_memory_limit(v2_root) is None
+
+    with open(os.path.join(v2_root, 'cpu.max'), 'w') as f:
+        f.write('150000 100000\n')
+    with open(os.path.join(v2_root, 'memory.max'), 'w') as f:
+        f.write('2147483648\n')
+    assert cgroup_cpu_limit(v2_root) == 1.5
+    assert cgroup_memory_limit(v2_root) == 2147483648
+    assert available_cpus(v2_root) <= 2
+    assert available_memory(v2_root) <= 2147483648
+
+    # cgroup v1.
+    v1_root = tmpdir.mkdir('v1')
+    cpu_dir, mem_dir = str(v1_root.mkdir('cpu,cpuacct')), str(v1_root.mkdir('memory'))
+    for filename, value in [(os.path.join(cpu_dir, 'cpu.cfs_quota_us'), '-1')
+                            , (os.path.join(cpu_dir, 'cpu.cfs_period_us'), '100000')
+                            , (os.path.join(mem_dir, 'memory.limit_in_bytes'), '9223372036854771712')]:
+        with open(filename, 'w') as f:
+            f.write(value + '\n')
+    assert cgroup_cpu_limit(str(v1_root)) is None
+    assert cgroup_memory_limit(str(v1_root)) is None
+
+    with open(os.path.join(cpu_dir, 'cpu.cfs_quota_us'), 'w') as f:
+        f.write('400000\n')
+    assert cgroup_cpu_limit(str(v1_root)) == 4.0
+    assert available_cpus(str(v1_root)) >= 1
+    assert 1 <= max_cpu() <= available_cpus()
+
+
+def test_nested_cgroup_limits(tmpdir):
+    # cgroup v2: a Slurm job's limits sit in a nested cgroup, the root says "no limit".
+    v2_root = tmpdir.mkdir('v2')
+    job_dir = v2_root.mkdir('system.slice').mkdir('slurmstepd.scope').mkdir('job_7')
+    for cgroup_dir, cpu_max, memory_max in [(v2_root, 'max 100000', 'max')
+                                            , (job_dir.dirpath(), '800000 100000', '8589934592')
+                                            , (job_dir, '200000 100000', '4294967296')]:
+        cgroup_dir.join('cpu.max').write(cpu_max + '\n')
+        cgroup_dir.join('memory.max').write(memory_max + '\n')
+
+    proc_cgroup = tmpdir.join('cgroup_v2')
+    proc_cgroup.write('0::/system.slice/slurmstepd.scope/job_7\n')
+    assert proc_cgroups(proc_cgroup.strpath) == {'': '/system.slice/slurmstepd.scope/job_7'}
+    assert cgroup_cpu_limit(v2_root.strpath, proc_cgroup=proc_cgroup.strpath) == 2.
+    assert cgroup_memory_limit(v2_root.strpath, proc_cgroup=proc_cgroup.strpath) == 4294967296
+
+    # the tightest limit along the path applies, even if set on an ancestor.
+    job_dir.join('memory.max').write('max\n')
+    assert cgroup_memory_limit(v2_root.strpath, proc_cgroup=proc_cgroup.strpath) == 8589934592
+
+    # cgroup v1: per-controller hierarchies.
+    v1_root = tmpdir.mkdir('v1')
+    mem_job_dir = v1_root.mkdir('memory').mkdir('slurm').mkdir('uid_1000').mkdir('job_7')
+    cpu_job_dir = v1_root.mkdir('cpu,cpuacct').mkdir('slurm').mkdir('uid_1000').mkdir('job_7')
+    v1_root.join('memory', 'memory.limit_in_bytes').write('9223372036854771712\n')
+    mem_job_dir.join('memory.limit_in_bytes').write('1073741824\n')
+    cpu_job_dir.join('cpu.cfs_quota_us').write('300000\n')
+    cpu_job_dir.join('cpu.cfs_period_us').write('100000\n')
+
+    proc_cgroup = tmpdir.join('cgroup_v1')
+    proc_cgroup.write('5:memory:/slurm/uid_1000/job_7\n4:cpu,cpuacct:/slurm/uid_1000/job_7\n0::/\n')
+    assert cgroup_memory_limit(v1_root.strpath, proc_cgroup=proc_cgroup.strpath) == 1073741824
+    assert cgroup_cpu_limit(v1_root.strpath, proc_cgroup=proc_cgroup.strpath) == 3.
+
+    # without a readable membership file, only the root is read.
+    assert cgroup_memory_limit(v1_root.strpath, proc_cgroup=tmpdir.join('missing').strpath) is None
+
+
+def test_create_index_files(tmpdir):
+    import pysam
+
+    bam_files = list()
+    for i in [1, 2]:
+        bam_file = os.path.join(str(tmpdir), 'sample_{0}.bam'.format(i))
+        shutil.copy(os.path.join(THIS_DIR, 'data', 'hg_small_{0}.bam'.format(i)), bam_file)
+        bam_files.append(bam_file)
+
+    bai_files = create_index_files(bam_files
+                                   , n_jobs=2)
+
+    assert bai_files == [bai_from_bam_file(x) for x in bam_files]
+    for bam_file, bai_file in zip(bam_files, bai_files):
+        assert os.path.isfile(bai_file)
+        with pysam.AlignmentFile(bam_file, mode='rb', index_filename=bai_file) as f:
+            assert f.has_index()
+
+    # indexing a file that is not a .bam file fails.
+    not_bam_file = os.path.join(str(tmpdir), 'not_a.bam')
+    with open(not_bam_file, 'w') as f:
+        f.write('not a bam file')
+
+    with pytest.raises(ValueError):
+        create_index_file(not_bam_file)
+
+
+# ----------------------------------------------------- #
+# parse_args tests
+# ----------------------------------------------------- #
+def test_parse_args_nmf_options(tmpdir, monkeypatch):
+    argv = ['degnorm', '--warm-start-dir', tmpdir.strpath, '-o', tmpdir.strpath]
+    monkeypatch.setattr(sys, 'argv', argv + ['--nmf-carry-state'])
+    args = parse_args()
+    assert args.nmf_carry_state and args.nmf_backend == 'threads'
+
+    # flag combinations GeneNMFOA rejects fail before any reads are processed.
+    monkeypatch.setattr(sys, 'argv', argv + ['--nmf-carry-state', '--nmf-backend', 'processes'])
+    with pytest.raises(ValueError):
+        parse_args()
+
+    monkeypatch.setattr(sys, 'argv', argv + ['--nmf-warm-start'])
+    with pytest.raises(ValueError):
+        parse_args()
@@ -9,8 +9,10 @@ import os
 from datetime import datetime
 import time
 import argparse
-import pkg_resources
+import hashlib
 import gc
+from collections import OrderedDict
+from itertools import chain
 
 
 def configure_logger(output_dir=None, mpi=False):
@@ -34,14 +36,45 @@ def configure_logger(output_dir=None, mpi=False):
                         , datefmt='%m/%d/%Y %I:%M:%S')
 
 
+def package_version():
+    """
+    Look up the installed DegNorm package version, without importing setuptools' pkg_resources
+    unless importlib.metadata is unavailable.
+
+    :return: str DegNorm version
+    """
+    try:
+        from importlib.metadata import version
+    except ImportError:
+        from pkg_resources import get_distribution
+        return get_distribution('degnorm').version
+
+    return version('degnorm')
+
+
+def resource_path(filename=''):
+    """
+    Locate a file in the degnorm package resources directory.
+
+    :param filename: str name of file in degnorm/resources. If empty, locate the resources directory itself.
+    :return: str path to resource
+    """
+    try:
+        from importlib.resources import files
+    except ImportError:
+        from pkg_resources import resource_filename
+        return resource_filename('degnorm', os.path.join('resources', filename))
+
+    return str(files('degnorm').joinpath(os.path.join('resources', filename)))
+
+
 def welcome():
     """
     Welcome our user with DegNorm ascii art.
     """
-    resources_dir = pkg_resources.resource_filename('degnorm', 'resources')
-    with open(os.path.join(resources_dir, 'welcome.txt'), 'r') as f:
+    with open(resource_path('welcome.txt'), 'r') as f:
         welcome = f.readlines()
-        welcome += '\n' + 'version {0}'.format(pkg_resources.get_distribution('degnorm').version)
+        welcome += '\n' + 'version {0}'.format(package_version())
 
     logging.info('\n' + ''.join(welcome) + '\n'*4)
 
@@ -103,11 +136,186 @@ def subset_to_chrom(df, chrom, reindex=False):
     return sub_df
 
 
+def read_cgroup_value(*paths):
+    """
+    Read the first existing cgroup control file out of a set of candidate files.
+
+    :param paths: str paths to cgroup control files, in order of preference
+    :return: str stripped contents of the first readable file, or None if no file can be read.
+    """
+    for path in paths:
+        try:
+            with open(path, 'r') as f:
+                return f.read().strip()
+
+        except (OSError, IOError):
+            continue
+
+    return None
+
+
+def proc_cgroups(proc_cgroup='/proc/self/cgroup'):
+    """
+    Determine this process' control groups from /proc/self/cgroup, e.g. a Slurm job's nested cgroup.
+
+    :param proc_cgroup: str path to the process' cgroup membership file
+    :return: dict of {controller: cgroup path} pairs, e.g. {'memory': '/slurm/uid_1/job_2'}; the cgroup v2
+    path is keyed by ''. Empty if the file cannot be read.
+    """
+    cgroups = dict()
+    try:
+        with open(proc_cgroup, 'r') as f:
+            for line in f:
+                fields = line.strip().split(':', 2)
+                if len(fields) < 3:
+                    continue
+
+                for controller in fields[1].split(','):
+                    cgroups[controller] = fields[2]
+
+    except (OSError, IOError):
+        pass
+
+    return cgroups
+
+
+def cgroup_dirs(mount, path):
+    """
+    List the directories of a cgroup and its ancestors, from the cgroup up to the cgroup filesystem mount point.
+
+    :param mount: str path to a cgroup (v2 or v1 controller) filesystem mount point
+    :param path: str cgroup path relative to the mount point, as found in /proc/self/cgroup
+    :return: list of str directory paths
+    """
+    dirs = list()
+    path = path.strip('/')
+    while path:
+        dirs.append(os.path.join(mount, path))
+        path = os.path.dirname(path)
+
+    dirs.append(mount)
+    return dirs
+
+
+def cgroup_cpu_limit(cgroup_root='/sys/fs/cgroup', proc_cgroup='/proc/self/cgroup'):
+    """
+    Determine the CPU quota imposed on this process' control group, e.g. by a container runtime or
+    a job scheduler. Reads cgroup v2 `cpu.max`, and cgroup v1 `cpu.cfs_quota_us` / `cpu.cfs_period_us`,
+    of the process' own cgroup (see proc_cgroups) and each of its ancestors: the tightest quota applies.
+
+    :param cgroup_root: str path to cgroup filesystem mount point
+    :param proc_cgroup: str path to the process' cgroup membership file
+    :return: float number of CPUs worth of quota, or None if there is no CPU quota.
+    """
+    cgroups = proc_cgroups(proc_cgroup)
+    quotas = list()
+
+    # cgroup v2: "<quota> <period>" or "max <period>".
+    for cgroup_dir in cgroup_dirs(cgroup_root, cgroups.get('', '/')):
+        cpu_max = read_cgroup_value(os.path.join(cgroup_dir, 'cpu.max'))
+        if cpu_max is not None:
+            fields = cpu_max.split()
+            if fields[0] != 'max' and len(fields) >= 2:
+                quotas.append(int(fields[0]) / int(fields[1]))
+
+    # cgroup v1: quota of -1 means no quota.
+    for v1_dir in [os.path.join(cgroup_root, x) for x in ['cpu', 'cpu,cpuacct', 'cpuacct,cpu']]:
+        for cgroup_dir in cgroup_dirs(v1_dir, cgroups.get('cpu', '/')):
+            quota = read_cgroup_value(os.path.join(cgroup_dir, 'cpu.cfs_quota_us'))
+            period = read_cgroup_value(os.path.join(cgroup_dir, 'cpu.cfs_period_us'))
+            if quota is not None and period is not None and int(quota) > 0 and int(period) > 0:
+                quotas.append(int(quota) / int(period))
+
+    return min(quotas) if quotas else None
+
+
+def cgroup_memory_limit(cgroup_root='/sys/fs/cgroup', proc_cgroup='/proc/self/cgroup'):
+    """
+    Determine the memory limit imposed on this process' control group. Reads cgroup v2 `memory.max`
+    and cgroup v1 `memory.limit_in_bytes` of the process' own cgroup (see proc_cgroups) and each of its
+    ancestors: the tightest limit applies.
+
+    :param cgroup_root: str path to cgroup filesystem mount point
+    :param proc_cgroup: str path to the process' cgroup membership file
+    :return: int memory limit in bytes, or None if memory is unlimited.
+    """
+    cgroups = proc_cgroups(proc_cgroup)
+    limits = list()
+
+    for filename, mount, path in [('memory.max', cgroup_root, cgroups.get('', '/'))
+                                  , ('memory.limit_in_bytes', os.path.join(cgroup_root, 'memory')
+                                     , cgroups.get('memory', '/'))]:
+        for cgroup_dir in cgroup_dirs(mount, path):
+            limit = read_cgroup_value(os.path.join(cgroup_dir, filename))
+
+            # cgroup v1 reports "no limit" as a very large page-aligned number.
+            if limit is not None and limit != 'max' and int(limit) < 2**60:
+                limits.append(int(limit))
+
+    return min(limits) if limits else None
+
+
+def available_cpus(cgroup_root='/sys/fs/cgroup'):
+    """
+    Determine the number of CPUs this process may actually use: the CPUs in its affinity mask
+    (e.g. set by Slurm or taskset), further limited by any cgroup CPU quota (e.g. Kubernetes CPU limits).
+
+    :param cgroup_root: str path to cgroup filesystem mount point
+    :return: int number of usable CPUs, at least 1.
+    """
+    try:
+        n_cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        n_cpus = mp.cpu_count()
+
+    quota = cgroup_cpu_limit(cgroup_root)
+    if quota is not None:
+        n_cpus = min(n_cpus, int(np.ceil(quota)))
+
+    return max(n_cpus, 1)
+
+
+def available_memory(cgroup_root='/sys/fs/cgroup'):
+    """
+    Determine the amount of memory this process may use: physical memory, further limited by
+    any cgroup memory limit.
+
+    :param cgroup_root: str path to cgroup filesystem mount point
+    :return: int memory in bytes, or None if it cannot be determined.
+    """
+    try:
+        memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        memory = None
+
+    limit = cgroup_memory_limit(cgroup_root)
+    if limit is not None:
+        memory = limit if memory is None else min(memory, limit)
+
+    return memory
+
+
+def worker_memory_budget(n_jobs, max_bytes, fraction=0.5):
+    """
+    Split a fraction of available memory evenly across parallel workers.
+
+    :param n_jobs: int number of parallel workers
+    :param max_bytes: int or float upper bound on a worker's memory budget, in bytes
+    :param fraction: float fraction of available memory to split across workers
+    :return: float per-worker memory budget in bytes, no larger than max_bytes.
+    """
+    memory = available_memory()
+    if memory is None:
+        return float(max_bytes)
+
+    return float(min(max_bytes, fraction * memory / max(n_jobs, 1)))
+
+
 def max_cpu():
     """
-    :return: int number of CPUs available on a node minus 1
+    :return: int number of CPUs available to this process (see available_cpus) minus 1, at least 1.
     """
-    return mp.cpu_count() - 1
+    return max(available_cpus() - 1, 1)
 
 
 def flatten_2d(lst2d, arr=True):
@@ -118,7 +326,7 @@ def flatten_2d(lst2d, arr=True):
     :param arr: Bool return numpy array or list?
     :return: 1-dimensional list or numpy array
     """
-    lst1d = [elt for lst1d in lst2d for elt in lst1d]
+    lst1d = list(chain.from_iterable(lst2d))
     return np.array(lst1d) if arr else lst1d
 
 
@@ -148,29 +356,41 @@ def bai_from_bam_file(bam_file):
 
 def create_index_file(bam_file):
     """
-    Create a BAM index file with samtools.
+    Create a BAM index file with pysam's bundled samtools, in-process (samtools need not be in $PATH).
 
-    :param bam_file: str realpath to .bam file for which we desire a .bai index file
+    :param bam_file: str realpath to (sorted) .bam file for which we desire a .bai index file
     :return: str realpath to the created .bai file
     """
+    import pysam
+
     bai_file = bai_from_bam_file(bam_file)
 
-    # check if samtools is available in $PATH.
-    samtools_avail = find_software('samtools')
+    try:
+        pysam.index(bam_file, bai_file)
 
-    # Note that samtools is only available for Linux and Mac OS:
-    # https://github.com/samtools/samtools/blob/develop/INSTALL
-    if not samtools_avail:
-        raise EnvironmentError('samtools not in found in PATH. samtools is required to convert {0} -> {1}'
-                               .format(bam_file, bai_file))
+    except pysam.SamtoolsError as e:
+        raise ValueError('{0} was not successfully converted into a .bai file: {1}'.format(bam_file, e))
 
-    # run samtools index
-    cmd = 'samtools index {0} {1}'.format(bam_file, bai_file)
-    out = subprocess.run([cmd]
-                         , shell=True)
+    return bai_file
 
-    if out.returncode != 0:
-        raise ValueError('{0} was not successfully converted into a .bai file'.format(bam_file))
+
+def create_index_files(bam_files, n_jobs=1):
+    """
+    Create BAM index files for a set of .bam files, indexing files concurrently in worker processes.
+
+    :param bam_files: list of str realpaths to (sorted) .bam files for which we desire .bai index files
+    :param n_jobs: int maximum number of worker processes
+    :return: list of str realpaths to the created .bai files, in the order of bam_files
+    """
+    if not bam_files:
+        return list()
+
+    # imported here to keep joblib off of the CLI startup path.
+    from joblib import Parallel, delayed
+
+    return Parallel(n_jobs=max(1, min(n_jobs, len(bam_files)))
+                    , verbose=0
+                    , backend='loky')(map(delayed(create_index_file), bam_files))
 
 
 def split_into_chunks(x, n):
@@ -192,6 +412,120 @@ def split_into_chunks(x, n):
     return out
 
 
+def file_sha1(filename, block_size=2 ** 20):
+    """
+    Compute the sha1 hash of a file's contents, reading the file in blocks.
+
+    :param filename: str realpath to a file
+    :param block_size: int number of bytes to read at a time
+    :return: str hexadecimal sha1 digest
+    """
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+
+    return sha1.hexdigest()
+
+
+def default_cache_dir():
+    """
+    :return: str path to DegNorm's cache directory, $XDG_CACHE_HOME/degnorm (~/.cache/degnorm by default).
+    """
+    cache_root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_root, 'degnorm')
+
+
+def smallest_uint_dtype(max_value):
+    """
+    Find the smallest unsigned integer data type that can hold all integers in [0, max_value],
+    e.g. for storing coverage in a compact format.
+
+    :param max_value: int (or integer-valued float) largest value to be stored
+    :return: numpy.dtype one of uint8, uint16, uint32, uint64
+    """
+    return np.promote_types(np.min_scalar_type(int(max_value)), np.uint8)
+
+
+def coverage_array_files(file_stem):
+    """
+    Get the pair of files backing an indexed coverage array store, see save_coverage_arrays.
+
+    :param file_stem: str realpath to coverage array store, without file extension,
+    e.g. '<output dir>/sample123/overlap_coverage_sample123_chr1'
+    :return: tuple (str path to flat coverage .npy file, str path to gene offset index .npz file)
+    """
+    return file_stem + '.npy', file_stem + '_index.npz'
+
+
+def save_coverage_arrays(file_stem, cov_dict):
+    """
+    Save a dictionary of {gene: coverage array} to an indexed array store: all coverage arrays concatenated
+    along their last (position) axis into one flat .npy file, along with an .npz index of the gene names and
+    the offsets that delineate each gene's positions in the flat array. Coverage arrays may be 1-d vectors or
+    2-d (p samples x Li positions) matrices, but must share all leading dimensions and a data type.
+
+    Example: {'A': <p x 3 array>, 'B': <p x 2 array>} is saved as
+
+    <file_stem>.npy: p x 5 array [A A A B B]
+    <file_stem>_index.npz: genes = ['A', 'B'], offsets = [0, 3, 5]
+
+    :param file_stem: str realpath to coverage array store, without file extension.
+    :param cov_dict: dictionary or OrderedDict of {gene name: coverage numpy array} pairs
+    :return: tuple (str path to flat coverage .npy file, str path to gene offset index .npz file)
+    """
+    if not cov_dict:
+        raise ValueError('cannot save an empty coverage array dictionary to {0}'.format(file_stem))
+
+    data_file, index_file = coverage_array_files(file_stem)
+
+    genes = np.array(list(cov_dict.keys()), dtype=str)
+    offsets = np.zeros(len(genes) + 1
+                       , dtype=np.int64)
+    offsets[1:] = np.cumsum([cov_dict[gene].shape[-1] for gene in cov_dict])
+
+    np.save(data_file
+            , arr=np.concatenate(list(cov_dict.values())
+                                 , axis=-1))
+    np.savez(index_file
+             , genes=genes
+             , offsets=offsets)
+
+    return data_file, index_file
+
+
+def load_coverage_index(file_stem):
+    """
+    Load the gene offset index of an indexed coverage array store, see save_coverage_arrays.
+
+    :param file_stem: str realpath to coverage array store, without file extension.
+    :return: tuple (1-d numpy array of str gene names, 1-d numpy array of int64 gene offsets into
+    the last axis of the flat coverage array, one element longer than gene names)
+    """
+    index_file = coverage_array_files(file_stem)[1]
+    if not os.path.isfile(index_file):
+        raise FileNotFoundError('coverage index file {0} not found'.format(index_file))
+
+    with np.load(index_file) as index:
+        return index['genes'], index['offsets']
+
+
+def load_coverage_arrays(file_stem, mmap_mode=None):
+    """
+    Load an indexed coverage array store back into a dictionary of {gene: coverage array}, see save_coverage_arrays.
+    Each gene's coverage array is a view into the flat coverage array, so no per-gene copies are made.
+
+    :param file_stem: str realpath to coverage array store, without file extension.
+    :param mmap_mode: None or str numpy.load memory-map mode, e.g. 'r' to leave flat coverage array on disk.
+    :return: OrderedDict of {gene name: coverage numpy array} pairs, in the order they were saved.
+    """
+    genes, offsets = load_coverage_index(file_stem)
+    cov_mat = np.load(coverage_array_files(file_stem)[0]
+                      , mmap_mode=mmap_mode)
+
+    return OrderedDict(zip(genes.tolist(), np.split(cov_mat, offsets[1:-1], axis=-1)))
+
+
 def argparser():
     """
     Obtain degnorm CLI parameters.
@@ -234,9 +568,20 @@ def argparser():
                         , default=None
                         , required=False
                         , help='Genome annotation file.'
-                               'Must have extension .gtf or .gff.'
+                               'Must have extension .gtf or .gtf.gz.'
                                'All non-exon regions will be removed, along with exons that appear in '
                                'multiple chromosomes and exons that overlap with multiple genes.')
+    parser.add_argument('--annotation-cache-dir'
+                        , type=str
+                        , default=None
+                        , required=False
+                        , help='Directory in which to cache parsed genome annotation data and gene overlap structures, '
+                               'keyed by the genome annotation file contents and the chromosomes in use, so that '
+                               'later runs with the same annotation skip annotation processing. '
+                               'Defaults to $XDG_CACHE_HOME/degnorm (~/.cache/degnorm).')
+    parser.add_argument('--no-annotation-cache'
+                        , action='store_true'
+                        , help='Neither read nor write the genome annotation cache.')
     parser.add_argument('-o'
                         , '--output-dir'
                         , type=str
@@ -269,6 +614,50 @@ def argparser():
                         , required=False
                         , help='Number of iterations to perform per NMF-OA computation per gene. '
                                'Different than number of DegNorm iterations (--iter flag). Default = 100.')
+    parser.add_argument('--nmf-tol'
+                        , type=float
+                        , default=None
+                        , required=False
+                        , help='Over-approximation tolerance for stopping NMF-OA computations early: after at least '
+                               '10 iterations, stop once a gene\'s coverage estimate falls below its coverage by at '
+                               'most this fraction of the maximum coverage, or after --nmf-iter iterations. NMF-OA '
+                               'rarely converges within --nmf-iter, so stopping early changes DI scores: on simulated '
+                               'genes with --nmf-iter 300, 0.05 ran 8%% fewer iterations and moved DI scores by at '
+                               'most 0.008, 0.1 ran 41%% fewer and moved them by up to 0.13. With the default '
+                               '--nmf-iter, 0.05 rarely stops early. Iterations run per gene are saved to '
+                               'nmf_iterations.csv. Default: always run --nmf-iter iterations.')
+    parser.add_argument('--nmf-warm-start'
+                        , action='store_true'
+                        , help='During baseline selection, start each NMF-OA after a bin drop from the previous '
+                               'NMF-OA\'s factors and Lagrange multipliers on the remaining positions, instead of '
+                               'from scratch. Requires --nmf-tol: warm-started NMF-OAs only save iterations by '
+                               'stopping early. Changes DI scores: on simulated genes with --nmf-tol 0.05, warm '
+                               'starting ran 84%% fewer NMF-OA iterations than --nmf-tol alone with --nmf-iter 300 '
+                               '(DI scores moved by 0.004 on average, up to 0.05), and 74%% fewer with the default '
+                               '--nmf-iter (0.02 on average, up to 0.14).')
+    parser.add_argument('--nmf-carry-state'
+                        , action='store_true'
+                        , help='Keep each gene\'s last baseline bin set, NMF-OA factors and Lagrange multipliers '
+                               'between DegNorm iterations, and use them to seed the next DegNorm iteration, so that '
+                               'later DegNorm iterations cost a fraction of the first. Changes DI scores: on simulated '
+                               'genes, later DegNorm iterations ran 13%% of the first\'s NMF-OA iterations (1-10%% '
+                               'with --nmf-tol 0.05), and final DI scores moved by 0.04 on average, up to 0.13. Only '
+                               'supported by the threads --nmf-backend; not used by degnorm_mpi.')
+    parser.add_argument('--no-batch-nmf'
+                        , action='store_true'
+                        , help='Run NMF-OA one gene at a time. By default, NMF-OA computations of short genes with '
+                               'similar lengths are run together as stacked numpy operations, which cuts per-gene '
+                               'overhead without changing results. Not used by degnorm_mpi.')
+    parser.add_argument('--nmf-backend'
+                        , type=str
+                        , default='threads'
+                        , choices=['threads', 'processes']
+                        , required=False
+                        , help='Parallel backend for NMF-OA computations. threads: worker threads share coverage '
+                               'matrices in memory. processes: coverage matrices are copied once into a '
+                               'memory-mapped file in the output directory, and worker processes are sent ranges '
+                               'of genes; scales better with -p since baseline selection is largely Python control '
+                               'flow. Default is threads. Not used by degnorm_mpi.')
     parser.add_argument('--iter'
                         , type=int
                         , default=5
@@ -280,12 +669,36 @@ def argparser():
                         , default=0
                         , required=False
                         , help='Minimum maximum read coverage for a gene to be included in DegNorm Pipeline. ')
+    parser.add_argument('--compact-coverage'
+                        , action='store_true'
+                        , help='Store and pass raw gene coverage matrices in the smallest unsigned integer data type '
+                               'that holds their maximum coverage (e.g. uint16) instead of 64-bit floats. '
+                               'Reduces coverage memory and disk usage; coverage is converted to floats '
+                               'only within NMF-OA computations.')
     parser.add_argument('-s'
                         , '--skip-baseline-selection'
                         , action='store_true'
                         , help='Skip baseline selection while computing coverage matrix estimates. '
                                'This will speed up degradation index score computation but may make '
                                'scores less accurate.')
+    parser.add_argument('--rank-one-solver'
+                        , type=str
+                        , default='auto'
+                        , choices=['auto', 'gram', 'lapack', 'randomized', 'arpack']
+                        , required=False
+                        , help='Solver for the rank-one SVD approximations within NMF-OA. Default \'auto\' chooses '
+                               'by coverage matrix shape: a (samples x samples) Gram matrix eigen solve for up to '
+                               '128 samples, dense LAPACK SVD for small matrices, randomized SVD otherwise. '
+                               '\'arpack\' is the original scipy.sparse.linalg.svds solver.')
+    parser.add_argument('--rank-one-tol'
+                        , type=float
+                        , default=None
+                        , required=False
+                        , help='Warm-start the rank-one approximation of each NMF-OA iteration from the previous '
+                               'iteration\'s, refining it by power iterations until the (unit) left singular vector '
+                               'changes by at most this tolerance, e.g. 1e-8. Falls back to an exact solve if the '
+                               'power iterations do not converge. Most useful with many samples. '
+                               'Default: exact rank-one solves on every NMF-OA iteration.')
     parser.add_argument('--non-unique-alignments'
                         , action='store_true'
                         , help='Allow retention of reads that were not uniquely aligned. If not specified, '
@@ -294,15 +707,22 @@ def argparser():
                         , '--proc-per-node'
                         , type=int
                         , required=False
-                        , default=1
-                        , help='Number of processes to spawn per node, for within-node parallelization. Defaults to 1.'
+                        , default=None
+                        , help='Number of processes to spawn per node, for within-node parallelization. '
                                'DegNorm is very computationally intensive - set this as large as you can! '
-                               'If greater than max number of cores on a node, automatically reduces to '
-                               'max number of cores - 1.')
+                               'Defaults to the number of CPUs available to DegNorm (respecting CPU affinity and '
+                               'container/cgroup CPU quotas) - 1. If greater than the number of available CPUs, '
+                               'automatically reduces to the number of available CPUs - 1.')
+    parser.add_argument('--dry-run'
+                        , action='store_true'
+                        , help='Predict the runtime and peak memory of each pipeline stage from .bam index statistics, '
+                               '.bam headers, the genome annotation and DegNorm parameters (--iter, --nmf-iter, '
+                               '--downsample-rate), recommend a --proc-per-node and MPI layout, and exit '
+                               'without loading any reads or writing any output.')
     parser.add_argument('-v'
                         , '--version'
                         , action='version'
-                        , version='DegNorm version {0}'.format(pkg_resources.get_distribution('degnorm').version)
+                        , version='DegNorm version {0}'.format(package_version())
                         , help='Display DegNorm package version and exit.')
     parser.add_argument('-h'
                         , '--help'
@@ -324,15 +744,21 @@ def parse_args():
     parser = argparser()
     args = parser.parse_args()
 
-    # check validity of cores selection.
-    max_ppn = max_cpu() + 1
-    if args.proc_per_node > max_ppn:
+    # check validity of cores selection. Cores are those available to this process, not all of a node's cores.
+    max_ppn = available_cpus()
+    if args.proc_per_node is None:
+        args.proc_per_node = max_cpu()
+
+    elif args.proc_per_node > max_ppn:
         warnings.warn('{0} is greater than the number of available cores ({1}). Reducing to {2} (to be safe).'
                       .format(args.proc_per_node, max_ppn, max_cpu()))
         args.proc_per_node = max_cpu()
 
+    elif args.proc_per_node < 1:
+        raise ValueError('--proc-per-node must be a positive integer.')
+
     # check validity of output directory.
-    if not os.path.isdir(args.output_dir):
+    if args.output_dir and not os.path.isdir(args.output_dir):
         raise NotADirectoryError('Cannot find output directory {0} for saving output'.format(args.output_dir))
 
     # ensure that user has supplied fresh .bam/.bai files or a warm start directory.
@@ -343,6 +769,18 @@ def parse_args():
     if (args.nmf_iter < 1) or (args.iter < 1) or (args.downsample_rate < 1):
         raise ValueError('--nmf-iter, --iter, and --downsample-rate must all be >= 1.')
 
+    if args.rank_one_tol is not None and args.rank_one_tol <= 0:
+        raise ValueError('--rank-one-tol must be positive.')
+
+    if args.nmf_tol is not None and args.nmf_tol <= 0:
+        raise ValueError('--nmf-tol must be positive.')
+
+    if args.nmf_warm_start and args.nmf_tol is None:
+        raise ValueError('--nmf-warm-start requires --nmf-tol.')
+
+    if args.nmf_carry_state and args.nmf_backend != 'threads':
+        raise ValueError('--nmf-carry-state requires --nmf-backend threads.')
+
     # if --plot-genes is specified, parse input for any .txt file(s) in addition to possible cli-specified genes.
     if args.plot_genes:
         genes = list()
@@ -366,6 +804,10 @@ def parse_args():
         if not os.path.isdir(args.warm_start_dir):
             raise NotADirectoryError('Cannot find --warm-start-dir {0}'.format(args.warm_start_dir))
 
+        if args.dry_run:
+            raise ValueError('--dry-run estimates preprocessing costs from .bam files and a genome annotation, '
+                             'it cannot be used with --warm-start-dir.')
+
         # warn user if they have also supplied read alignments and/or a .gtf file, that they will
         # be ignored for the content within the warm start directory.
         if args.bam_files or args.bam_dir or args.genome_annotation:
@@ -481,4 +923,10 @@ def parse_args():
         args.bai_files = bai_files
         args.create_bai_files = create_bai_files
 
+    # resolve the genome annotation cache directory, unless caching is turned off.
+    if args.no_annotation_cache:
+        args.annotation_cache_dir = None
+    elif not args.annotation_cache_dir:
+        args.annotation_cache_dir = default_cache_dir()
+
     return args
\ No newline at end of file
@@ -1,62 +1,23 @@
-import matplotlib
-matplotlib.use('agg')
-import matplotlib.gridspec as gridspec
-from matplotlib.patches import Rectangle
-import matplotlib.pylab as plt
-import seaborn as sns
 import numpy as np
 import os
 from pandas import read_csv
-from degnorm.utils import flatten_2d
-plt.rcParams.update({'figure.max_open_warning': 0})
+from degnorm.intervals import union_intervals
 
 
-def get_exon_unions(x):
+def load_pyplot():
     """
-    Helper function to take union of intersecting exons, for visualization purposes.
-    For example, suppose we have two intersecting exons:
+    Import matplotlib (with the non-interactive 'agg' backend) and seaborn. Plotting libraries are slow to import,
+    so they are only loaded once a plot is made.
 
-    [14563, 14600]
-    [14590, 14640]
-
-    They will be reduced into a single exon:
-    [14563, 14640]
-
-    :param x: n x 2 numpy array of exon (start, end) pairs
-    :return: m x 2 numpy array of unioned exon (start, end) pairs, m <= n.
+    :return: 2-tuple of the matplotlib.pylab and seaborn modules
     """
-    if x.shape[0] == 1:
-        return x
-
-    # sort exons according to start position.
-    x = x[np.argsort(x[:, 0]), :]
-    concat_exons = list()
-
-    # determine if exons bleed into any succeeding exons.
-    # this happens if exon i's end position >= exon j's start position, j > i.
-    for i in range(x.shape[0] - 1):
-        bleeding = np.where(x[i, 1] >= x[(i + 1):, 0])[0]
-        if len(bleeding) > 0:
-            concat_exons.append([i, max(bleeding) + (i + 1)])
+    import matplotlib
+    matplotlib.use('agg')
+    import matplotlib.pylab as plt
+    import seaborn as sns
+    plt.rcParams.update({'figure.max_open_warning': 0})
 
-    if concat_exons:
-        drop_exons = np.unique(flatten_2d(concat_exons))
-        union_exons = list()
-
-        # take min(start), max(end) for exons with overlap.
-        for j in np.unique([z[1] for z in concat_exons]):
-            bleed_start = np.min(np.where([z[1] == j for z in concat_exons])[0])
-            start = x[concat_exons[bleed_start][0]][0]
-            end = x[j][1]
-            union_exons.append([start, end])
-
-        # drop old intersecting exons and stack up newly unioned exons.
-        x = np.delete(x, obj=drop_exons, axis=0)
-        x = np.vstack([x, np.vstack(union_exons)])
-        x = np.unique(x, axis=0)
-        x = x[np.argsort(x[:, 0]), :]
-
-    return x
+    return plt, sns
 
 
 def plot_gene_coverage(ke, f, x_exon, gene
@@ -89,7 +50,9 @@ def plot_gene_coverage(ke, f, x_exon, gene
         sample_ids = ['sample_{0}'.format(i + 1) for i in range(ke.shape[0])]
 
     # get union of intersecting exons to prevent confusion when plotting exon junctions.
-    x_exon = get_exon_unions(x_exon)
+    # exon (start, end) pairs are inclusive, union_intervals works with half-open intervals.
+    x_exon = union_intervals(x_exon[:, 0]
+                             , ends=x_exon[:, 1] + 1) - [0, 1]
 
     # establish exon positioning on chromosome and junction break points.
     rel_start = x_exon.min()
@@ -105,6 +68,10 @@ def plot_gene_coverage(ke, f, x_exon, gene
         end = rel_end
 
     # before/after plot consists of 4 subplots, establish them.
+    plt, sns = load_pyplot()
+    from matplotlib import gridspec
+    from matplotlib.patches import Rectangle
+
     fig = plt.figure(**kwargs)
     fig.suptitle('Gene {0} coverage -- chromosome {1}'.format(gene, chrom))
     gs = gridspec.GridSpec(2, 2,
@@ -271,6 +238,7 @@ def get_di_heatmap(data_dir, save_dir=None, figsize=[10, 8]):
                             , order=True)
 
     # make DI score heatmap.
+    plt, sns = load_pyplot()
     fig, ax = plt.subplots(1, 1, figsize=figsize)
     fig.suptitle('DI score heatmap')
 
@@ -308,6 +276,7 @@ def get_di_correlation(data_dir, save_dir=None, figsize=[8, 6]):
                             , order=True)
 
     # make DI score correlation matrix heatmap.
+    plt, sns = load_pyplot()
     fig, ax = plt.subplots(1, 1, figsize=figsize)
     fig.suptitle('DI score correlation')
 
@@ -348,6 +317,7 @@ def get_di_boxplots(data_dir, save_dir=None, figsize=[12, 8]):
                               , value_name='DI score')
 
     # make DI score boxplots
+    plt, sns = load_pyplot()
     with sns.axes_style('darkgrid'):
         fig, ax = plt.subplots(1, 1, figsize=figsize)
         fig.suptitle('DI scores')
@@ -3,8 +3,10 @@ import shutil
 import gc
 import pickle as pkl
 from numpy import intersect1d
-from pandas import read_csv
+from pandas import read_csv, concat
 from collections import OrderedDict
+from degnorm.utils import coverage_array_files, load_coverage_arrays
+from degnorm.reads_coverage_merge import load_coverage_stats, coverage_stats_from_arrays
 
 
 def load_from_previous(degnorm_dir, new_dir):
@@ -15,13 +17,15 @@ def load_from_previous(degnorm_dir, new_dir):
 
     :param degnorm_dir: str path to directory of a prior DegNorm run's output. Must contain
     gene_exon_metadata.csv and read_counts.csv files, in addition to per-chromosome
-    gene coverage matrices saved in binary pickle format.
+    gene coverage matrices saved in indexed .npy format (or binary pickle format, for older runs).
     :param new_dir: str path to new DegNorm run's output directory.
     :return: dictionary with the core data required to run the new DegNorm pipeline:
     - chrom_gene_cov_dict: 2-d dictionary {chrom: {gene: coverage matrix}}
     - read_count_df: pandas.DataFrame with chr, gene, <sample ID> fields containing per-experiment read counts
     - genes_df: pandas.DataFrame with just gene positioning within chromosomes
     - sample_ids: list of str names of sample ID's, in the same order as in read_count_df.
+    - cov_stats_df: pandas.DataFrame of per-gene coverage summary statistics, in the same gene order
+    as gene_cov_dict. See reads_coverage_merge.gene_coverage_stats.
     """
 
     if not os.path.isdir(new_dir):
@@ -54,6 +58,7 @@ def load_from_previous(degnorm_dir, new_dir):
     sample_ids = read_count_df.columns.tolist()[2:]
     chroms = genes_df.chr.unique().tolist()
     gene_cov_dict = OrderedDict()
+    stats_df_list = list()
 
     # load coverage matrices one chromosome at a time.
     for idx in range(len(chroms)):
@@ -62,24 +67,42 @@ def load_from_previous(degnorm_dir, new_dir):
         # make output sub-dir for chromosome.
         os.makedirs(os.path.join(new_dir, chrom))
 
-        # copy coverage matrices file to new output dir.
-        cov_file = os.path.join(degnorm_dir, chrom, 'coverage_matrices_{0}.pkl'.format(chrom))
-        shutil.copy(cov_file
-                    , dst=os.path.join(new_dir, chrom, 'coverage_matrices_{0}.pkl'.format(chrom)))
+        # copy coverage matrices files to new output dir, and load the coverage matrices for
+        # the genes in this chromosome. Fall back to the .pkl format of older DegNorm runs.
+        cov_stem = os.path.join(degnorm_dir, chrom, 'coverage_matrices_{0}'.format(chrom))
+        cov_files = coverage_array_files(cov_stem)
+        if os.path.isfile(cov_files[1]):
+            for cov_file in cov_files:
+                shutil.copy(cov_file
+                            , dst=os.path.join(new_dir, chrom, os.path.basename(cov_file)))
 
-        # load the coverage matrices for the genes in this chromosome.
-        with open(cov_file, 'rb') as f:
-            cov_dat = pkl.load(f)
+            cov_dat = load_coverage_arrays(cov_stem)
+            chrom_stats_df = load_coverage_stats(cov_stem
+                                                 , sample_ids=sample_ids)
+
+        else:
+            cov_file = cov_stem + '.pkl'
+            shutil.copy(cov_file
+                        , dst=os.path.join(new_dir, chrom, os.path.basename(cov_file)))
+
+            with open(cov_file, 'rb') as f:
+                cov_dat = pkl.load(f)
+
+            chrom_stats_df = coverage_stats_from_arrays(cov_dat
+                                                        , sample_ids=sample_ids)
 
         for gene in cov_dat:
             if gene in intersect_genes:
                 gene_cov_dict[gene] = cov_dat[gene]
 
+        stats_df_list.append(chrom_stats_df[chrom_stats_df.gene.isin(intersect_genes)])
+
     # free up some mem.
     del cov_dat
     gc.collect()
 
     genes = list(gene_cov_dict.keys())
+    cov_stats_df = concat(stats_df_list).reset_index(drop=True)
 
     # order read counts and genes according to order of loaded gene coverage matrices:
     # (1) set index to gene names, .loc[genes], making genes a column again by dropping index.
@@ -102,5 +125,6 @@ def load_from_previous(degnorm_dir, new_dir):
     output['read_count_df'] = read_count_df
     output['genes_df'] = genes_df
     output['sample_ids'] = sample_ids
+    output['cov_stats_df'] = cov_stats_df
 
     return output